@@ -1 +1,3 @@
-from amico import Amico
+from .amico import Amico
+from .async_amico import AsyncAmico
+from .base import RelationshipStatus
@@ -1,42 +1,123 @@
-import math
-import time
+import inspect
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
 import redis
 
+from .base import AmicoBase
+from .cache import RelationshipCache
+from .cluster import SlotPipeline, hash_tag, supports_transactions
+from .instrumentation import InstrumentedRedis, instrument
+from .memory import MemoryRedis
+from .sharding import ShardedRedis
 
-class Amico(object):
+
+class Amico(AmicoBase):
     VERSION = '1.0.1'
 
-    DEFAULTS = {
-        'namespace': 'amico',
-        'following_key': 'following',
-        'followers_key': 'followers',
-        'blocked_key': 'blocked',
-        'blocked_by_key': 'blocked_by',
-        'reciprocated_key': 'reciprocated',
-        'pending_key': 'pending',
-        'pending_with_key': 'pending_with',
-        'pending_follow': False,
-        'default_scope_key': 'default',
-        'page_size': 25
-    }
-
-    def __init__(self, options=DEFAULTS, redis_connection=None):
+    def __init__(self, options=AmicoBase.DEFAULTS, redis_connection=None):
         '''
         Initialize a new class for establishing relationships.
 
         @param options [dictionary] (Default: Amico.DEFAULTS)
-        @param redis_connection [redis] (Default: None) Redis connection
+        @param redis_connection [redis] (Default: None) Redis connection, or a list of connections to shard relationships over
         '''
-        self.options = Amico.DEFAULTS.copy()
-        self.options.update(options)
         if redis_connection is None:
-            self.redis_connection = redis.StrictRedis(
-                host='localhost',
-                port=6379,
-                db=0)
-        else:
-            self.redis_connection = redis_connection
+            redis_connection = redis.StrictRedis(
+                connection_pool=redis.BlockingConnectionPool(
+                    host='localhost',
+                    port=6379,
+                    db=0))
+        elif isinstance(redis_connection, (list, tuple)):
+            redis_connection = ShardedRedis(redis_connection)
+
+        super(Amico, self).__init__(options, redis_connection)
+
+        self.__executor = None
+        self.__cluster_transactions = False
+        if self.options['cluster']:
+            self.__executor = ThreadPoolExecutor()
+            # redis-py releases before 6.1.0 cannot run cluster pipelines in transactions.
+            self.__cluster_transactions = supports_transactions(self.redis_connection)
+        if self._partitioned:
+            if self.legacy_key_schema is not None:
+                raise Exception(
+                    'The cluster option and sharding do not support the legacy_keys option')
+            if self.options['cache_size'] > 0:
+                raise Exception(
+                    'The cluster option and sharding do not support the cache_size option')
+
+        if isinstance(self.redis_connection, MemoryRedis) and self.options['cache_size'] > 0:
+            raise Exception('The in-memory backend does not support the cache_size option')
+
+        if self.options['instrumentation'] is not None:
+            self.__instrument()
+
+        self.cache = None
+        self.__caching = False
+        if self.options['cache_size'] > 0:
+            self.cache = RelationshipCache(self.options['cache_size'])
+            self.__start_invalidation_listener()
+
+        self.__write_buffer = OrderedDict()
+        self.__write_buffer_lock = threading.Lock()
+        self.__flush_lock = threading.RLock()
+        self.__flush_thread = None
+        if self.options['write_buffer_size'] > 0:
+            self.__start_flush_thread()
+
+    def flush(self):
+        '''
+        Write the follow and unfollow relationships buffered with the write_buffer_size option.
+        Opposite operations on the same relationship were collapsed into the last one. Every
+        buffered relationship is written in one pipeline of script calls (or with the writes of
+        follow_many and unfollow_many if use_scripts is disabled). Writes buffered while flushing
+        are left for the next flush, so they are applied after the ones being flushed. If writing
+        fails, the relationships are buffered again, unless they have been changed since, and the
+        error is raised.
+        '''
+        if not self.__write_buffer:
+            return
+
+        with self.__flush_lock:
+            with self.__write_buffer_lock:
+                writes, self.__write_buffer = self.__write_buffer, OrderedDict()
+            try:
+                self.__write_buffered(writes)
+            except Exception:
+                with self.__write_buffer_lock:
+                    for edge, operation in writes.items():
+                        self.__write_buffer.setdefault(edge, operation)
+                raise
+
+    def close(self):
+        '''
+        Flush the buffered writes and stop flushing them periodically, stop listening for cache
+        invalidations and close the connections used for it, and stop the threads running
+        per-slot (or per-node) pipelines.
+        '''
+        if self.__flush_thread is not None:
+            self.__flushing.set()
+            self.__flush_thread.join()
+            self.__flush_thread = None
+        self.flush()
+
+        if self.__executor is not None:
+            self.__executor.shutdown()
+            self.__executor = None
+
+        if isinstance(self.redis_connection, ShardedRedis):
+            self.redis_connection.close()
+
+        if self.cache is None:
+            return
+
+        self.__caching = False
+        self.__tracking_connection.disconnect()
+        self.__invalidation_connection.disconnect()
+        self.__invalidation_thread.join(1)
+        self.cache.clear()
 
     def follow(self, from_id, to_id, scope=None):
         '''
@@ -44,33 +125,39 @@ class Amico(object):
         relationship, it checks to see if the relationship is reciprocated and establishes that
         relationship if so.
 
+        Guarantee: the same as #follow_many. With the write_buffer_size option, the follow is
+        buffered and written by a later flush.
+
         @param from_id [String] The ID of the individual establishing the follow relationship.
         @param to_id [String] The ID of the individual to be followed.
         @param scope [String] Scope for the call.
         '''
-        if scope is None:
-            scope = self.options['default_scope_key']
-
-        if from_id == to_id:
-            return
-        if self.is_blocked(to_id, from_id, scope):
-            return
-        if self.options['pending_follow'] and self.is_pending(from_id, to_id, scope):
+        if self.options['write_buffer_size'] > 0:
+            self.__buffer_write('follow', from_id, to_id, scope)
             return
 
-        if self.options['pending_follow']:
-            transaction = self.redis_connection.pipeline()
-            transaction.zadd(
-                '%s:%s:%s:%s' %
-                (self.options['namespace'], self.options['pending_key'], scope, to_id), int(
-                    time.time()), from_id)
-            transaction.zadd(
-                '%s:%s:%s:%s' %
-                (self.options['namespace'], self.options['pending_with_key'], scope, from_id), int(
-                    time.time()), to_id)
-            transaction.execute()
-        else:
-            self.__add_following_followers_reciprocated(from_id, to_id, scope)
+        self.follow_many(from_id, [to_id], scope)
+
+    def follow_many(self, from_id, to_ids, scope=None):
+        '''
+        Establish follow relationships between one ID and many others. The block and
+        pending checks, the writes and the reciprocation checks for the whole batch are
+        made in a fixed number of round trips.
+
+        Guarantee: with use_scripts, the whole batch is applied atomically. Otherwise, the
+        following and followers writes and the reciprocation checks are always made in one
+        transaction, so a mutual follow is never missed. The block checks and the pending and
+        reciprocated writes only use a transaction if the transactions option is set. With the
+        cluster option or sharding, scripts are not used and transactions only cover the sets
+        of one individual (one slot or node).
+
+        @param from_id [String] The ID of the individual establishing the follow relationships.
+        @param to_ids [list] IDs of the individuals to be followed.
+        @param scope [String] Scope for the call.
+        @return a dictionary of to_id to outcome, one of 'followed', 'blocked', 'pending' or 'self'.
+        '''
+        self.flush()
+        return self.__follow_many(from_id, to_ids, scope)
 
     def unfollow(self, from_id, to_id, scope=None):
         '''
@@ -78,270 +165,210 @@ class Amico(object):
         relationship, if a reciprocated relationship was established, it is
         also removed.
 
+        Guarantee: the same as #unfollow_many. With the write_buffer_size option, the unfollow
+        is buffered and written by a later flush.
+
         @param from_id [String] The ID of the individual removing the follow relationship.
         @param to_id [String] The ID of the individual to be unfollowed.
         @param scope [String] Scope for the call.
         '''
-        if scope is None:
-            scope = self.options['default_scope_key']
-
-        if from_id == to_id:
+        if self.options['write_buffer_size'] > 0:
+            self.__buffer_write('unfollow', from_id, to_id, scope)
             return
 
-        transaction = self.redis_connection.pipeline()
-        transaction.zrem(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['following_key'],
-             scope,
-             from_id),
-            to_id)
-        transaction.zrem(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['followers_key'],
-             scope,
-             to_id),
-            from_id)
-        transaction.zrem(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['reciprocated_key'],
-             scope,
-             from_id),
-            to_id)
-        transaction.zrem(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['reciprocated_key'],
-             scope,
-             to_id),
-            from_id)
-        transaction.zrem(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['pending_key'],
-             scope,
-             to_id),
-            from_id)
-        transaction.zrem(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['pending_with_key'],
-             scope,
-             from_id),
-            to_id)
-        transaction.execute()
+        self.unfollow_many(from_id, [to_id], scope)
+
+    def unfollow_many(self, from_id, to_ids, scope=None):
+        '''
+        Remove follow relationships between one ID and many others in a single round trip.
+        Reciprocated and pending relationships with each of the IDs are also removed.
+
+        Guarantee: on a single node, atomic with use_scripts or the transactions option
+        (with the cluster option or sharding, only per individual). Otherwise, the
+        removals are idempotent and sent in order, but other clients may see some of them
+        before the others.
+
+        @param from_id [String] The ID of the individual removing the follow relationships.
+        @param to_ids [list] IDs of the individuals to be unfollowed.
+        @param scope [String] Scope for the call.
+        @return a dictionary of to_id to outcome, one of 'unfollowed' or 'self'.
+        '''
+        self.flush()
+        return self.__unfollow_many(from_id, to_ids, scope)
 
     def block(self, from_id, to_id, scope=None):
         '''
         Block a relationship between two IDs. This method also has the side effect
         of removing any follower or following relationship between the two IDs.
 
+        Guarantee: on a single node, always atomic, so no relationship between the two IDs
+        is visible once the block is. With the cluster option or sharding, each individual's
+        sets are updated in their own transaction on their own slot or node, so the two
+        individuals' changes are not applied atomically with respect to each other.
+
         @param from_id [String] The ID of the individual blocking the relationship.
         @param to_id [String] The ID of the individual being blocked.
         @param scope [String] Scope for the call.
         '''
+        self.flush()
+
         if scope is None:
             scope = self.options['default_scope_key']
 
         if from_id == to_id:
             return
 
-        transaction = self.redis_connection.pipeline()
-        transaction.zrem(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['following_key'],
-             scope,
-             from_id),
-            to_id)
-        transaction.zrem(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['following_key'],
-             scope,
-             to_id),
-            from_id)
-        transaction.zrem(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['followers_key'],
-             scope,
-             to_id),
-            from_id)
-        transaction.zrem(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['followers_key'],
-             scope,
-             from_id),
-            to_id)
-        transaction.zrem(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['reciprocated_key'],
-             scope,
-             from_id),
-            to_id)
-        transaction.zrem(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['reciprocated_key'],
-             scope,
-             to_id),
-            from_id)
-        transaction.zrem(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['pending_key'],
-             scope,
-             from_id),
-            to_id)
-        transaction.zrem(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['pending_with_key'],
-             scope,
-             to_id),
-            from_id)
-        transaction.zadd(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'], self.options['blocked_key'], scope, from_id), int(
-                time.time()), to_id)
-        transaction.zadd(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'], self.options['blocked_by_key'], scope, to_id), int(
-                time.time()), from_id)
+        keys = self._relationship_keys(from_id, [to_id], scope)
+        self.__migrate(keys)
+
+        if self.options['use_scripts']:
+            self._block_script(
+                **self._script_keys_and_args(from_id, [to_id], scope))
+            self.__invalidate(keys)
+            return
+
+        transaction = self.__pipeline(transaction=True)
+        self._queue_block(transaction, from_id, to_id, scope)
         transaction.execute()
+        self.__invalidate(keys)
 
     def unblock(self, from_id, to_id, scope=None):
         '''
         Unblock a relationship between two IDs.
 
+        Guarantee: on a single node, atomic with use_scripts or the transactions option
+        (with the cluster option or sharding, only per individual). Otherwise, the
+        two removals are idempotent and sent in order.
+
         @param from_id [String] The ID of the individual unblocking the relationship.
         @param to_id [String] The ID of the blocked individual.
         @param scope [String] Scope for the call.
         '''
+        self.flush()
+
         if scope is None:
             scope = self.options['default_scope_key']
 
         if from_id == to_id:
             return
 
-        transaction = self.redis_connection.pipeline()
-        transaction.zrem(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['blocked_key'],
-             scope,
-             from_id),
-            to_id)
-        transaction.zrem(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['blocked_by_key'],
-             scope,
-             to_id),
-            from_id)
+        keys = self._relationship_keys(from_id, [to_id], scope)
+        self.__migrate(keys)
+
+        if self.options['use_scripts']:
+            self._unblock_script(
+                **self._script_keys_and_args(from_id, [to_id], scope))
+            self.__invalidate(keys)
+            return
+
+        transaction = self.__pipeline()
+        self._queue_unblock(transaction, from_id, to_id, scope)
         transaction.execute()
+        self.__invalidate(keys)
 
     def accept(self, from_id, to_id, scope=None):
         '''
         Accept a relationship that is pending between two IDs.
 
+        Guarantee: the same as #follow_many.
+
         @param from_id [String] The ID of the individual accepting the relationship.
         @param to_id [String] The ID of the individual to be accepted.
         @param scope [String] Scope for the call.
         '''
+        self.flush()
+
         if scope is None:
             scope = self.options['default_scope_key']
 
         if from_id == to_id:
             return
 
-        self.__add_following_followers_reciprocated(from_id, to_id, scope)
+        keys = self._relationship_keys(from_id, [to_id], scope)
+        self.__migrate(keys)
+
+        self.__add_following_followers_reciprocated(from_id, [to_id], scope)
+        self.__invalidate(keys)
 
     def deny(self, from_id, to_id, scope=None):
         '''
         Deny a relationship that is pending between two IDs.
 
+        Guarantee: on a single node, atomic with use_scripts or the transactions option
+        (with the cluster option or sharding, only per individual). Otherwise, the
+        two removals are idempotent and sent in order.
+
         @param from_id [String] The ID of the individual denying the relationship.
         @param to_id [String] The ID of the individual to be denied.
         @param scope [String] Scope for the call.
         '''
+        self.flush()
+
         if scope is None:
             scope = self.options['default_scope_key']
 
         if from_id == to_id:
             return
 
-        transaction = self.redis_connection.pipeline()
-        transaction.zrem(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['pending_key'],
-             scope,
-             to_id),
-            from_id)
-        transaction.zrem(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['pending_with_key'],
-             scope,
-             from_id),
-            to_id)
+        keys = self._relationship_keys(from_id, [to_id], scope)
+        self.__migrate(keys)
+
+        if self.options['use_scripts']:
+            self._deny_script(
+                **self._script_keys_and_args(from_id, [to_id], scope))
+            self.__invalidate(keys)
+            return
+
+        transaction = self.__pipeline()
+        self._queue_deny(transaction, from_id, to_id, scope)
         transaction.execute()
+        self.__invalidate(keys)
 
-    def clear(self, id, scope=None):
+    def clear(self, id, scope=None, chunk_size=None):
         '''
         Clears all relationships (in either direction) stored for an individual.
         Helpful to prevent orphaned associations when deleting users.
 
         @param id [String] ID of the individual to clear info for.
         @param scope [String] Scope for the call.
+        @param chunk_size [int] Number of relationships to remove per round trip (default: Amico.DEFAULTS['chunk_size']).
+        '''
+        cursor = self.clear_chunk(id, 0, chunk_size, scope)
+        while cursor != 0:
+            cursor = self.clear_chunk(id, cursor, chunk_size, scope)
+
+    def clear_chunk(self, id, cursor=0, chunk_size=None, scope=None):
+        '''
+        Clear one chunk of the relationships stored for an individual. Start with a
+        cursor of 0 and call again with the returned cursor until it is 0. Each chunk
+        removes the related edges and the source entries in one transaction, so an
+        interrupted clear never leaves orphaned edges and can be resumed with the last
+        cursor (or restarted from 0). This holds regardless of the transactions option.
+
+        @param id [String] ID of the individual to clear info for.
+        @param cursor [int] Cursor returned from the previous call, or 0 to start.
+        @param chunk_size [int] Number of relationships to remove (default: Amico.DEFAULTS['chunk_size']).
+        @param scope [String] Scope for the call.
+        @return the cursor for the next call, or 0 if all relationships have been cleared.
         '''
+        self.flush()
+
         if scope is None:
             scope = self.options['default_scope_key']
 
-        # no longer following (or followed by) anyone
-        self.__clear_bidirectional_sets_for_id(
-            id,
-            self.options['following_key'],
-            self.options['followers_key'],
-            scope)
-        self.__clear_bidirectional_sets_for_id(
-            id,
-            self.options['followers_key'],
-            self.options['following_key'],
-            scope)
-        self.__clear_bidirectional_sets_for_id(
-            id,
-            self.options['reciprocated_key'],
-            self.options['reciprocated_key'],
-            scope)
-        # no longer blocked by (or blocking) anyone
-        self.__clear_bidirectional_sets_for_id(
-            id,
-            self.options['blocked_by_key'],
-            self.options['blocked_key'],
-            scope)
-        self.__clear_bidirectional_sets_for_id(
-            id,
-            self.options['blocked_key'],
-            self.options['blocked_by_key'],
-            scope)
-        # no longer pending with anyone (or have any pending followers)
-        self.__clear_bidirectional_sets_for_id(
-            id,
-            self.options['pending_with_key'],
-            self.options['pending_key'],
-            scope)
-        self.__clear_bidirectional_sets_for_id(
-            id,
-            self.options['pending_key'],
-            self.options['pending_with_key'],
-            scope)
+        if chunk_size is None:
+            chunk_size = self.options['chunk_size']
+
+        self.__migrate(self._relationship_keys(id, [], scope))
+        for index in range(max(cursor - 1, 0), len(self.CLEAR_RELATIONSHIPS)):
+            source_type, related_type = self.CLEAR_RELATIONSHIPS[index]
+            if source_type == 'reciprocated' and self.options['lazy_reciprocated']:
+                continue
+            if self.__clear_bidirectional_sets_for_id(
+                    id, source_type, related_type, scope, chunk_size):
+                return index + 1
+
+        return 0
 
     def is_blocked(self, id, blocked_id, scope=None):
         '''
@@ -354,13 +381,8 @@ class Amico(object):
         if scope is None:
             scope = self.options['default_scope_key']
 
-        return self.redis_connection.zscore(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['blocked_key'],
-             scope,
-             id),
-            blocked_id) is not None
+        return self.__is_member(
+            self._key('blocked', scope, id), blocked_id, scope)
 
     def is_blocked_by(self, id, blocked_by_id, scope=None):
         '''
@@ -373,13 +395,8 @@ class Amico(object):
         if scope is None:
             scope = self.options['default_scope_key']
 
-        return self.redis_connection.zscore(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['blocked_by_key'],
-             scope,
-             id),
-            blocked_by_id) is not None
+        return self.__is_member(
+            self._key('blocked_by', scope, id), blocked_by_id, scope)
 
     def is_follower(self, id, follower_id, scope=None):
         '''
@@ -392,13 +409,8 @@ class Amico(object):
         if scope is None:
             scope = self.options['default_scope_key']
 
-        return self.redis_connection.zscore(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['followers_key'],
-             scope,
-             id),
-            follower_id) is not None
+        return self.__is_member(
+            self._key('followers', scope, id), follower_id, scope)
 
     def is_following(self, id, following_id, scope=None):
         '''
@@ -411,13 +423,8 @@ class Amico(object):
         if scope is None:
             scope = self.options['default_scope_key']
 
-        return self.redis_connection.zscore(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['following_key'],
-             scope,
-             id),
-            following_id) is not None
+        return self.__is_member(
+            self._key('following', scope, id), following_id, scope)
 
     def is_reciprocated(self, from_id, to_id, scope=None):
         '''
@@ -449,13 +456,8 @@ class Amico(object):
         if scope is None:
             scope = self.options['default_scope_key']
 
-        return self.redis_connection.zscore(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['pending_key'],
-             scope,
-             to_id),
-            from_id) is not None
+        return self.__is_member(
+            self._key('pending', scope, to_id), from_id, scope)
 
     def is_pending_with(self, from_id, to_id, scope=None):
         '''
@@ -468,13 +470,124 @@ class Amico(object):
         if scope is None:
             scope = self.options['default_scope_key']
 
-        return self.redis_connection.zscore(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['pending_with_key'],
-             scope,
-             to_id),
-            from_id) is not None
+        return self.__is_member(
+            self._key('pending_with', scope, to_id), from_id, scope)
+
+    def is_blocked_many(self, id, blocked_ids, scope=None):
+        '''
+        Check to see if one individual has blocked each of a list of individuals.
+
+        @param id [String] ID of the individual checking the blocked status.
+        @param blocked_ids [list] IDs of the individuals to see if they are blocked by id.
+        @param scope [String] Scope for the call.
+        @return a list of booleans, one per ID in blocked_ids.
+        '''
+        return self.__are_members('blocked', id, blocked_ids, scope)
+
+    def is_blocked_by_many(self, id, blocked_by_ids, scope=None):
+        '''
+        Check to see if one individual is blocked by each of a list of individuals.
+
+        @param id [String] ID of the individual checking the blocked by status.
+        @param blocked_by_ids [list] IDs of the individuals to see if they have blocked id.
+        @param scope [String] Scope for the call.
+        @return a list of booleans, one per ID in blocked_by_ids.
+        '''
+        return self.__are_members('blocked_by', id, blocked_by_ids, scope)
+
+    def is_follower_many(self, id, follower_ids, scope=None):
+        '''
+        Check to see if each of a list of individuals is a follower of another individual.
+
+        @param id [String] ID of the individual checking the follower status.
+        @param follower_ids [list] IDs of the individuals to see if they are following id.
+        @param scope [String] Scope for the call.
+        @return a list of booleans, one per ID in follower_ids.
+        '''
+        return self.__are_members('followers', id, follower_ids, scope)
+
+    def is_following_many(self, id, following_ids, scope=None):
+        '''
+        Check to see if one individual is following each of a list of individuals.
+
+        @param id [String] ID of the individual checking the following status.
+        @param following_ids [list] IDs of the individuals to see if they are being followed by id.
+        @param scope [String] Scope for the call.
+        @return a list of booleans, one per ID in following_ids.
+        '''
+        return self.__are_members('following', id, following_ids, scope)
+
+    def is_reciprocated_many(self, from_id, to_ids, scope=None):
+        '''
+        Check to see if each of a list of individuals has reciprocated a follow with another individual.
+
+        @param from_id [String] ID of the individual checking the reciprocated relationships.
+        @param to_ids [list] IDs of the individuals to see if they are following (and followed by) from_id.
+        @param scope [String] Scope for the call.
+        @return a list of booleans, one per ID in to_ids.
+        '''
+        if scope is None:
+            scope = self.options['default_scope_key']
+
+        following, followers = self.__scores(
+            [self._key('following', scope, from_id),
+             self._key('followers', scope, from_id)],
+            to_ids,
+            scope)
+        return [
+            following_score is not None and follower_score is not None
+            for following_score, follower_score in zip(following, followers)]
+
+    def is_pending_many(self, from_id, to_ids, scope=None):
+        '''
+        Check to see if one individual has a pending relationship in following each of a list of individuals.
+        This reads from_id's pending_with set, which holds the same relationships as the pending sets of to_ids.
+
+        @param from_id [String] ID of the individual checking the pending relationships.
+        @param to_ids [list] IDs of the individuals to see if they are pending a follow from from_id.
+        @param scope [String] Scope for the call.
+        @return a list of booleans, one per ID in to_ids.
+        '''
+        return self.__are_members('pending_with', from_id, to_ids, scope)
+
+    def is_pending_with_many(self, from_id, to_ids, scope=None):
+        '''
+        Check to see if each of a list of individuals has a pending relationship with another.
+        This reads from_id's pending set, which holds the same relationships as the pending_with sets of to_ids.
+
+        @param from_id [String] ID of the individual checking the pending relationships.
+        @param to_ids [list] IDs of the individuals to see if they are pending an approval from from_id.
+        @param scope [String] Scope for the call.
+        @return a list of booleans, one per ID in to_ids.
+        '''
+        return self.__are_members('pending', from_id, to_ids, scope)
+
+    def relationship_status(self, from_id, to_id, scope=None):
+        '''
+        Retrieve every relationship flag between two individuals in one round trip.
+
+        @param from_id [String] ID of the individual viewing the relationship.
+        @param to_id [String] ID of the other individual.
+        @param scope [String] Scope for the call.
+        @return a RelationshipStatus whose flags match is_following(from_id, to_id), is_follower(from_id, to_id),
+          is_reciprocated, is_blocked, is_blocked_by, is_pending and is_pending_with for the two IDs.
+        '''
+        return self.relationship_statuses(from_id, [to_id], scope)[0]
+
+    def relationship_statuses(self, from_id, to_ids, scope=None):
+        '''
+        Retrieve every relationship flag between one individual and many others in one round trip.
+
+        @param from_id [String] ID of the individual viewing the relationships.
+        @param to_ids [list] IDs of the other individuals.
+        @param scope [String] Scope for the call.
+        @return a list of RelationshipStatus, one per ID in to_ids.
+        '''
+        if scope is None:
+            scope = self.options['default_scope_key']
+
+        return self._relationship_statuses(
+            self.__scores(self._status_keys(from_id, scope), to_ids, scope))
 
     def following_count(self, id, scope=None):
         '''
@@ -486,12 +599,7 @@ class Amico(object):
         if scope is None:
             scope = self.options['default_scope_key']
 
-        return self.redis_connection.zcard(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['following_key'],
-             scope,
-             id))
+        return self.__count(self._key('following', scope, id), scope)
 
     def followers_count(self, id, scope=None):
         '''
@@ -503,12 +611,7 @@ class Amico(object):
         if scope is None:
             scope = self.options['default_scope_key']
 
-        return self.redis_connection.zcard(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['followers_key'],
-             scope,
-             id))
+        return self.__count(self._key('followers', scope, id), scope)
 
     def blocked_count(self, id, scope=None):
         '''
@@ -520,12 +623,7 @@ class Amico(object):
         if scope is None:
             scope = self.options['default_scope_key']
 
-        return self.redis_connection.zcard(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['blocked_key'],
-             scope,
-             id))
+        return self.__count(self._key('blocked', scope, id), scope)
 
     def blocked_by_count(self, id, scope=None):
         '''
@@ -537,12 +635,7 @@ class Amico(object):
         if scope is None:
             scope = self.options['default_scope_key']
 
-        return self.redis_connection.zcard(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['blocked_by_key'],
-             scope,
-             id))
+        return self.__count(self._key('blocked_by', scope, id), scope)
 
     def reciprocated_count(self, id, scope=None):
         '''
@@ -554,12 +647,10 @@ class Amico(object):
         if scope is None:
             scope = self.options['default_scope_key']
 
-        return self.redis_connection.zcard(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['reciprocated_key'],
-             scope,
-             id))
+        if self.options['lazy_reciprocated']:
+            return self.__reciprocated_count(id, scope)
+
+        return self.__count(self._key('reciprocated', scope, id), scope)
 
     def pending_count(self, id, scope=None):
         '''
@@ -571,12 +662,7 @@ class Amico(object):
         if scope is None:
             scope = self.options['default_scope_key']
 
-        return self.redis_connection.zcard(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['pending_key'],
-             scope,
-             id))
+        return self.__count(self._key('pending', scope, id), scope)
 
     def pending_with_count(self, id, scope=None):
         '''
@@ -588,12 +674,7 @@ class Amico(object):
         if scope is None:
             scope = self.options['default_scope_key']
 
-        return self.redis_connection.zcard(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['pending_with_key'],
-             scope,
-             id))
+        return self.__count(self._key('pending_with', scope, id), scope)
 
     def following(self, id, page_options=None, scope=None):
         '''
@@ -607,15 +688,10 @@ class Amico(object):
             scope = self.options['default_scope_key']
 
         if page_options is None:
-            page_options = self.__default_paging_options()
+            page_options = self._default_paging_options()
 
         return self.__members(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['following_key'],
-             scope,
-             id),
-            page_options)
+            self._key('following', scope, id), page_options, scope)
 
     def followers(self, id, page_options=None, scope=None):
         '''
@@ -629,15 +705,10 @@ class Amico(object):
             scope = self.options['default_scope_key']
 
         if page_options is None:
-            page_options = self.__default_paging_options()
+            page_options = self._default_paging_options()
 
         return self.__members(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['followers_key'],
-             scope,
-             id),
-            page_options)
+            self._key('followers', scope, id), page_options, scope)
 
     def blocked(self, id, page_options=None, scope=None):
         '''
@@ -651,15 +722,10 @@ class Amico(object):
             scope = self.options['default_scope_key']
 
         if page_options is None:
-            page_options = self.__default_paging_options()
+            page_options = self._default_paging_options()
 
         return self.__members(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['blocked_key'],
-             scope,
-             id),
-            page_options)
+            self._key('blocked', scope, id), page_options, scope)
 
     def blocked_by(self, id, page_options=None, scope=None):
         '''
@@ -673,15 +739,10 @@ class Amico(object):
             scope = self.options['default_scope_key']
 
         if page_options is None:
-            page_options = self.__default_paging_options()
+            page_options = self._default_paging_options()
 
         return self.__members(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['blocked_by_key'],
-             scope,
-             id),
-            page_options)
+            self._key('blocked_by', scope, id), page_options, scope)
 
     def reciprocated(self, id, page_options=None, scope=None):
         '''
@@ -695,15 +756,17 @@ class Amico(object):
             scope = self.options['default_scope_key']
 
         if page_options is None:
-            page_options = self.__default_paging_options()
+            page_options = self._default_paging_options()
+
+        if self.options['lazy_reciprocated']:
+            if 'cursor' in page_options:
+                raise Exception(
+                    'Cursor paging is not supported with the lazy_reciprocated option')
+            return self.__intersection(
+                self._reciprocated_keys(id, scope), page_options, scope, 'MAX')[0]
 
         return self.__members(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['reciprocated_key'],
-             scope,
-             id),
-            page_options)
+            self._key('reciprocated', scope, id), page_options, scope)
 
     def pending(self, id, page_options=None, scope=None):
         '''
@@ -717,15 +780,10 @@ class Amico(object):
             scope = self.options['default_scope_key']
 
         if page_options is None:
-            page_options = self.__default_paging_options()
+            page_options = self._default_paging_options()
 
         return self.__members(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['pending_key'],
-             scope,
-             id),
-            page_options)
+            self._key('pending', scope, id), page_options, scope)
 
     def pending_with(self, id, page_options=None, scope=None):
         '''
@@ -739,15 +797,10 @@ class Amico(object):
             scope = self.options['default_scope_key']
 
         if page_options is None:
-            page_options = self.__default_paging_options()
+            page_options = self._default_paging_options()
 
         return self.__members(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['pending_with_key'],
-             scope,
-             id),
-            page_options)
+            self._key('pending_with', scope, id), page_options, scope)
 
     def following_page_count(self, id, page_size=None, scope=None):
         '''
@@ -764,12 +817,7 @@ class Amico(object):
             page_size = self.DEFAULTS['page_size']
 
         return self.__total_pages(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['following_key'],
-             scope,
-             id),
-            page_size)
+            self._key('following', scope, id), page_size, scope)
 
     def followers_page_count(self, id, page_size=None, scope=None):
         '''
@@ -786,12 +834,7 @@ class Amico(object):
             page_size = self.DEFAULTS['page_size']
 
         return self.__total_pages(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['followers_key'],
-             scope,
-             id),
-            page_size)
+            self._key('followers', scope, id), page_size, scope)
 
     def blocked_page_count(self, id, page_size=None, scope=None):
         '''
@@ -808,12 +851,7 @@ class Amico(object):
             page_size = self.DEFAULTS['page_size']
 
         return self.__total_pages(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['blocked_key'],
-             scope,
-             id),
-            page_size)
+            self._key('blocked', scope, id), page_size, scope)
 
     def blocked_by_page_count(self, id, page_size=None, scope=None):
         '''
@@ -830,12 +868,7 @@ class Amico(object):
             page_size = self.DEFAULTS['page_size']
 
         return self.__total_pages(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['blocked_by_key'],
-             scope,
-             id),
-            page_size)
+            self._key('blocked_by', scope, id), page_size, scope)
 
     def reciprocated_page_count(self, id, page_size=None, scope=None):
         '''
@@ -851,13 +884,12 @@ class Amico(object):
         if page_size is None:
             page_size = self.DEFAULTS['page_size']
 
+        if self.options['lazy_reciprocated']:
+            return self._total_pages_for(
+                self.__reciprocated_count(id, scope), page_size)
+
         return self.__total_pages(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['reciprocated_key'],
-             scope,
-             id),
-            page_size)
+            self._key('reciprocated', scope, id), page_size, scope)
 
     def pending_page_count(self, id, page_size=None, scope=None):
         '''
@@ -874,12 +906,7 @@ class Amico(object):
             page_size = self.DEFAULTS['page_size']
 
         return self.__total_pages(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['pending_key'],
-             scope,
-             id),
-            page_size)
+            self._key('pending', scope, id), page_size, scope)
 
     def pending_with_page_count(self, id, page_size=None, scope=None):
         '''
@@ -896,12 +923,7 @@ class Amico(object):
             page_size = self.DEFAULTS['page_size']
 
         return self.__total_pages(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'],
-             self.options['pending_with_key'],
-             scope,
-             id),
-            page_size)
+            self._key('pending_with', scope, id), page_size, scope)
 
     def all(self, id, type, scope=None):
         '''
@@ -914,7 +936,7 @@ class Amico(object):
         if scope is None:
             scope = self.options['default_scope_key']
 
-        self.__validate_relationship_type(type)
+        self._validate_relationship_type(type)
         count = getattr(self, '%s_count' % type)(id, scope)
         if count > 0:
             return getattr(
@@ -925,6 +947,52 @@ class Amico(object):
         else:
             return []
 
+    def iter_all(self, id, type, scope=None, chunk_size=None):
+        '''
+        Iterate over all of the individuals for a given id, type (e.g. following) and scope, in the
+        same order as #all, retrieving chunk_size individuals per round trip. Chunks are retrieved
+        with a cursor, so no individual is repeated or skipped if relationships change while iterating.
+        Scopes stored in Redis sets are iterated with SSCAN, in no particular order. Reciprocated
+        relationships derived with the lazy_reciprocated option are iterated page by page instead.
+
+        @param id [String] ID of the individual.
+        @param type [String] One of 'following', 'followers', 'reciprocated', 'blocked', 'blocked_by', 'pending', 'pending_with'.
+        @param scope [String] Scope for the call.
+        @param chunk_size [int] Number of individuals to retrieve per round trip (default: Amico.DEFAULTS['chunk_size']).
+        @return a generator of the individuals.
+        '''
+        if scope is None:
+            scope = self.options['default_scope_key']
+
+        if chunk_size is None:
+            chunk_size = self.options['chunk_size']
+
+        self._validate_relationship_type(type)
+        if type == 'reciprocated' and self.options['lazy_reciprocated']:
+            page_options = {'page_size': chunk_size, 'page': 1}
+            while True:
+                members, count = self.__intersection(
+                    self._reciprocated_keys(id, scope), page_options, scope, 'MAX')
+                for member in members:
+                    yield member
+                if page_options['page'] * chunk_size >= count:
+                    break
+                page_options['page'] += 1
+            return
+
+        key = self._key(type, scope, id)
+        if self._uses_sets(scope):
+            for member in self.__scan_members(key, chunk_size):
+                yield member
+            return
+
+        page_options = {'page_size': chunk_size, 'cursor': None}
+        while True:
+            for member in self.__members_after(key, page_options, scope):
+                yield member
+            if page_options['cursor'] is None:
+                break
+
     def count(self, id, type, scope=None):
         '''
         Retrieve a count of all of a given type of relationship for the specified id.
@@ -936,9 +1004,57 @@ class Amico(object):
         if scope is None:
             scope = self.options['default_scope_key']
 
-        self.__validate_relationship_type(type)
+        self._validate_relationship_type(type)
         return getattr(self, '%s_count' % type)(id, scope)
 
+    def counts(self, ids, types=None, scope=None):
+        '''
+        Retrieve counts of many types of relationship for many individuals in one round trip.
+
+        @param ids [list] IDs of the individuals.
+        @param types [list] Types of relationship to count (default: Amico.VALID_RELATIONSHIPS).
+        @param scope [String] Scope for the call.
+        @return a dictionary of ID to a dictionary of type to count.
+        '''
+        if scope is None:
+            scope = self.options['default_scope_key']
+
+        if types is None:
+            types = self.VALID_RELATIONSHIPS
+
+        for type in types:
+            self._validate_relationship_type(type)
+
+        transaction = self.__pipeline()
+        for id in ids:
+            for type in types:
+                self._queue_count(
+                    transaction, self._key(type, scope, id), scope)
+        results = transaction.execute()
+
+        if self.legacy_key_schema is not None:
+            keys = [self._key(type, scope, id) for id in ids for type in types]
+            missing = [index for index, count in enumerate(results) if count == 0]
+            transaction = self.__pipeline()
+            for index in missing:
+                self._queue_count(
+                    transaction, self._legacy_key(keys[index]), scope)
+            for index, count in zip(missing, transaction.execute()):
+                results[index] = count
+
+        if 'reciprocated' in types and self.options['lazy_reciprocated']:
+            position = types.index('reciprocated')
+            reciprocated_counts = self.__intersection_counts(
+                [self._reciprocated_keys(id, scope) for id in ids])
+            for index, count in enumerate(reciprocated_counts):
+                results[index * len(types) + position] = count
+
+        results = iter(results)
+        counts = {}
+        for id in ids:
+            counts[id] = dict((type, next(results)) for type in types)
+        return counts
+
     def page_count(self, id, type, page_size=None, scope=None):
         '''
         Retrieve a page count of a given type of relationship for the specified id.
@@ -954,167 +1070,1189 @@ class Amico(object):
         if scope is None:
             scope = self.options['default_scope_key']
 
-        self.__validate_relationship_type(type)
+        self._validate_relationship_type(type)
         return getattr(self, '%s_page_count' % type)(id, page_size, scope)
 
+    def page(self, id, type, page_options=None, scope=None):
+        '''
+        Retrieve a page of a given type of relationship for the specified id, along with the
+        totals needed to draw paging controls, in one round trip.
+
+        @param id [String] ID of the individual.
+        @param type [String] One of 'following', 'followers', 'reciprocated', 'blocked', 'blocked_by', 'pending', 'pending_with'.
+        @param page_options [Hash] Options to be passed for retrieving a page of individuals.
+        @param scope [String] Scope for the call.
+        @return a hash of 'members', the clamped 'page', 'page_size', 'total_count' and 'total_pages'.
+        '''
+        if scope is None:
+            scope = self.options['default_scope_key']
+
+        if page_options is None:
+            page_options = self._default_paging_options()
+
+        self._validate_relationship_type(type)
+        if type == 'reciprocated' and self.options['lazy_reciprocated']:
+            members, count = self.__intersection(
+                self._reciprocated_keys(id, scope), page_options, scope, 'MAX')
+        else:
+            members, count = self.__page(
+                self._key(type, scope, id), page_options, scope)
+        return self._page_result(members, count, page_options)
+
+    def common_following(self, id, other_id, page_options=None, scope=None):
+        '''
+        Retrieve a page of the individuals followed by both of two individuals, computed
+        in Redis. Individuals are ordered by when id followed them, most recent first.
+
+        @param id [String] ID of the first individual.
+        @param other_id [String] ID of the second individual.
+        @param page_options [Hash] Options to be passed for retrieving a page of individuals.
+        @param scope [String] Scope for the call.
+        @return a page of the individuals followed by both id and other_id.
+        '''
+        if scope is None:
+            scope = self.options['default_scope_key']
+
+        return self.__intersection(
+            [self._key('following', scope, id),
+             self._key('following', scope, other_id)],
+            page_options,
+            scope)[0]
+
+    def common_followers(self, id, other_id, page_options=None, scope=None):
+        '''
+        Retrieve a page of the individuals following both of two individuals, computed
+        in Redis. Individuals are ordered by when they followed id, most recent first.
+
+        @param id [String] ID of the first individual.
+        @param other_id [String] ID of the second individual.
+        @param page_options [Hash] Options to be passed for retrieving a page of individuals.
+        @param scope [String] Scope for the call.
+        @return a page of the individuals following both id and other_id.
+        '''
+        if scope is None:
+            scope = self.options['default_scope_key']
+
+        return self.__intersection(
+            [self._key('followers', scope, id),
+             self._key('followers', scope, other_id)],
+            page_options,
+            scope)[0]
+
+    def followers_you_know(self, viewer_id, id, page_options=None, scope=None):
+        '''
+        Retrieve a page of the followers of an individual that are followed by a viewer,
+        computed in Redis. Individuals are ordered by when they followed id, most recent first.
+
+        @param viewer_id [String] ID of the individual viewing the followers.
+        @param id [String] ID of the individual whose followers are retrieved.
+        @param page_options [Hash] Options to be passed for retrieving a page of individuals.
+        @param scope [String] Scope for the call.
+        @return a page of the followers of id that viewer_id follows.
+        '''
+        if scope is None:
+            scope = self.options['default_scope_key']
+
+        return self.__intersection(
+            [self._key('followers', scope, id),
+             self._key('following', scope, viewer_id)],
+            page_options,
+            scope)[0]
+
+    def suggestions(self, id, scope=None, limit=10, type='following'):
+        '''
+        Suggest individuals to follow from second-degree connections: the individuals
+        followed by those id follows (or, with type 'reciprocated', the mutual connections of
+        id's mutual connections). Each candidate is scored by the number of paths leading to it.
+        Individuals already followed, blocked, blocking or pending with id are never suggested.
+        With the lazy_reciprocated option, mutual connections are sampled from the intersection
+        of the following and followers sets.
+
+        At most suggestion_sample_size IDs are read from each relationship set walked, so
+        the cost is bounded for individuals with many connections. The walk runs in Redis,
+        in a script if use_scripts is set, so only the suggestions are returned.
+
+        @param id [String] ID of the individual.
+        @param scope [String] Scope for the call.
+        @param limit [int] Maximum number of suggestions.
+        @param type [String] Relationship walked, 'following' or 'reciprocated'.
+        @return a list of (ID, score) pairs, highest score first.
+        '''
+        if scope is None:
+            scope = self.options['default_scope_key']
+
+        if type not in ['following', 'reciprocated']:
+            raise Exception('Invalid suggestion relationship type given %s' % type)
+
+        if limit <= 0:
+            return []
+
+        size = self.options['suggestion_sample_size']
+        excluded_keys = self._suggestion_exclusion_keys(id, scope)
+        lazy = type == 'reciprocated' and self.options['lazy_reciprocated']
+        if lazy:
+            self.__migrate(excluded_keys + self._reciprocated_keys(id, scope))
+            transaction = self.__pipeline(transaction=True)
+            self._queue_reciprocated_sample(transaction, id, size, scope)
+            sample = transaction.execute()[1]
+        else:
+            key = self._key(type, scope, id)
+            self.__migrate(excluded_keys + [key])
+            transaction = self.__pipeline(transaction=False)
+            self._queue_sample(transaction, key, size, scope)
+            sample = transaction.execute()[0]
+        connection_ids = [self._decode(connection_id) for connection_id in sample]
+        if not connection_ids:
+            return []
+
+        if lazy:
+            # The script is given the following, followers and intersection keys of each
+            # connection.
+            relationship_keys, connection_keys = [], []
+            for connection_id in connection_ids:
+                keys = self._reciprocated_keys(connection_id, scope)
+                relationship_keys.extend(keys)
+                connection_keys.extend(keys + [self._intersection_key(keys)])
+            self.__migrate(relationship_keys)
+        else:
+            connection_keys = [
+                self._key(type, scope, connection_id) for connection_id in connection_ids]
+            self.__migrate(connection_keys)
+
+        if self.options['use_scripts']:
+            reply = self._suggestions_script(
+                keys=excluded_keys + connection_keys,
+                args=[id, size, limit,
+                      'set' if self._uses_sets(scope) else 'zset',
+                      'lazy' if lazy else 'eager',
+                      self.options['intersection_ttl']])
+            return [
+                (self._decode(reply[index]), reply[index + 1])
+                for index in range(0, len(reply), 2)]
+
+        if lazy:
+            transaction = self.__pipeline(transaction=True)
+            for connection_id in connection_ids:
+                self._queue_reciprocated_sample(transaction, connection_id, size, scope)
+            samples = transaction.execute()[1::3]
+        else:
+            transaction = self.__pipeline()
+            for connection_key in connection_keys:
+                self._queue_sample(transaction, connection_key, size, scope)
+            samples = transaction.execute()
+        candidates = self._rank_suggestions(id, samples)
+
+        suggestions = []
+        while candidates and len(suggestions) < limit:
+            batch, candidates = candidates[:limit], candidates[limit:]
+            transaction = self.__pipeline()
+            for candidate, score in batch:
+                for excluded_key in excluded_keys:
+                    self._queue_is_member(
+                        transaction, excluded_key, candidate, scope)
+            checks = iter(transaction.execute())
+            for candidate, score in batch:
+                found = [
+                    self._found(next(checks), scope) for excluded_key in excluded_keys]
+                if not any(found):
+                    suggestions.append((candidate, score))
+        return suggestions[:limit]
+
+    def map(self, method, ids, workers=None, **kwargs):
+        '''
+        Call a read method for each of a list of IDs on a bounded thread pool. The threads
+        share this instance's connection pool; with a BlockingConnectionPool (the default
+        when no connection is given), threads wait for a free connection instead of opening
+        more. At most twice as many calls as workers are queued at a time, so the IDs can be
+        a long or lazy iterable.
+
+        @param method [String] Name of the method (e.g. 'following_count'), or a callable taking an ID.
+        @param ids [iterable] IDs of the individuals.
+        @param workers [int] Number of threads (default: Amico.DEFAULTS['workers']).
+        @param kwargs Keyword arguments passed to the method (e.g. scope or page_options). Dictionaries
+          are copied for each call, since paging options are clamped in place.
+        @return a generator of the results, in the order of the IDs.
+        '''
+        if workers is None:
+            workers = self.options['workers']
+
+        if not callable(method):
+            method = getattr(self, method)
+
+        return self.__map(method, ids, workers, kwargs)
+
+    def reshard(self, connections=None, chunk_size=None):
+        '''
+        Move relationship sets to the node that owns them after nodes were added to or removed
+        from the connections given to Amico. Only the sets of the individuals whose owner changed
+        are moved; sets already on the new node are merged with the moved ones.
+
+        @param connections [list] Connections to move sets from (default: the current nodes). Include removed nodes.
+        @param chunk_size [int] Number of keys to scan per round trip (default: Amico.DEFAULTS['chunk_size']).
+        @return the number of sets moved.
+        '''
+        if not isinstance(self.redis_connection, ShardedRedis):
+            raise Exception('Resharding requires a list of connections')
+
+        if connections is None:
+            connections = self.redis_connection.connections
+
+        if chunk_size is None:
+            chunk_size = self.options['chunk_size']
+
+        moved = 0
+        for connection in connections:
+            cursor = 0
+            while True:
+                cursor, keys = connection.scan(
+                    cursor, match=self.key_schema.pattern(), count=chunk_size)
+                moved += self.__reshard_keys(connection, keys)
+                if cursor == 0:
+                    break
+        return moved
+
+    def migrate_keys(self, chunk_size=None):
+        '''
+        Move every key from the schema described by the legacy_keys option to the current
+        schema. Reads fall back to the legacy keys and writes move the keys they touch first,
+        so the migration can run while the application is serving traffic.
+
+        @param chunk_size [int] Number of keys to scan per round trip (default: Amico.DEFAULTS['chunk_size']).
+        @return the number of keys moved.
+        '''
+        cursor, migrated = self.migrate_keys_chunk(0, chunk_size)
+        while cursor != 0:
+            cursor, count = self.migrate_keys_chunk(cursor, chunk_size)
+            migrated += count
+        return migrated
+
+    def migrate_keys_chunk(self, cursor=0, chunk_size=None):
+        '''
+        Move one chunk of keys from the schema described by the legacy_keys option to the
+        current schema. Start with a cursor of 0 and call again with the returned cursor
+        until it is 0. Keys written by clients still using the legacy schema are merged
+        into the current keys.
+
+        @param cursor [int] Cursor returned from the previous call, or 0 to start.
+        @param chunk_size [int] Number of keys to scan (default: Amico.DEFAULTS['chunk_size']).
+        @return a tuple of the cursor for the next call (0 once every key has been scanned) and the number of keys moved.
+        '''
+        if self.legacy_key_schema is None:
+            raise Exception('No legacy_keys option set to migrate keys from')
+
+        if chunk_size is None:
+            chunk_size = self.options['chunk_size']
+
+        cursor, legacy_keys = self.redis_connection.scan(
+            cursor, match=self.legacy_key_schema.pattern(), count=chunk_size)
+        keys = []
+        for legacy_key in legacy_keys:
+            parts = self.legacy_key_schema.parse(self._decode(legacy_key))
+            if parts is not None:
+                keys.append(self._key(*parts))
+        return int(cursor), self.__migrate(keys)
+
     # private methods
 
-    # Valid relationtionships that can be used in #all, #count, #page_count,
-    # etc...
-    VALID_RELATIONSHIPS = [
-        'following',
-        'followers',
-        'reciprocated',
-        'blocked',
-        'blocked_by',
-        'pending',
-        'pending_with']
+    def __map(self, method, ids, workers, kwargs):
+        '''
+        Call a method for each of a list of IDs on a thread pool, see #map.
+
+        @param method [callable] Method to call with each ID.
+        @param ids [iterable] IDs of the individuals.
+        @param workers [int] Number of threads.
+        @param kwargs [dictionary] Keyword arguments passed to the method.
+        @return a generator of the results, in the order of the IDs.
+        '''
+        calls = deque()
+        with ThreadPoolExecutor(workers) as executor:
+            for id in ids:
+                if len(calls) >= workers * 2:
+                    yield calls.popleft().result()
+                calls.append(executor.submit(
+                    method, id, **dict(
+                        (name, dict(value) if isinstance(value, dict) else value)
+                        for name, value in kwargs.items())))
+            while calls:
+                yield calls.popleft().result()
+
+    def __reshard_keys(self, connection, keys):
+        '''
+        Move the relationship sets owned by other nodes from one node to their owners.
+
+        @param connection [redis] Connection of the node the keys were read from.
+        @param keys [list] Keys read from the node.
+        @return the number of sets moved.
+        '''
+        name = self.redis_connection.node_name(connection)
+        keys = [
+            key for key in map(self._decode, keys)
+            if self.key_schema.parse(key) is not None and
+            self.redis_connection.node_name(
+                self.redis_connection.connections[
+                    self.redis_connection.node_index(key)]) != name]
+        if not keys:
+            return 0
+
+        transaction = connection.pipeline(transaction=False)
+        for key in keys:
+            transaction.dump(key)
+        dumps = transaction.execute()
+
+        transaction = self.__pipeline(transaction=True)
+        for key, dump in zip(keys, dumps):
+            if dump is None:
+                continue
+            scope = self.key_schema.parse(key)[1]
+            temporary_key = '%s:resharding' % key
+            transaction.restore(temporary_key, 0, dump, replace=True)
+            if self._uses_sets(scope):
+                transaction.sunionstore(key, [key, temporary_key])
+            else:
+                transaction.zunionstore(
+                    key, [key, temporary_key], aggregate='MAX')
+            transaction.delete(temporary_key)
+        transaction.execute()
+        connection.delete(*keys)
+        return len(keys)
 
-    def __validate_relationship_type(self, type):
+    def __buffer_write(self, operation, from_id, to_id, scope):
         '''
-        Ensure that a relationship type is valid.
+        Buffer a follow or unfollow relationship, replacing any buffered operation on the same
+        relationship. If the buffer is full, it is flushed first.
 
-        @param type [String] One of 'following', 'followers', 'reciprocated', 'blocked', 'blocked_by', 'pending', 'pending_with'.
-        @raise [StandardError] if the type is not included in VALID_RELATIONSHIPS
+        @param operation [String] 'follow' or 'unfollow'.
+        @param from_id [String] The ID of the individual initiating the change.
+        @param to_id [String] The ID of the other individual.
+        @param scope [String] Scope for the call.
+        '''
+        if scope is None:
+            scope = self.options['default_scope_key']
+
+        edge = (from_id, to_id, scope)
+        while True:
+            with self.__write_buffer_lock:
+                if edge in self.__write_buffer or \
+                        len(self.__write_buffer) < self.options['write_buffer_size']:
+                    self.__write_buffer.pop(edge, None)
+                    self.__write_buffer[edge] = operation
+                    return
+            self.flush()
+
+    def __follow_many(self, from_id, to_ids, scope):
+        '''
+        Establish follow relationships between one ID and many others, as #follow_many, without
+        flushing the buffered writes first.
+
+        @param from_id [String] The ID of the individual.
+        @param to_ids [list] IDs of the other individuals.
+        @param scope [String] Scope for the call.
+        @return a dictionary of to_id to outcome.
+        '''
+        if scope is None:
+            scope = self.options['default_scope_key']
+
+        outcomes = {}
+        to_ids = self._exclude_self(from_id, to_ids, outcomes)
+        if not to_ids:
+            return outcomes
+
+        keys = self._relationship_keys(from_id, to_ids, scope)
+        self.__migrate(keys)
+
+        if self.options['use_scripts']:
+            outcomes.update(self._script_outcomes(to_ids, self._follow_script(
+                **self._script_keys_and_args(
+                    from_id, to_ids, scope,
+                    1 if self.options['pending_follow'] else 0))))
+            self.__invalidate(keys)
+            return outcomes
+
+        transaction = self.__pipeline()
+        self._queue_follow_checks(transaction, from_id, to_ids, scope)
+        allowed_ids = self._allowed_follow_ids(
+            to_ids, transaction.execute(), outcomes, scope)
+        if not allowed_ids:
+            return outcomes
+
+        if self.options['pending_follow']:
+            transaction = self.__pipeline()
+            self._queue_pending(
+                transaction, from_id, allowed_ids, scope, outcomes)
+            transaction.execute()
+        else:
+            self.__add_following_followers_reciprocated(
+                from_id, allowed_ids, scope)
+            for to_id in allowed_ids:
+                outcomes[to_id] = 'followed'
+
+        self.__invalidate(keys)
+        return outcomes
+
+    def __unfollow_many(self, from_id, to_ids, scope):
+        '''
+        Remove follow relationships between one ID and many others, as #unfollow_many, without
+        flushing the buffered writes first.
+
+        @param from_id [String] The ID of the individual.
+        @param to_ids [list] IDs of the other individuals.
+        @param scope [String] Scope for the call.
+        @return a dictionary of to_id to outcome.
+        '''
+        if scope is None:
+            scope = self.options['default_scope_key']
+
+        outcomes = {}
+        to_ids = self._exclude_self(from_id, to_ids, outcomes)
+        if not to_ids:
+            return outcomes
+
+        keys = self._relationship_keys(from_id, to_ids, scope)
+        self.__migrate(keys)
+
+        if self.options['use_scripts']:
+            outcomes.update(self._script_outcomes(to_ids, self._unfollow_script(
+                **self._script_keys_and_args(from_id, to_ids, scope))))
+            self.__invalidate(keys)
+            return outcomes
+
+        transaction = self.__pipeline()
+        self._queue_unfollow(transaction, from_id, to_ids, scope, outcomes)
+        transaction.execute()
+
+        self.__invalidate(keys)
+        return outcomes
+
+    def __write_buffered(self, writes):
+        '''
+        Write buffered follow and unfollow relationships.
+
+        @param writes [OrderedDict] Operation of each buffered (from_id, to_id, scope).
+        '''
+        batches = OrderedDict()
+        for (from_id, to_id, scope), operation in writes.items():
+            batches.setdefault((operation, from_id, scope), []).append(to_id)
+
+        if not self.options['use_scripts']:
+            for (operation, from_id, scope), to_ids in batches.items():
+                if operation == 'follow':
+                    self.__follow_many(from_id, to_ids, scope)
+                else:
+                    self.__unfollow_many(from_id, to_ids, scope)
+            return
+
+        transaction = self.__pipeline(transaction=False)
+        written_keys = []
+        for (operation, from_id, scope), to_ids in batches.items():
+            to_ids = self._exclude_self(from_id, to_ids, {})
+            if not to_ids:
+                continue
+            keys = self._relationship_keys(from_id, to_ids, scope)
+            self.__migrate(keys)
+            if operation == 'follow':
+                self._follow_script(client=transaction, **self._script_keys_and_args(
+                    from_id, to_ids, scope, 1 if self.options['pending_follow'] else 0))
+            else:
+                self._unfollow_script(client=transaction, **self._script_keys_and_args(
+                    from_id, to_ids, scope))
+            written_keys.extend(keys)
+        transaction.execute()
+        self.__invalidate(written_keys)
+
+    def __start_flush_thread(self):
+        '''
+        Start the background thread flushing the buffered writes every write_buffer_interval
+        milliseconds.
+        '''
+        self.__flushing = threading.Event()
+        self.__flush_thread = threading.Thread(
+            target=self.__flush_periodically, daemon=True)
+        self.__flush_thread.start()
+
+    def __instrument(self):
         '''
-        if type not in self.VALID_RELATIONSHIPS:
-            raise Exception('Invalid relationship type given %s' % type)
+        Measure every call to a public method with the instrumentation option's hooks. The Redis
+        connection (each node's, if sharding) is wrapped to count commands, pipelines and reply
+        sizes, and the public methods are replaced on this instance only, so that Amico without
+        instrumentation runs unchanged.
+        '''
+        instrumentation = self.options['instrumentation']
+        calls = threading.local()
+        if isinstance(self.redis_connection, ShardedRedis):
+            self.redis_connection.connections = [
+                InstrumentedRedis(connection, calls)
+                for connection in self.redis_connection.connections]
+        else:
+            self.redis_connection = InstrumentedRedis(self.redis_connection, calls)
+            if self.options['use_scripts']:
+                self._register_scripts()
+
+        for name, method in inspect.getmembers(self, inspect.ismethod):
+            if not name.startswith('_'):
+                setattr(self, name, instrument(method, name, instrumentation, calls))
+
+    def __flush_periodically(self):
+        '''
+        Flush the buffered writes every write_buffer_interval milliseconds until #close is
+        called. Writes that fail are retried on the next flush.
+        '''
+        while not self.__flushing.wait(self.options['write_buffer_interval'] / 1000.0):
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+    def __pipeline(self, transaction=None):
+        '''
+        Create a pipeline. In cluster mode, the pipeline is split into one pipeline per
+        hash slot, run in parallel, and without a transaction if the client does not support
+        transactions. Pipelines of a sharded connection are split per node.
+
+        @param transaction [boolean] Whether to run the pipeline (or each per-slot pipeline) in a
+          transaction. True for batches that must be applied atomically, False for single commands
+          (default: the transactions option).
+        @return the pipeline.
+        '''
+        if transaction is None:
+            transaction = self.options['transactions']
+
+        if not self.options['cluster']:
+            return self.redis_connection.pipeline(transaction=transaction)
+
+        return SlotPipeline(
+            self.redis_connection, self.__executor,
+            transaction and self.__cluster_transactions)
+
+    def __start_invalidation_listener(self):
+        '''
+        Subscribe a dedicated connection to the invalidation messages of Redis client
+        tracking, in broadcasting mode for every key in the namespaces of the key schemas,
+        and invalidate cached values from a background thread as messages arrive.
+        '''
+        pool = self.redis_connection.connection_pool
+        self.__invalidation_connection = pool.make_connection()
+        self.__invalidation_connection.socket_timeout = None
+        if self.__uses_resp3():
+            self.__invalidation_connection._parser.set_invalidation_push_handler(
+                lambda message: message)
+        self.__invalidation_connection.send_command('CLIENT', 'ID')
+        client_id = self.__invalidation_connection.read_response()
+        self.__invalidation_connection.send_command(
+            'SUBSCRIBE', '__redis__:invalidate')
+        self.__read_message()
+
+        prefixes = set([self.key_schema.namespace + ':'])
+        if self.legacy_key_schema is not None:
+            prefixes.add(self.legacy_key_schema.namespace + ':')
+        self.__tracking_connection = pool.make_connection()
+        self.__tracking_connection.send_command(
+            'CLIENT', 'TRACKING', 'ON', 'REDIRECT', client_id, 'BCAST',
+            *[argument for prefix in prefixes for argument in ['PREFIX', prefix]])
+        self.__tracking_connection.read_response()
+
+        self.__caching = True
+        self.__invalidation_thread = threading.Thread(
+            target=self.__listen_for_invalidations)
+        self.__invalidation_thread.daemon = True
+        self.__invalidation_thread.start()
+
+    def __listen_for_invalidations(self):
+        '''
+        Invalidate cached values as invalidation messages arrive. If the connection is
+        lost, caching is disabled and values are read from Redis from then on.
+        '''
+        try:
+            while self.__caching:
+                message = self.__read_message()
+                if message is None:
+                    continue
+                type = self._decode(message[0])
+                if type == 'message':
+                    keys = message[2]
+                elif type == 'invalidate':
+                    keys = message[1]
+                else:
+                    continue
+                if keys is None:
+                    self.cache.clear()
+                else:
+                    self.cache.invalidate(
+                        self.__current_keys([self._decode(key) for key in keys]))
+        except Exception:
+            # The connection was lost or closed by #close. Without invalidation
+            # messages, cached values could become stale, so caching stops.
+            pass
+        finally:
+            self.__caching = False
+            self.cache.clear()
+
+    def __uses_resp3(self):
+        '''
+        Check to see if the invalidation connection uses RESP3, in which case subscription
+        and invalidation messages are push messages.
+
+        @return true if the connection uses RESP3.
+        '''
+        return getattr(self.__invalidation_connection, 'protocol', 2) in [3, '3']
+
+    def __read_message(self):
+        '''
+        Read the next message from the invalidation connection. With RESP3, Redis sends
+        ['invalidate', keys] push messages, which have to be requested explicitly; with
+        RESP2 it sends ['message', '__redis__:invalidate', keys].
+
+        @return the message.
+        '''
+        if self.__uses_resp3():
+            return self.__invalidation_connection.read_response(
+                push_request=True)
+        return self.__invalidation_connection.read_response()
+
+    def __current_keys(self, keys):
+        '''
+        Map invalidated keys to the current schema, for keys written by clients still
+        using the legacy schema.
+
+        @param keys [list] Invalidated Redis keys.
+        @return the keys, along with the current keys of any legacy keys.
+        '''
+        if self.legacy_key_schema is None:
+            return keys
+
+        current_keys = list(keys)
+        for key in keys:
+            parts = self.legacy_key_schema.parse(key)
+            if parts is not None:
+                current_keys.append(self._key(*parts))
+        return current_keys
+
+    def __invalidate(self, keys):
+        '''
+        Invalidate the cached values read from keys written by this client, so that
+        its own writes are visible right away.
+
+        @param keys [list] Redis keys.
+        '''
+        if self.cache is not None:
+            self.cache.invalidate(keys)
+
+    def __migrate(self, keys):
+        '''
+        Move the legacy keys of a list of keys to the current schema, if a migration is
+        configured with the legacy_keys option.
+
+        @param keys [list] Redis keys in the current schema.
+        @return the number of keys moved.
+        '''
+        if self.legacy_key_schema is None or not keys:
+            return 0
+
+        pairs = self._migration_pairs(keys)
+        if self.options['use_scripts']:
+            return self._migrate_keys_script(keys=pairs)
+
+        transaction = self.__pipeline()
+        for key in pairs:
+            transaction.exists(key)
+        exists = transaction.execute()
+
+        migrated = 0
+        transaction = self.__pipeline(transaction=True)
+        for index in range(0, len(pairs), 2):
+            legacy_key, key = pairs[index], pairs[index + 1]
+            if legacy_key == key or not exists[index]:
+                continue
+            if exists[index + 1] and self._uses_sets(self.key_schema.parse(key)[1]):
+                transaction.sunionstore(key, [key, legacy_key])
+                transaction.delete(legacy_key)
+            elif exists[index + 1]:
+                transaction.zunionstore(
+                    key, [key, legacy_key], aggregate='MAX')
+                transaction.delete(legacy_key)
+            else:
+                transaction.rename(legacy_key, key)
+            migrated += 1
+        transaction.execute()
+        return migrated
+
+    def __is_member(self, key, member_id, scope):
+        '''
+        Check to see if an ID is in a relationship set, falling back to the legacy key
+        while keys are migrated.
+
+        @param key [String] Redis key.
+        @param member_id [String] ID to look for.
+        @param scope [String] Scope for the call.
+        @return true if the ID is in the set.
+        '''
+        token = None
+        if self.__caching:
+            hit, found = self.cache.get(key, str(member_id))
+            if hit:
+                return found
+            token = self.cache.token()
+
+        found = self.__execute_is_member(key, member_id, scope)
+        if not found and self.legacy_key_schema is not None:
+            found = self.__execute_is_member(
+                self._legacy_key(key), member_id, scope)
+
+        if token is not None:
+            self.cache.set(key, str(member_id), found, token)
+        return found
+
+    def __execute_is_member(self, key, member_id, scope):
+        '''
+        Check to see if an ID is in a relationship set.
+
+        @param key [String] Redis key.
+        @param member_id [String] ID to look for.
+        @param scope [String] Scope for the call.
+        @return true if the ID is in the set.
+        '''
+        if self._uses_sets(scope):
+            return bool(self.redis_connection.sismember(key, member_id))
+        return self.redis_connection.zscore(key, member_id) is not None
+
+    def __count(self, key, scope):
+        '''
+        Count the items in a relationship set, falling back to the legacy key while keys
+        are migrated.
+
+        @param key [String] Redis key.
+        @param scope [String] Scope for the call.
+        @return the number of items in the set.
+        '''
+        token = None
+        if self.__caching:
+            hit, count = self.cache.get(key, None)
+            if hit:
+                return count
+            token = self.cache.token()
+
+        count = self.__execute_count(key, scope)
+        if count == 0 and self.legacy_key_schema is not None:
+            count = self.__execute_count(self._legacy_key(key), scope)
+
+        if token is not None:
+            self.cache.set(key, None, count, token)
+        return count
+
+    def __execute_count(self, key, scope):
+        '''
+        Count the items in a relationship set.
+
+        @param key [String] Redis key.
+        @param scope [String] Scope for the call.
+        @return the number of items in the set.
+        '''
+        if self._uses_sets(scope):
+            return self.redis_connection.scard(key)
+        return self.redis_connection.zcard(key)
 
     def __clear_bidirectional_sets_for_id(
             self,
             id,
-            source_set_key,
-            related_set_key,
-            scope=None):
+            source_type,
+            related_type,
+            scope=None,
+            chunk_size=None):
         '''
         Removes references to an individual in sets that are named with other individual's keys.
         Assumes two set keys that are used together such as followers/following, blocked/blocked_by, etc...
+        At most chunk_size entries of the source set are processed. The reverse edges and the source
+        entries are removed in the same transaction, and the source set is deleted by Redis once empty.
 
         @param id [String] The ID of the individual to clear info for.
-        @param source_set_key [String] The key identifying the souce set to iterate over.
-        @param related_set_key [String] The key identifying the sets that the idividual needs to be removed from.
+        @param source_type [String] The relationship type of the source set to iterate over.
+        @param related_type [String] The relationship type of the sets that the individual needs to be removed from.
         @param scope [String] Scope for the call.
+        @param chunk_size [int] Number of entries to process.
+        @return true if entries were removed from the source set, false if it was already empty.
         '''
         if scope is None:
             scope = self.options['default_scope_key']
 
-        related_ids = self.redis_connection.zrange(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'], source_set_key, scope, id), 0, -1)
-        transaction = self.redis_connection.pipeline()
-        for related_id in related_ids:
-            self.redis_connection.zrem(
-                '%s:%s:%s:%s' %
-                (self.options['namespace'],
-                 related_set_key,
-                 scope,
-                 related_id),
-                id)
-        transaction.execute()
+        if chunk_size is None:
+            chunk_size = self.options['chunk_size']
 
-        self.redis_connection.delete(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'], source_set_key, scope, id))
+        source_key = self._key(source_type, scope, id)
+        if self._uses_sets(scope):
+            related_ids = self.redis_connection.srandmember(
+                source_key, chunk_size)
+        else:
+            related_ids = self.redis_connection.zrange(
+                source_key, 0, chunk_size - 1)
+        if not related_ids:
+            return False
+
+        related_keys = [
+            self._key(related_type, scope, self._decode(related_id))
+            for related_id in related_ids]
+        self.__migrate(related_keys)
+        transaction = self.__pipeline(transaction=True)
+        self._queue_clear_chunk(
+            transaction, id, source_key, related_type, related_ids, scope)
+        transaction.execute()
+        self.__invalidate(related_keys + [source_key])
+        return True
 
     def __add_following_followers_reciprocated(
             self,
             from_id,
-            to_id,
+            to_ids,
             scope=None):
         '''
         Add the following, followers and check for a reciprocated relationship. To be used from the
-        +follow+ and +accept+ methods.
+        +follow_many+ and +accept+ methods.
 
-        @param from_id [String] The ID of the individual establishing the follow relationship.
-        @param to_id [String] The ID of the individual to be followed.
+        @param from_id [String] The ID of the individual establishing the follow relationships.
+        @param to_ids [list] IDs of the individuals to be followed.
         '''
         if scope is None:
             scope = self.options['default_scope_key']
 
-        transaction = self.redis_connection.pipeline()
-        transaction.zadd(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'], self.options['following_key'], scope, from_id), int(
-                time.time()), to_id)
-        transaction.zadd(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'], self.options['followers_key'], scope, to_id), int(
-                time.time()), from_id)
-        transaction.zrem(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'], self.options['pending_key'], scope, to_id), int(
-                time.time()), from_id)
-        transaction.zrem(
-            '%s:%s:%s:%s' %
-            (self.options['namespace'], self.options['pending_with_key'], scope, from_id), int(
-                time.time()), to_id)
+        if self.options['use_scripts']:
+            self._accept_script(
+                **self._script_keys_and_args(from_id, to_ids, scope))
+            return
+
+        transaction = self.__pipeline(transaction=True)
+        self._queue_following_followers(transaction, from_id, to_ids, scope)
+        results = transaction.execute()
+        if self.options['lazy_reciprocated']:
+            return
+
+        transaction = self.__pipeline()
+        self._queue_reciprocated(transaction, from_id, to_ids, results, scope)
         transaction.execute()
 
-        if self.is_reciprocated(from_id, to_id, scope):
-            transaction = self.redis_connection.pipeline()
-            transaction.zadd(
-                '%s:%s:%s:%s' %
-                (self.options['namespace'], self.options['reciprocated_key'], scope, from_id), int(
-                    time.time()), to_id)
-            transaction.zadd(
-                '%s:%s:%s:%s' %
-                (self.options['namespace'], self.options['reciprocated_key'], scope, to_id), int(
-                    time.time()), from_id)
-            transaction.execute()
+    def __are_members(self, type, id, member_ids, scope=None):
+        '''
+        Check to see if each of a list of IDs is in an individual's relationship set.
+
+        @param type [String] Relationship type.
+        @param id [String] ID of the individual owning the set.
+        @param member_ids [list] IDs to look for.
+        @param scope [String] Scope for the call.
+        @return a list of booleans, one per ID in member_ids.
+        '''
+        if scope is None:
+            scope = self.options['default_scope_key']
+
+        scores = self.__scores(
+            [self._key(type, scope, id)], member_ids, scope)[0]
+        return [score is not None for score in scores]
+
+    def __scores(self, keys, member_ids, scope, legacy=True):
+        '''
+        Retrieve the scores of a list of IDs in each of a number of Redis sorted sets in one
+        round trip, using ZMSCORE if the server supports it and ZSCORE otherwise. While keys
+        are migrated, sets in which none of the IDs were found are read again from their
+        legacy keys.
+
+        @param keys [list] Redis keys.
+        @param member_ids [list] IDs to retrieve the scores for.
+        @param scope [String] Scope for the call.
+        @param legacy [boolean] Whether to fall back to the legacy keys.
+        @return a list of lists of scores (None for missing IDs), one list per key.
+        '''
+        member_ids = list(member_ids)
+        if not member_ids:
+            return [[] for key in keys]
+
+        scores = self.__fetch_scores(keys, member_ids, scope)
+        if legacy and self.legacy_key_schema is not None:
+            missing = [index for index, key_scores in enumerate(scores)
+                       if all(score is None for score in key_scores)]
+            if missing:
+                legacy_scores = self.__scores(
+                    [self._legacy_key(keys[index]) for index in missing],
+                    member_ids, scope, False)
+                for index, key_scores in zip(missing, legacy_scores):
+                    scores[index] = key_scores
+        return scores
+
+    def __fetch_scores(self, keys, member_ids, scope):
+        '''
+        Retrieve the scores of a list of IDs in each of a number of Redis sorted sets in one
+        round trip, using ZMSCORE if the server supports it and ZSCORE otherwise.
+
+        @param keys [list] Redis keys.
+        @param member_ids [list] IDs to retrieve the scores for.
+        @param scope [String] Scope for the call.
+        @return a list of lists of scores (None for missing IDs), one list per key.
+        '''
+
+        while True:
+            zmscore_supported = self._zmscore_supported
+            transaction = self.__pipeline()
+            for key in keys:
+                self._queue_scores(transaction, key, member_ids, scope)
+            try:
+                return self._scores_from_results(
+                    transaction.execute(), len(member_ids), scope)
+            except redis.exceptions.RedisError as error:
+                if not zmscore_supported or not self._is_unknown_command(error):
+                    raise
+                self._zmscore_supported = False
 
-    def __total_pages(self, key, page_size):
+    def __total_pages(self, key, page_size, scope):
         '''
         Count the total number of pages for a given key in a Redis sorted set.
 
         @param key [String] Redis key.
         @param page_size [int] Page size from which to calculate total pages.
+        @param scope [String] Scope for the call.
         @return total number of pages for a given key in a Redis sorted set.
         '''
-        return int(
-            math.ceil(
-                self.redis_connection.zcard(key) /
-                float(page_size)))
+        return self._total_pages_for(self.__count(key, scope), page_size)
 
-    def __default_paging_options(self):
+    def __intersection(self, keys, page_options, scope, aggregate=None):
         '''
-        Default paging options.
+        Retrieve a page of the intersection of relationship sets. The intersection is
+        computed and paged in one transaction. If the intersection_ttl option is set, it
+        is kept for that many seconds, so later pages are read without recomputing it.
 
-        @return a hash of the default paging options.
+        @param keys [list] Redis keys of the intersected sets; members are ordered by their score in the first.
+        @param page_options [Hash] Options for paging; the page is clamped in place.
+        @param scope [String] Scope for the call.
+        @param aggregate [String] 'MIN' or 'MAX' to order members by the aggregate of their scores instead.
+        @return a tuple of the page of members in every set and the number of members in every set.
         '''
-        default_options = {
-            'page_size': self.DEFAULTS['page_size'],
-            'page': 1
-        }
-
-        return default_options
+        if page_options is None:
+            page_options = self._default_paging_options()
+
+        if self._partitioned and len(set(hash_tag(key) for key in keys)) > 1:
+            raise Exception(
+                'Intersections of different individuals are not supported with the cluster option or sharding')
+
+        self.__migrate(keys)
+        requested_offsets = self._requested_offsets(page_options)
+        count = 0
+        if self.options['intersection_ttl'] > 0:
+            transaction = self.__pipeline()
+            transaction.zcard(self._intersection_key(keys))
+            self._queue_range(
+                transaction,
+                self._intersection_key(keys),
+                requested_offsets[0],
+                requested_offsets[1],
+                scope)
+            count, members = transaction.execute()
+
+        if count == 0:
+            transaction = self.__pipeline(transaction=True)
+            self._queue_intersection(
+                transaction, keys, page_options, scope, aggregate)
+            count, members = transaction.execute()[:2]
+
+        if self._page_offsets(count, page_options) != requested_offsets:
+            return self.__intersection(keys, page_options, scope, aggregate)
+        return members, count
+
+    def __reciprocated_count(self, id, scope):
+        '''
+        Count an individual's reciprocated relationships from the intersection of their
+        following and followers sets. If the intersection_ttl option is set, the
+        intersection is stored so that paging through it does not recompute it.
 
-    def __members(self, key, options=None):
+        @param id [String] ID of the individual.
+        @param scope [String] Scope for the call.
+        @return the number of reciprocated relationships.
+        '''
+        keys = self._reciprocated_keys(id, scope)
+        if self.options['intersection_ttl'] > 0:
+            return self.__intersection(
+                keys, {'page_size': 1, 'page': 1}, scope, 'MAX')[1]
+        return self.__intersection_counts([keys])[0]
+
+    def __intersection_counts(self, keys_list, aggregate='MAX'):
+        '''
+        Count the members of the intersections of a number of lists of relationship sets
+        in one round trip, using ZINTERCARD if the server supports it and stored
+        intersections otherwise.
+
+        @param keys_list [list] Lists of Redis keys of the intersected sets.
+        @param aggregate [String] Aggregate used if the intersections are stored, see #__intersection.
+        @return a list of counts, one per list of keys.
+        '''
+        self.__migrate([key for keys in keys_list for key in keys])
+        while True:
+            zintercard_supported = self._zintercard_supported
+            transaction = self.__pipeline(transaction=True)
+            sizes = [
+                self._queue_intersection_count(transaction, keys, aggregate)
+                for keys in keys_list]
+            try:
+                results = transaction.execute()
+            except redis.exceptions.RedisError as error:
+                if not zintercard_supported or not self._is_unknown_command(error):
+                    raise
+                self._zintercard_supported = False
+                continue
+
+            counts = []
+            index = 0
+            for size in sizes:
+                counts.append(results[index])
+                index += size
+            return counts
+
+    def __members(self, key, options, scope):
         '''
         Retrieve a page of items from a Redis sorted set without scores.
 
         @param key [String] Redis key.
         @param options [Hash] Default options for paging.
+        @param scope [String] Scope for the call.
         @return a page of items from a Redis sorted set without scores.
         '''
         if options is None:
-            options = self.__default_paging_options()
+            options = self._default_paging_options()
 
-        if options['page'] < 1:
-            options['page'] = 1
+        if 'cursor' in options:
+            return self.__members_after(key, options, scope)
 
-        total_pages = self.__total_pages(key, options['page_size'])
-        if options['page'] > total_pages:
-            options['page'] = total_pages
+        return self.__page(key, options, scope)[0]
 
-        index_for_redis = options['page'] - 1
-        starting_offset = (index_for_redis * options['page_size'])
+    def __page(self, key, options, scope, legacy=True):
+        '''
+        Retrieve a page of items from a Redis sorted set without scores, along with the number
+        of items in the set. The requested page and the count are retrieved in one round trip;
+        a second round trip is only made if the requested page is past the last page.
 
-        if starting_offset < 0:
-            starting_offset = 0
+        @param key [String] Redis key.
+        @param options [Hash] Options for paging; the page is clamped in place.
+        @param scope [String] Scope for the call.
+        @param legacy [boolean] Whether to fall back to the legacy key if the set is empty.
+        @return a tuple of the page of items and the number of items in the Redis sorted set.
+        '''
+        requested_offsets = self._requested_offsets(options)
+        transaction = self.__pipeline()
+        self._queue_count(transaction, key, scope)
+        self._queue_range(
+            transaction, key, requested_offsets[0], requested_offsets[1], scope)
+        count, members = transaction.execute()
+        if count == 0 and legacy and self.legacy_key_schema is not None:
+            return self.__page(self._legacy_key(key), options, scope, False)
+
+        starting_offset, ending_offset = self._page_offsets(count, options)
+        if (starting_offset, ending_offset) != requested_offsets:
+            transaction = self.__pipeline(transaction=False)
+            self._queue_range(
+                transaction, key, starting_offset, ending_offset, scope)
+            members = transaction.execute()[0]
+        return members, count
+
+    def __members_after(self, key, options, scope):
+        '''
+        Retrieve the page of items from a Redis sorted set without scores that follows the
+        cursor in the paging options. Each page costs O(log N) regardless of how deep it is,
+        and pages do not shift when relationships are added while paging.
 
-        ending_offset = (starting_offset + options['page_size']) - 1
-        return self.redis_connection.zrevrange(
-            key,
-            starting_offset,
-            ending_offset,
-            withscores=False)
+        @param key [String] Redis key.
+        @param options [Hash] Options for paging with a cursor (None for the first page); the
+          cursor for the next page is stored in place, or None if there are no more items.
+        @param scope [String] Scope for the call.
+        @return a page of items from a Redis sorted set without scores.
+        '''
+        cursor = options['cursor']
+        members = self.__fetch_members_after(key, options, scope)
+        if not members and self.legacy_key_schema is not None:
+            options['cursor'] = cursor
+            members = self.__fetch_members_after(
+                self._legacy_key(key), options, scope)
+        return members
+
+    def __fetch_members_after(self, key, options, scope):
+        '''
+        Retrieve the page of items from a Redis sorted set without scores that follows the
+        cursor in the paging options. In scopes stored in Redis sets, the cursor holds the
+        offset of the next page in ID order.
+
+        @param key [String] Redis key.
+        @param options [Hash] Options for paging with a cursor; the cursor for the next page is stored in place.
+        @param scope [String] Scope for the call.
+        @return a page of items from a Redis sorted set without scores.
+        '''
+        if self._uses_sets(scope):
+            return self.__set_members_after(key, options, scope)
+
+        page_size = options.get('page_size', self.DEFAULTS['page_size'])
+        score, member = self._decode_cursor(options['cursor'])
+
+        if self.options['use_scripts']:
+            reply = self._members_after_script(
+                keys=[key],
+                args=['' if score is None else '%.17g' % score,
+                      '' if member is None else member,
+                      page_size])
+            items = [(reply[index], float(reply[index + 1]))
+                     for index in range(0, len(reply), 2)]
+            return self._members_after_result(items, options)
+
+        if member is None:
+            items = self.redis_connection.zrevrange(
+                key, 0, page_size - 1, withscores=True)
+            return self._members_after_result(items, options)
+
+        transaction = self.__pipeline()
+        transaction.zscore(key, member)
+        transaction.zrevrank(key, member)
+        current, rank = transaction.execute()
+        if current is not None and float(current) == score:
+            items = self.redis_connection.zrevrange(
+                key, rank + 1, rank + page_size, withscores=True)
+            return self._members_after_result(items, options)
+
+        items = [(tied_member, tied_score)
+                 for tied_member, tied_score in self.redis_connection.zrevrangebyscore(
+                     key, score, score, withscores=True)
+                 if self._decode(tied_member) < member][:page_size]
+        if len(items) < page_size:
+            items += self.redis_connection.zrevrangebyscore(
+                key, '(%.17g' % score, '-inf',
+                start=0, num=page_size - len(items), withscores=True)
+        return self._members_after_result(items, options)
+
+    def __set_members_after(self, key, options, scope):
+        '''
+        Retrieve the page of items from a Redis set that follows the offset held by the
+        cursor in the paging options.
+
+        @param key [String] Redis key.
+        @param options [Hash] Options for paging with a cursor; the cursor for the next page is stored in place.
+        @param scope [String] Scope for the call.
+        @return a page of items from a Redis set.
+        '''
+        page_size = options.get('page_size', self.DEFAULTS['page_size'])
+        offset, member = self._decode_cursor(options['cursor'])
+        offset = 0 if offset is None else int(offset)
+        transaction = self.__pipeline(transaction=False)
+        self._queue_range(
+            transaction, key, offset, offset + page_size - 1, scope)
+        members = transaction.execute()[0]
+        if len(members) < page_size:
+            options['cursor'] = None
+        else:
+            options['cursor'] = self._encode_cursor(offset + page_size, '')
+        return members
+
+    def __scan_members(self, key, chunk_size):
+        '''
+        Iterate over the items of a Redis set with SSCAN, falling back to the legacy key
+        while keys are migrated.
+
+        @param key [String] Redis key.
+        @param chunk_size [int] Number of items to ask for per round trip.
+        @return a generator of the items.
+        '''
+        found = False
+        for member in self.redis_connection.sscan_iter(key, count=chunk_size):
+            found = True
+            yield member
+        if not found and self.legacy_key_schema is not None:
+            for member in self.redis_connection.sscan_iter(
+                    self._legacy_key(key), count=chunk_size):
+                yield member
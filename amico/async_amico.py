@@ -0,0 +1,715 @@
+import redis.asyncio
+
+from .base import AmicoBase
+from .memory import MemoryRedis
+
+
+class AsyncAmico(AmicoBase):
+    '''
+    Relationships backed by Redis for asyncio applications. AsyncAmico has the same
+    options as Amico and its core methods, but every method is a coroutine and the
+    connection is a redis.asyncio connection. Key migrations (the legacy_keys
+    option) and the client-side cache (the cache_size option) are only
+    available in Amico.
+    '''
+
+    def __init__(self, options=AmicoBase.DEFAULTS, redis_connection=None):
+        '''
+        Initialize a new class for establishing relationships.
+
+        @param options [dictionary] (Default: Amico.DEFAULTS)
+        @param redis_connection [redis.asyncio] (Default: None) Redis connection
+        '''
+        if redis_connection is None:
+            redis_connection = redis.asyncio.Redis(
+                host='localhost',
+                port=6379,
+                db=0)
+
+        super(AsyncAmico, self).__init__(options, redis_connection)
+
+        if isinstance(redis_connection, MemoryRedis):
+            raise Exception('AsyncAmico does not support the in-memory backend')
+
+        if self.legacy_key_schema is not None:
+            raise Exception('AsyncAmico does not support the legacy_keys option')
+
+        if self.options['cache_size'] > 0:
+            raise Exception('AsyncAmico does not support the cache_size option')
+
+        if self.options['lazy_reciprocated']:
+            raise Exception('AsyncAmico does not support the lazy_reciprocated option')
+
+        if self.options['cluster']:
+            raise Exception('AsyncAmico does not support the cluster option')
+
+        if self.options['write_buffer_size'] > 0:
+            raise Exception('AsyncAmico does not support the write_buffer_size option')
+
+        if self.options['instrumentation'] is not None:
+            raise Exception('AsyncAmico does not support the instrumentation option')
+
+    async def follow(self, from_id, to_id, scope=None):
+        '''
+        Establish a follow relationship between two IDs. After adding the follow
+        relationship, it checks to see if the relationship is reciprocated and establishes that
+        relationship if so.
+
+        @param from_id [String] The ID of the individual establishing the follow relationship.
+        @param to_id [String] The ID of the individual to be followed.
+        @param scope [String] Scope for the call.
+        '''
+        await self.follow_many(from_id, [to_id], scope)
+
+    async def follow_many(self, from_id, to_ids, scope=None):
+        '''
+        Establish follow relationships between one ID and many others.
+
+        @param from_id [String] The ID of the individual establishing the follow relationships.
+        @param to_ids [list] IDs of the individuals to be followed.
+        @param scope [String] Scope for the call.
+        @return a dictionary of to_id to outcome, one of 'followed', 'blocked', 'pending' or 'self'.
+        '''
+        if scope is None:
+            scope = self.options['default_scope_key']
+
+        outcomes = {}
+        to_ids = self._exclude_self(from_id, to_ids, outcomes)
+        if not to_ids:
+            return outcomes
+
+        if self.options['use_scripts']:
+            outcomes.update(self._script_outcomes(to_ids, await self._follow_script(
+                **self._script_keys_and_args(
+                    from_id, to_ids, scope,
+                    1 if self.options['pending_follow'] else 0))))
+            return outcomes
+
+        transaction = self.redis_connection.pipeline(
+            transaction=self.options['transactions'])
+        self._queue_follow_checks(transaction, from_id, to_ids, scope)
+        allowed_ids = self._allowed_follow_ids(
+            to_ids, await transaction.execute(), outcomes, scope)
+        if not allowed_ids:
+            return outcomes
+
+        if self.options['pending_follow']:
+            transaction = self.redis_connection.pipeline(
+                transaction=self.options['transactions'])
+            self._queue_pending(
+                transaction, from_id, allowed_ids, scope, outcomes)
+            await transaction.execute()
+        else:
+            await self.__add_following_followers_reciprocated(
+                from_id, allowed_ids, scope)
+            for to_id in allowed_ids:
+                outcomes[to_id] = 'followed'
+
+        return outcomes
+
+    async def unfollow(self, from_id, to_id, scope=None):
+        '''
+        Remove a follow relationship between two IDs. After removing the follow
+        relationship, if a reciprocated relationship was established, it is
+        also removed.
+
+        @param from_id [String] The ID of the individual removing the follow relationship.
+        @param to_id [String] The ID of the individual to be unfollowed.
+        @param scope [String] Scope for the call.
+        '''
+        await self.unfollow_many(from_id, [to_id], scope)
+
+    async def unfollow_many(self, from_id, to_ids, scope=None):
+        '''
+        Remove follow relationships between one ID and many others in a single round trip.
+
+        @param from_id [String] The ID of the individual removing the follow relationships.
+        @param to_ids [list] IDs of the individuals to be unfollowed.
+        @param scope [String] Scope for the call.
+        @return a dictionary of to_id to outcome, one of 'unfollowed' or 'self'.
+        '''
+        if scope is None:
+            scope = self.options['default_scope_key']
+
+        outcomes = {}
+        to_ids = self._exclude_self(from_id, to_ids, outcomes)
+        if not to_ids:
+            return outcomes
+
+        if self.options['use_scripts']:
+            outcomes.update(self._script_outcomes(to_ids, await self._unfollow_script(
+                **self._script_keys_and_args(from_id, to_ids, scope))))
+            return outcomes
+
+        transaction = self.redis_connection.pipeline(
+            transaction=self.options['transactions'])
+        self._queue_unfollow(transaction, from_id, to_ids, scope, outcomes)
+        await transaction.execute()
+
+        return outcomes
+
+    async def block(self, from_id, to_id, scope=None):
+        '''
+        Block a relationship between two IDs. This method also has the side effect
+        of removing any follower or following relationship between the two IDs.
+
+        @param from_id [String] The ID of the individual blocking the relationship.
+        @param to_id [String] The ID of the individual being blocked.
+        @param scope [String] Scope for the call.
+        '''
+        if scope is None:
+            scope = self.options['default_scope_key']
+
+        if from_id == to_id:
+            return
+
+        if self.options['use_scripts']:
+            await self._block_script(
+                **self._script_keys_and_args(from_id, [to_id], scope))
+            return
+
+        transaction = self.redis_connection.pipeline(transaction=True)
+        self._queue_block(transaction, from_id, to_id, scope)
+        await transaction.execute()
+
+    async def unblock(self, from_id, to_id, scope=None):
+        '''
+        Unblock a relationship between two IDs.
+
+        @param from_id [String] The ID of the individual unblocking the relationship.
+        @param to_id [String] The ID of the blocked individual.
+        @param scope [String] Scope for the call.
+        '''
+        if scope is None:
+            scope = self.options['default_scope_key']
+
+        if from_id == to_id:
+            return
+
+        if self.options['use_scripts']:
+            await self._unblock_script(
+                **self._script_keys_and_args(from_id, [to_id], scope))
+            return
+
+        transaction = self.redis_connection.pipeline(
+            transaction=self.options['transactions'])
+        self._queue_unblock(transaction, from_id, to_id, scope)
+        await transaction.execute()
+
+    async def accept(self, from_id, to_id, scope=None):
+        '''
+        Accept a relationship that is pending between two IDs.
+
+        @param from_id [String] The ID of the individual accepting the relationship.
+        @param to_id [String] The ID of the individual to be accepted.
+        @param scope [String] Scope for the call.
+        '''
+        if scope is None:
+            scope = self.options['default_scope_key']
+
+        if from_id == to_id:
+            return
+
+        await self.__add_following_followers_reciprocated(from_id, [to_id], scope)
+
+    async def deny(self, from_id, to_id, scope=None):
+        '''
+        Deny a relationship that is pending between two IDs.
+
+        @param from_id [String] The ID of the individual denying the relationship.
+        @param to_id [String] The ID of the individual to be denied.
+        @param scope [String] Scope for the call.
+        '''
+        if scope is None:
+            scope = self.options['default_scope_key']
+
+        if from_id == to_id:
+            return
+
+        if self.options['use_scripts']:
+            await self._deny_script(
+                **self._script_keys_and_args(from_id, [to_id], scope))
+            return
+
+        transaction = self.redis_connection.pipeline(
+            transaction=self.options['transactions'])
+        self._queue_deny(transaction, from_id, to_id, scope)
+        await transaction.execute()
+
+    async def clear(self, id, scope=None, chunk_size=None):
+        '''
+        Clears all relationships (in either direction) stored for an individual.
+
+        @param id [String] ID of the individual to clear info for.
+        @param scope [String] Scope for the call.
+        @param chunk_size [int] Number of relationships to remove per round trip (default: Amico.DEFAULTS['chunk_size']).
+        '''
+        cursor = await self.clear_chunk(id, 0, chunk_size, scope)
+        while cursor != 0:
+            cursor = await self.clear_chunk(id, cursor, chunk_size, scope)
+
+    async def clear_chunk(self, id, cursor=0, chunk_size=None, scope=None):
+        '''
+        Clear one chunk of the relationships stored for an individual. See Amico#clear_chunk.
+
+        @param id [String] ID of the individual to clear info for.
+        @param cursor [int] Cursor returned from the previous call, or 0 to start.
+        @param chunk_size [int] Number of relationships to remove (default: Amico.DEFAULTS['chunk_size']).
+        @param scope [String] Scope for the call.
+        @return the cursor for the next call, or 0 if all relationships have been cleared.
+        '''
+        if scope is None:
+            scope = self.options['default_scope_key']
+
+        if chunk_size is None:
+            chunk_size = self.options['chunk_size']
+
+        for index in range(max(cursor - 1, 0), len(self.CLEAR_RELATIONSHIPS)):
+            source_type, related_type = self.CLEAR_RELATIONSHIPS[index]
+            source_key = self._key(source_type, scope, id)
+            if self._uses_sets(scope):
+                related_ids = await self.redis_connection.srandmember(
+                    source_key, chunk_size)
+            else:
+                related_ids = await self.redis_connection.zrange(
+                    source_key, 0, chunk_size - 1)
+            if related_ids:
+                transaction = self.redis_connection.pipeline(transaction=True)
+                self._queue_clear_chunk(
+                    transaction, id, source_key, related_type, related_ids, scope)
+                await transaction.execute()
+                return index + 1
+
+        return 0
+
+    async def is_blocked(self, id, blocked_id, scope=None):
+        '''
+        Check to see if one individual has blocked another individual.
+
+        @param id [String] ID of the individual checking the blocked status.
+        @param blocked_id [String] ID of the individual to see if they are blocked by id.
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__is_member('blocked', id, blocked_id, scope)
+
+    async def is_blocked_by(self, id, blocked_by_id, scope=None):
+        '''
+        Check to see if one individual is blocked by another individual.
+
+        @param id [String] ID of the individual checking the blocked by status.
+        @param blocked_id [String] ID of the individual to see if they have blocked id.
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__is_member('blocked_by', id, blocked_by_id, scope)
+
+    async def is_follower(self, id, follower_id, scope=None):
+        '''
+        Check to see if one individual is a follower of another individual.
+
+        @param id [String] ID of the individual checking the follower status.
+        @param following_id [String] ID of the individual to see if they are following id.
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__is_member('followers', id, follower_id, scope)
+
+    async def is_following(self, id, following_id, scope=None):
+        '''
+        Check to see if one individual is following another individual.
+
+        @param id [String] ID of the individual checking the following status.
+        @param following_id [String] ID of the individual to see if they are being followed by id.
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__is_member('following', id, following_id, scope)
+
+    async def is_reciprocated(self, from_id, to_id, scope=None):
+        '''
+        Check to see if one individual has reciprocated in following another individual.
+
+        @param from_id [String] ID of the individual checking the reciprocated relationship.
+        @param to_id [String] ID of the individual to see if they are following from_id.
+        @param scope [String] Scope for the call.
+        '''
+        return await self.is_following(
+            from_id,
+            to_id,
+            scope) and await self.is_following(
+            to_id,
+            from_id,
+            scope)
+
+    async def is_pending(self, from_id, to_id, scope=None):
+        '''
+        Check to see if one individual has a pending relationship in following another individual.
+
+        @param from_id [String] ID of the individual checking the pending relationships.
+        @param to_id [String] ID of the individual to see if they are pending a follow from from_id.
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__is_member('pending', to_id, from_id, scope)
+
+    async def is_pending_with(self, from_id, to_id, scope=None):
+        '''
+        Check to see if one individual has a pending relationship with another.
+
+        @param from_id [String] ID of the individual checking the pending relationships.
+        @param to_id [String] ID of the individual to see if they are pending an approval from from_id.
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__is_member('pending_with', to_id, from_id, scope)
+
+    async def following_count(self, id, scope=None):
+        '''
+        Count the number of individuals that someone is following.
+
+        @param id [String] ID of the individual to retrieve following count for.
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__count('following', id, scope)
+
+    async def followers_count(self, id, scope=None):
+        '''
+        Count the number of individuals that are following someone.
+
+        @param id [String] ID of the individual to retrieve followers count for.
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__count('followers', id, scope)
+
+    async def blocked_count(self, id, scope=None):
+        '''
+        Count the number of individuals that someone has blocked.
+
+        @param id [String] ID of the individual to retrieve blocked count for.
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__count('blocked', id, scope)
+
+    async def blocked_by_count(self, id, scope=None):
+        '''
+        Count the number of individuals blocking another.
+
+        @param id [String] ID of the individual to retrieve blocked_by count for.
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__count('blocked_by', id, scope)
+
+    async def reciprocated_count(self, id, scope=None):
+        '''
+        Count the number of individuals that have reciprocated a following relationship.
+
+        @param id [String] ID of the individual to retrieve reciprocated following count for.
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__count('reciprocated', id, scope)
+
+    async def pending_count(self, id, scope=None):
+        '''
+        Count the number of relationships pending for an individual.
+
+        @param id [String] ID of the individual to retrieve pending count for.
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__count('pending', id, scope)
+
+    async def pending_with_count(self, id, scope=None):
+        '''
+        Count the number of relationships an individual has pending with another.
+
+        @param id [String] ID of the individual to retrieve pending count for.
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__count('pending_with', id, scope)
+
+    async def following(self, id, page_options=None, scope=None):
+        '''
+        Retrieve a page of followed individuals for a given ID.
+
+        @param id [String] ID of the individual.
+        @param page_options [Hash] Options to be passed for retrieving a page of followed individuals.
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__members('following', id, page_options, scope)
+
+    async def followers(self, id, page_options=None, scope=None):
+        '''
+        Retrieve a page of followers for a given ID.
+
+        @param id [String] ID of the individual.
+        @param page_options [Hash] Options to be passed for retrieving a page of followers.
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__members('followers', id, page_options, scope)
+
+    async def blocked(self, id, page_options=None, scope=None):
+        '''
+        Retrieve a page of blocked individuals for a given ID.
+
+        @param id [String] ID of the individual.
+        @param page_options [Hash] Options to be passed for retrieving a page of blocked individuals.
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__members('blocked', id, page_options, scope)
+
+    async def blocked_by(self, id, page_options=None, scope=None):
+        '''
+        Retrieve a page of individuals who have blocked a given ID.
+
+        @param id [String] ID of the individual.
+        @param page_options [Hash] Options to be passed for retrieving a page of blocking individuals.
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__members('blocked_by', id, page_options, scope)
+
+    async def reciprocated(self, id, page_options=None, scope=None):
+        '''
+        Retrieve a page of individuals that have reciprocated a follow for a given ID.
+
+        @param id [String] ID of the individual.
+        @param page_options [Hash] Options to be passed for retrieving a page of individuals that have reciprocated a follow.
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__members('reciprocated', id, page_options, scope)
+
+    async def pending(self, id, page_options=None, scope=None):
+        '''
+        Retrieve a page of pending relationships for a given ID.
+
+        @param id [String] ID of the individual.
+        @param page_options [Hash] Options to be passed for retrieving a page of pending relationships.
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__members('pending', id, page_options, scope)
+
+    async def pending_with(self, id, page_options=None, scope=None):
+        '''
+        Retrieve a page of individuals that are waiting to approve the given ID.
+
+        @param id [String] ID of the individual.
+        @param page_options [Hash] Options to be passed for retrieving a page of pending relationships.
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__members('pending_with', id, page_options, scope)
+
+    async def following_page_count(self, id, page_size=None, scope=None):
+        '''
+        Count the number of pages of following relationships for an individual.
+
+        @param id [String] ID of the individual.
+        @param page_size [int] Page size (default: Amico.DEFAULTS['page_size']).
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__total_pages('following', id, page_size, scope)
+
+    async def followers_page_count(self, id, page_size=None, scope=None):
+        '''
+        Count the number of pages of follower relationships for an individual.
+
+        @param id [String] ID of the individual.
+        @param page_size [int] Page size (default: Amico.DEFAULTS['page_size']).
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__total_pages('followers', id, page_size, scope)
+
+    async def blocked_page_count(self, id, page_size=None, scope=None):
+        '''
+        Count the number of pages of blocked relationships for an individual.
+
+        @param id [String] ID of the individual.
+        @param page_size [int] Page size (default: Amico.DEFAULTS['page_size']).
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__total_pages('blocked', id, page_size, scope)
+
+    async def blocked_by_page_count(self, id, page_size=None, scope=None):
+        '''
+        Count the number of pages of blocked_by relationships for an individual.
+
+        @param id [String] ID of the individual.
+        @param page_size [int] Page size (default: Amico.DEFAULTS['page_size']).
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__total_pages('blocked_by', id, page_size, scope)
+
+    async def reciprocated_page_count(self, id, page_size=None, scope=None):
+        '''
+        Count the number of pages of reciprocated relationships for an individual.
+
+        @param id [String] ID of the individual.
+        @param page_size [int] Page size (default: Amico.DEFAULTS['page_size']).
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__total_pages('reciprocated', id, page_size, scope)
+
+    async def pending_page_count(self, id, page_size=None, scope=None):
+        '''
+        Count the number of pages of pending relationships for an individual.
+
+        @param id [String] ID of the individual.
+        @param page_size [int] Page size (default: Amico.DEFAULTS['page_size']).
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__total_pages('pending', id, page_size, scope)
+
+    async def pending_with_page_count(self, id, page_size=None, scope=None):
+        '''
+        Count the number of pages of individuals waiting to approve another individual.
+
+        @param id [String] ID of the individual.
+        @param page_size [int] Page size (default: Amico.DEFAULTS['page_size']).
+        @param scope [String] Scope for the call.
+        '''
+        return await self.__total_pages('pending_with', id, page_size, scope)
+
+    async def all(self, id, type, scope=None):
+        '''
+        Retrieve all of the individuals for a given id, type (e.g. following) and scope
+
+        @param id [String] ID of the individual.
+        @param type [String] One of 'following', 'followers', 'reciprocated', 'blocked', 'blocked_by', 'pending', 'pending_with'.
+        @param scope [String] Scope for the call.
+        '''
+        self._validate_relationship_type(type)
+        count = await self.__count(type, id, scope)
+        if count > 0:
+            return await self.__members(
+                type, id, {'page_size': count, 'page': 1}, scope)
+        else:
+            return []
+
+    async def count(self, id, type, scope=None):
+        '''
+        Retrieve a count of all of a given type of relationship for the specified id.
+
+        @param id [String] ID of the individual.
+        @param type [String] One of 'following', 'followers', 'reciprocated', 'blocked', 'blocked_by', 'pending', 'pending_with'.
+        @param scope [String] Scope for the call.
+        '''
+        self._validate_relationship_type(type)
+        return await self.__count(type, id, scope)
+
+    async def page_count(self, id, type, page_size=None, scope=None):
+        '''
+        Retrieve a page count of a given type of relationship for the specified id.
+
+        @param id [String] ID of the individual.
+        @param type [String] One of 'following', 'followers', 'reciprocated', 'blocked', 'blocked_by', 'pending', 'pending_with'.
+        @param page_size [int] Page size (default: Amico.DEFAULTS['page_size']).
+        @param scope [String] Scope for the call.
+        '''
+        self._validate_relationship_type(type)
+        return await self.__total_pages(type, id, page_size, scope)
+
+    # private methods
+
+    async def __add_following_followers_reciprocated(
+            self,
+            from_id,
+            to_ids,
+            scope=None):
+        '''
+        Add the following, followers and check for a reciprocated relationship. To be used from the
+        +follow_many+ and +accept+ methods.
+
+        @param from_id [String] The ID of the individual establishing the follow relationships.
+        @param to_ids [list] IDs of the individuals to be followed.
+        '''
+        if scope is None:
+            scope = self.options['default_scope_key']
+
+        if self.options['use_scripts']:
+            await self._accept_script(
+                **self._script_keys_and_args(from_id, to_ids, scope))
+            return
+
+        transaction = self.redis_connection.pipeline(transaction=True)
+        self._queue_following_followers(transaction, from_id, to_ids, scope)
+        results = await transaction.execute()
+
+        transaction = self.redis_connection.pipeline(
+            transaction=self.options['transactions'])
+        self._queue_reciprocated(transaction, from_id, to_ids, results, scope)
+        await transaction.execute()
+
+    async def __is_member(self, type, id, member_id, scope=None):
+        '''
+        Check to see if an ID is in an individual's relationship set.
+
+        @param type [String] Relationship type.
+        @param id [String] ID of the individual owning the set.
+        @param member_id [String] ID to look for.
+        @param scope [String] Scope for the call.
+        '''
+        if scope is None:
+            scope = self.options['default_scope_key']
+
+        key = self._key(type, scope, id)
+        if self._uses_sets(scope):
+            return bool(await self.redis_connection.sismember(key, member_id))
+        return await self.redis_connection.zscore(key, member_id) is not None
+
+    async def __count(self, type, id, scope=None):
+        '''
+        Count the number of individuals in a relationship set.
+
+        @param type [String] Relationship type.
+        @param id [String] ID of the individual.
+        @param scope [String] Scope for the call.
+        '''
+        if scope is None:
+            scope = self.options['default_scope_key']
+
+        key = self._key(type, scope, id)
+        if self._uses_sets(scope):
+            return await self.redis_connection.scard(key)
+        return await self.redis_connection.zcard(key)
+
+    async def __total_pages(self, type, id, page_size=None, scope=None):
+        '''
+        Count the total number of pages in a relationship set.
+
+        @param type [String] Relationship type.
+        @param id [String] ID of the individual.
+        @param page_size [int] Page size (default: Amico.DEFAULTS['page_size']).
+        @param scope [String] Scope for the call.
+        '''
+        if page_size is None:
+            page_size = self.DEFAULTS['page_size']
+
+        return self._total_pages_for(
+            await self.__count(type, id, scope), page_size)
+
+    async def __members(self, type, id, page_options=None, scope=None):
+        '''
+        Retrieve a page of items from a relationship set without scores.
+
+        @param type [String] Relationship type.
+        @param id [String] ID of the individual.
+        @param page_options [Hash] Options for paging. Cursor paging is not supported.
+        @param scope [String] Scope for the call.
+        '''
+        if scope is None:
+            scope = self.options['default_scope_key']
+
+        if page_options is None:
+            page_options = self._default_paging_options()
+
+        if 'cursor' in page_options:
+            raise Exception('AsyncAmico does not support cursor paging')
+
+        key = self._key(type, scope, id)
+        requested_offsets = self._requested_offsets(page_options)
+        transaction = self.redis_connection.pipeline(
+            transaction=self.options['transactions'])
+        self._queue_count(transaction, key, scope)
+        self._queue_range(
+            transaction, key, requested_offsets[0], requested_offsets[1], scope)
+        count, members = await transaction.execute()
+
+        starting_offset, ending_offset = self._page_offsets(count, page_options)
+        if (starting_offset, ending_offset) != requested_offsets:
+            transaction = self.redis_connection.pipeline(transaction=False)
+            self._queue_range(
+                transaction, key, starting_offset, ending_offset, scope)
+            members = (await transaction.execute())[0]
+        return members
@@ -0,0 +1,1166 @@
+import base64
+import math
+import time
+from collections import namedtuple
+
+from .key_schema import KeySchema
+from .memory import MemoryRedis
+from .sharding import ShardedRedis
+
+
+# Every relationship flag between a viewer (from_id) and another individual
+# (to_id), as returned by Amico#relationship_status.
+RelationshipStatus = namedtuple('RelationshipStatus', [
+    'following',
+    'followed_by',
+    'reciprocated',
+    'blocked',
+    'blocked_by',
+    'pending',
+    'pending_with'])
+
+
+class AmicoBase(object):
+    '''
+    Options, key construction, Lua scripts and paging logic shared by Amico and
+    AsyncAmico. Subclasses provide the methods that talk to Redis.
+    '''
+
+    DEFAULTS = {
+        'namespace': 'amico',
+        'following_key': 'following',
+        'followers_key': 'followers',
+        'blocked_key': 'blocked',
+        'blocked_by_key': 'blocked_by',
+        'reciprocated_key': 'reciprocated',
+        'pending_key': 'pending',
+        'pending_with_key': 'pending_with',
+        'pending_follow': False,
+        'default_scope_key': 'default',
+        'page_size': 25,
+        'use_scripts': True,
+        'chunk_size': 1000,
+        'compact_keys': False,
+        'scope_aliases': {},
+        'legacy_keys': None,
+        'set_scopes': [],
+        'cache_size': 0,
+        'intersection_ttl': 0,
+        'suggestion_sample_size': 100,
+        'lazy_reciprocated': False,
+        'cluster': False,
+        'workers': 8,
+        'write_buffer_size': 0,
+        'write_buffer_interval': 100,
+        'transactions': True,
+        'instrumentation': None
+    }
+
+    # Valid relationtionships that can be used in #all, #count, #page_count,
+    # etc...
+    VALID_RELATIONSHIPS = [
+        'following',
+        'followers',
+        'reciprocated',
+        'blocked',
+        'blocked_by',
+        'pending',
+        'pending_with']
+
+    # Pairs of (source, related) relationship types cleared by #clear, in
+    # order. The individual is removed from the related set of every ID in
+    # the source set.
+    CLEAR_RELATIONSHIPS = [
+        # no longer following (or followed by) anyone
+        ('following', 'followers'),
+        ('followers', 'following'),
+        ('reciprocated', 'reciprocated'),
+        # no longer blocked by (or blocking) anyone
+        ('blocked_by', 'blocked'),
+        ('blocked', 'blocked_by'),
+        # no longer pending with anyone (or have any pending followers)
+        ('pending_with', 'pending'),
+        ('pending', 'pending_with')]
+
+    # Lua scripts used for the relationship mutations when the use_scripts
+    # option is enabled. Every script receives the keys built by
+    # _relationship_keys and ARGV of from_id, a timestamp, an option flag, the
+    # storage ('zset' or 'set'), whether the reciprocated sets are maintained
+    # ('1') or derived on read ('0') and one or more to_ids. The operation is applied
+    # to each to_id in turn, so the checks and the writes for a whole batch
+    # happen in one round trip.
+    RELATIONSHIP_SCRIPT = '''
+local from_id, timestamp, option = ARGV[1], ARGV[2], ARGV[3]
+local sets = ARGV[4] == 'set'
+local materialized = ARGV[5] == '1'
+local following_from, followers_from, reciprocated_from, blocked_from,
+  blocked_by_from, pending_from, pending_with_from = unpack(KEYS, 1, 7)
+local to_id, following_to, followers_to, reciprocated_to, blocked_to,
+  blocked_by_to, pending_to, pending_with_to
+
+local function use_target(index)
+  to_id = ARGV[5 + index]
+  following_to, followers_to, reciprocated_to, blocked_to, blocked_by_to,
+    pending_to, pending_with_to = unpack(KEYS, index * 7 + 1, index * 7 + 7)
+end
+
+local function each_target(operation)
+  local outcomes = {}
+  for index = 1, #ARGV - 5 do
+    use_target(index)
+    outcomes[index] = operation()
+  end
+  return outcomes
+end
+
+local function add(key, member)
+  if sets then
+    redis.call('SADD', key, member)
+  else
+    redis.call('ZADD', key, timestamp, member)
+  end
+end
+
+local function remove(key, member)
+  redis.call(sets and 'SREM' or 'ZREM', key, member)
+end
+
+local function has(key, member)
+  if sets then
+    return redis.call('SISMEMBER', key, member) == 1
+  end
+  return redis.call('ZSCORE', key, member) ~= false
+end
+
+local function add_following_followers_reciprocated()
+  add(following_from, to_id)
+  add(followers_to, from_id)
+  remove(pending_to, from_id)
+  remove(pending_with_from, to_id)
+  if materialized and has(following_to, from_id) then
+    add(reciprocated_from, to_id)
+    add(reciprocated_to, from_id)
+  end
+  return 'followed'
+end
+
+local function follow()
+  if has(blocked_to, from_id) then
+    return 'blocked'
+  end
+  if option == '1' then
+    if not has(pending_to, from_id) then
+      add(pending_to, from_id)
+      add(pending_with_from, to_id)
+    end
+    return 'pending'
+  end
+  return add_following_followers_reciprocated()
+end
+
+local function unfollow()
+  remove(following_from, to_id)
+  remove(followers_to, from_id)
+  if materialized then
+    remove(reciprocated_from, to_id)
+    remove(reciprocated_to, from_id)
+  end
+  remove(pending_to, from_id)
+  remove(pending_with_from, to_id)
+  return 'unfollowed'
+end
+
+local function block()
+  remove(following_from, to_id)
+  remove(following_to, from_id)
+  remove(followers_to, from_id)
+  remove(followers_from, to_id)
+  if materialized then
+    remove(reciprocated_from, to_id)
+    remove(reciprocated_to, from_id)
+  end
+  remove(pending_from, to_id)
+  remove(pending_with_to, from_id)
+  add(blocked_from, to_id)
+  add(blocked_by_to, from_id)
+  return 'blocked'
+end
+
+local function unblock()
+  remove(blocked_from, to_id)
+  remove(blocked_by_to, from_id)
+  return 'unblocked'
+end
+
+local function deny()
+  remove(pending_to, from_id)
+  remove(pending_with_from, to_id)
+  return 'denied'
+end
+'''
+
+    FOLLOW_SCRIPT = RELATIONSHIP_SCRIPT + 'return each_target(follow)'
+    ACCEPT_SCRIPT = RELATIONSHIP_SCRIPT + \
+        'return each_target(add_following_followers_reciprocated)'
+    UNFOLLOW_SCRIPT = RELATIONSHIP_SCRIPT + 'return each_target(unfollow)'
+    BLOCK_SCRIPT = RELATIONSHIP_SCRIPT + 'return each_target(block)'
+    UNBLOCK_SCRIPT = RELATIONSHIP_SCRIPT + 'return each_target(unblock)'
+    DENY_SCRIPT = RELATIONSHIP_SCRIPT + 'return each_target(deny)'
+
+    # Retrieve the page of a sorted set (highest score first) that follows the
+    # member and score of a cursor. If the member is still in the set with the
+    # same score, the page starts right after its rank. Otherwise the page
+    # continues with the members tied on the cursor's score that sort before
+    # the cursor's member, then the members with lower scores.
+    MEMBERS_AFTER_SCRIPT = '''
+local key, score, member, size = KEYS[1], ARGV[1], ARGV[2], tonumber(ARGV[3])
+if member == '' then
+  return redis.call('ZREVRANGE', key, 0, size - 1, 'WITHSCORES')
+end
+local current = redis.call('ZSCORE', key, member)
+if current and tonumber(current) == tonumber(score) then
+  local start = redis.call('ZREVRANK', key, member) + 1
+  return redis.call('ZREVRANGE', key, start, start + size - 1, 'WITHSCORES')
+end
+local items = {}
+local ties = redis.call('ZREVRANGEBYSCORE', key, score, score, 'WITHSCORES')
+for index = 1, #ties, 2 do
+  if ties[index] < member and #items < size * 2 then
+    table.insert(items, ties[index])
+    table.insert(items, ties[index + 1])
+  end
+end
+if #items < size * 2 then
+  local rest = redis.call('ZREVRANGEBYSCORE', key, '(' .. score, '-inf',
+    'WITHSCORES', 'LIMIT', 0, size - #items / 2)
+  for index = 1, #rest do
+    table.insert(items, rest[index])
+  end
+end
+return items
+'''
+
+    # Move each legacy key (KEYS[i]) to its new name (KEYS[i + 1]). If both keys
+    # exist, for instance because a client unaware of the migration wrote to the
+    # legacy key, the sets are merged (keeping the latest timestamps for sorted
+    # sets). Afterwards
+    # at most one of the two keys exists.
+    MIGRATE_KEYS_SCRIPT = '''
+local migrated = 0
+for index = 1, #KEYS, 2 do
+  local legacy, key = KEYS[index], KEYS[index + 1]
+  if legacy ~= key and redis.call('EXISTS', legacy) == 1 then
+    if redis.call('EXISTS', key) == 1 then
+      if redis.call('TYPE', key).ok == 'set' then
+        redis.call('SUNIONSTORE', key, key, legacy)
+      else
+        redis.call('ZUNIONSTORE', key, 2, key, legacy, 'AGGREGATE', 'MAX')
+      end
+      redis.call('DEL', legacy)
+    else
+      redis.call('RENAME', legacy, key)
+    end
+    migrated = migrated + 1
+  end
+end
+return migrated
+'''
+
+    # Rank the second-degree connections of an individual. KEYS are the
+    # individual's following, blocked, blocked_by, pending and pending_with
+    # sets, then the relationship sets of the sampled first-degree connections.
+    # At most ARGV[2] IDs are read from each of those sets (the most recent for
+    # sorted sets, a random sample for sets), and each ID is scored by the
+    # number of sets it was found in. Returns up to ARGV[3] pairs of ID and
+    # score, best first, skipping the individual and any ID in the first five
+    # sets. If ARGV[5] is 'lazy', each connection is given as its following,
+    # followers and intersection keys instead, and is sampled from the
+    # intersection, which is then expired after ARGV[6] seconds or deleted.
+    SUGGESTIONS_SCRIPT = '''
+local id, size, limit = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[3])
+local sets = ARGV[4] == 'set'
+local lazy, ttl = ARGV[5] == 'lazy', tonumber(ARGV[6])
+local excluded = 5
+local paths, candidates = {}, {}
+for index = excluded + 1, #KEYS, lazy and 3 or 1 do
+  local sample
+  if lazy then
+    local intersection = KEYS[index + 2]
+    redis.call('ZINTERSTORE', intersection, 2, KEYS[index], KEYS[index + 1], 'AGGREGATE', 'MAX')
+    if sets then
+      sample = redis.call('SORT', intersection, 'LIMIT', 0, size)
+    else
+      sample = redis.call('ZREVRANGE', intersection, 0, size - 1)
+    end
+    if ttl > 0 then
+      redis.call('EXPIRE', intersection, ttl)
+    else
+      redis.call('DEL', intersection)
+    end
+  elseif sets then
+    sample = redis.call('SRANDMEMBER', KEYS[index], size)
+  else
+    sample = redis.call('ZREVRANGE', KEYS[index], 0, size - 1)
+  end
+  for _, candidate in ipairs(sample) do
+    if candidate ~= id then
+      if paths[candidate] == nil then
+        paths[candidate] = 0
+        table.insert(candidates, candidate)
+      end
+      paths[candidate] = paths[candidate] + 1
+    end
+  end
+end
+table.sort(candidates, function(a, b)
+  if paths[a] ~= paths[b] then
+    return paths[a] > paths[b]
+  end
+  return a < b
+end)
+local suggestions = {}
+for _, candidate in ipairs(candidates) do
+  if #suggestions >= limit * 2 then
+    break
+  end
+  local allowed = true
+  for index = 1, excluded do
+    if sets then
+      allowed = redis.call('SISMEMBER', KEYS[index], candidate) == 0
+    else
+      allowed = redis.call('ZSCORE', KEYS[index], candidate) == false
+    end
+    if not allowed then
+      break
+    end
+  end
+  if allowed then
+    table.insert(suggestions, candidate)
+    table.insert(suggestions, paths[candidate])
+  end
+end
+return suggestions
+'''
+
+    def __init__(self, options=DEFAULTS, redis_connection=None):
+        '''
+        Initialize a new class for establishing relationships.
+
+        @param options [dictionary] (Default: Amico.DEFAULTS)
+        @param redis_connection [redis] Redis connection
+        '''
+        self.options = AmicoBase.DEFAULTS.copy()
+        self.options.update(options)
+        self.redis_connection = redis_connection
+        self._zmscore_supported = True
+        self._zintercard_supported = True
+        # Keys are spread over several hash slots or nodes, and every key of an
+        # individual is kept together with a hash tag.
+        self._partitioned = self.options['cluster'] or isinstance(
+            redis_connection, ShardedRedis)
+        self.key_schema = KeySchema(self.options, self._partitioned)
+        self.legacy_key_schema = None
+        if self.options['legacy_keys'] is not None:
+            legacy_options = AmicoBase.DEFAULTS.copy()
+            legacy_options.update(self.options['legacy_keys'])
+            self.legacy_key_schema = KeySchema(legacy_options)
+
+        # Scripts touch the keys of several individuals, which live in different
+        # hash slots or nodes.
+        if self._partitioned:
+            self.options['use_scripts'] = False
+
+        # The in-memory backend has no Lua interpreter.
+        if isinstance(redis_connection, MemoryRedis):
+            self.options['use_scripts'] = False
+
+        if self.options['use_scripts']:
+            self._register_scripts()
+
+    # protected methods, shared with subclasses
+
+    def _register_scripts(self):
+        '''
+        Register the Lua scripts used for relationship mutations. Registered scripts
+        are sent with EVALSHA and loaded into Redis automatically if the server
+        responds with NOSCRIPT.
+        '''
+        self._follow_script = self.redis_connection.register_script(
+            self.FOLLOW_SCRIPT)
+        self._accept_script = self.redis_connection.register_script(
+            self.ACCEPT_SCRIPT)
+        self._unfollow_script = self.redis_connection.register_script(
+            self.UNFOLLOW_SCRIPT)
+        self._block_script = self.redis_connection.register_script(
+            self.BLOCK_SCRIPT)
+        self._unblock_script = self.redis_connection.register_script(
+            self.UNBLOCK_SCRIPT)
+        self._deny_script = self.redis_connection.register_script(
+            self.DENY_SCRIPT)
+        self._members_after_script = self.redis_connection.register_script(
+            self.MEMBERS_AFTER_SCRIPT)
+        self._migrate_keys_script = self.redis_connection.register_script(
+            self.MIGRATE_KEYS_SCRIPT)
+        self._suggestions_script = self.redis_connection.register_script(
+            self.SUGGESTIONS_SCRIPT)
+
+    def _script_keys_and_args(self, from_id, to_ids, scope, option=0):
+        '''
+        Build the keys and arguments for running a relationship script.
+
+        @param from_id [String] The ID of the individual initiating the change.
+        @param to_ids [list] IDs of the other individuals.
+        @param scope [String] Scope for the call.
+        @param option [int] Flag passed to the script (e.g. pending follow).
+        @return a dictionary of keys and args to be passed to the script.
+        '''
+        return {
+            'keys': self._relationship_keys(from_id, to_ids, scope),
+            'args': [from_id, int(time.time()), option,
+                     'set' if self._uses_sets(scope) else 'zset',
+                     0 if self.options['lazy_reciprocated'] else 1] + list(to_ids)
+        }
+
+    def _script_outcomes(self, to_ids, outcomes):
+        '''
+        Map the outcomes returned by a relationship script to the IDs they belong to.
+
+        @param to_ids [list] IDs the script was run for.
+        @param outcomes [list] Outcomes returned by the script.
+        @return a dictionary of to_id to outcome.
+        '''
+        return dict(
+            (to_id, self._decode(outcome))
+            for to_id, outcome in zip(to_ids, outcomes))
+
+    def _uses_sets(self, scope):
+        '''
+        Check to see if relationships in a scope are stored in Redis sets rather than sorted sets.
+
+        @param scope [String] Scope for the call.
+        @return true if the scope is listed in the set_scopes option.
+        '''
+        return scope in self.options['set_scopes']
+
+    def _queue_add(self, transaction, key, member_id, scope):
+        '''
+        Queue the command adding an ID to a relationship set, scored with the current
+        time unless the scope is stored in Redis sets.
+
+        @param transaction [pipeline] Pipeline to queue the command on.
+        @param key [String] Redis key.
+        @param member_id [String] ID to add.
+        @param scope [String] Scope for the call.
+        '''
+        if self._uses_sets(scope):
+            transaction.sadd(key, member_id)
+        else:
+            transaction.zadd(key, {member_id: int(time.time())})
+
+    def _queue_remove(self, transaction, key, member_ids, scope):
+        '''
+        Queue the command removing IDs from a relationship set.
+
+        @param transaction [pipeline] Pipeline to queue the command on.
+        @param key [String] Redis key.
+        @param member_ids [list] IDs to remove.
+        @param scope [String] Scope for the call.
+        '''
+        if self._uses_sets(scope):
+            transaction.srem(key, *member_ids)
+        else:
+            transaction.zrem(key, *member_ids)
+
+    def _queue_is_member(self, transaction, key, member_id, scope):
+        '''
+        Queue the command checking whether an ID is in a relationship set. Use _found
+        to interpret the result.
+
+        @param transaction [pipeline] Pipeline to queue the command on.
+        @param key [String] Redis key.
+        @param member_id [String] ID to look for.
+        @param scope [String] Scope for the call.
+        '''
+        if self._uses_sets(scope):
+            transaction.sismember(key, member_id)
+        else:
+            transaction.zscore(key, member_id)
+
+    def _found(self, result, scope):
+        '''
+        Interpret the result of a command queued by _queue_is_member.
+
+        @param result Result of SISMEMBER or ZSCORE.
+        @param scope [String] Scope for the call.
+        @return true if the ID is in the set.
+        '''
+        if self._uses_sets(scope):
+            return bool(result)
+        return result is not None
+
+    def _queue_count(self, transaction, key, scope):
+        '''
+        Queue the command counting the IDs in a relationship set.
+
+        @param transaction [pipeline] Pipeline to queue the command on.
+        @param key [String] Redis key.
+        @param scope [String] Scope for the call.
+        '''
+        if self._uses_sets(scope):
+            transaction.scard(key)
+        else:
+            transaction.zcard(key)
+
+    def _queue_range(self, transaction, key, starting_offset, ending_offset, scope):
+        '''
+        Queue the command retrieving a range of IDs from a relationship set. Sorted sets are
+        ordered by most recent first. Redis sets have no timestamps, so they are ordered by
+        ascending ID instead, which requires numeric IDs.
+
+        @param transaction [pipeline] Pipeline to queue the command on.
+        @param key [String] Redis key.
+        @param starting_offset [int] Offset of the first ID.
+        @param ending_offset [int] Offset of the last ID (inclusive).
+        @param scope [String] Scope for the call.
+        '''
+        if self._uses_sets(scope):
+            transaction.sort(
+                key, start=starting_offset,
+                num=ending_offset - starting_offset + 1)
+        else:
+            transaction.zrevrange(
+                key, starting_offset, ending_offset, withscores=False)
+
+    def _queue_sample(self, transaction, key, size, scope):
+        '''
+        Queue the command retrieving a bounded sample of the IDs in a relationship set: the
+        most recent IDs for sorted sets, or random IDs for Redis sets, which have no timestamps.
+
+        @param transaction [pipeline] Pipeline to queue the command on.
+        @param key [String] Redis key.
+        @param size [int] Maximum number of IDs to retrieve.
+        @param scope [String] Scope for the call.
+        '''
+        if self._uses_sets(scope):
+            transaction.srandmember(key, size)
+        else:
+            transaction.zrevrange(key, 0, size - 1)
+
+    def _queue_reciprocated_sample(self, transaction, id, size, scope):
+        '''
+        Queue the commands retrieving a bounded sample of an individual's reciprocated
+        relationships when the lazy_reciprocated option is set, from the intersection of their
+        following and followers sets. The sample is the result of the second of the three
+        commands queued.
+
+        @param transaction [pipeline] Pipeline to queue the commands on.
+        @param id [String] ID of the individual.
+        @param size [int] Maximum number of IDs to retrieve.
+        @param scope [String] Scope for the call.
+        '''
+        self._queue_intersection(
+            transaction, self._reciprocated_keys(id, scope),
+            {'page': 1, 'page_size': size}, scope, 'MAX')
+
+    def _key(self, type, scope, id):
+        '''
+        Build the Redis key for a relationship type, scope and ID.
+
+        @param type [String] One of 'following', 'followers', 'reciprocated', 'blocked', 'blocked_by', 'pending', 'pending_with'.
+        @param scope [String] Scope for the call.
+        @param id [String] ID of the individual.
+        @return the Redis key for the relationship set.
+        '''
+        return self.key_schema.key(type, scope, id)
+
+    def _legacy_key(self, key):
+        '''
+        Retrieve the legacy key holding the data of a key while keys are migrated
+        from the schema described by the legacy_keys option.
+
+        @param key [String] Redis key in the current schema.
+        @return the legacy key, or None if no migration is configured.
+        '''
+        if self.legacy_key_schema is None:
+            return None
+        type, scope, id = self.key_schema.parse(key)
+        return self.legacy_key_schema.key(type, scope, id)
+
+    def _migration_pairs(self, keys):
+        '''
+        Pair keys in the current schema with their legacy keys, as expected by the
+        key migration script.
+
+        @param keys [list] Redis keys in the current schema.
+        @return a flat list of legacy key, key pairs.
+        '''
+        pairs = []
+        for key in keys:
+            pairs.extend([self._legacy_key(key), key])
+        return pairs
+
+    def _intersection_key(self, keys):
+        '''
+        Build the key holding the intersection of relationship sets.
+
+        @param keys [list] Redis keys of the intersected sets.
+        @return the Redis key for the intersection.
+        '''
+        return '%s:intersection:%s' % (
+            self.key_schema.namespace, '|'.join(keys))
+
+    def _queue_intersection(
+            self, transaction, keys, page_options, scope, aggregate=None):
+        '''
+        Queue the commands storing the intersection of relationship sets, retrieving
+        the requested page of it and expiring it (or deleting it if the intersection_ttl
+        option is not set). Members are scored with their score in the first set, or
+        with the aggregate of their scores in every set if an aggregate is given.
+
+        @param transaction [pipeline] Pipeline to queue the commands on.
+        @param keys [list] Redis keys of the intersected sets.
+        @param page_options [Hash] Options for paging, or None to only store the intersection.
+        @param scope [String] Scope for the call.
+        @param aggregate [String] 'MIN' or 'MAX' to score members by their scores in every set.
+        '''
+        intersection_key = self._intersection_key(keys)
+        if aggregate is None:
+            weights = dict((key, 0) for key in keys)
+            weights[keys[0]] = 1
+        else:
+            weights = dict((key, 1) for key in keys)
+        transaction.zinterstore(intersection_key, weights, aggregate=aggregate)
+        if page_options is not None:
+            starting_offset, ending_offset = self._requested_offsets(page_options)
+            self._queue_range(
+                transaction, intersection_key, starting_offset, ending_offset, scope)
+        if self.options['intersection_ttl'] > 0:
+            transaction.expire(
+                intersection_key, self.options['intersection_ttl'])
+        else:
+            transaction.delete(intersection_key)
+
+    def _queue_intersection_count(self, transaction, keys, aggregate=None):
+        '''
+        Queue the commands counting the members of the intersection of relationship sets:
+        a single ZINTERCARD, or a stored intersection if the server does not support ZINTERCARD.
+        The count is the result of the first command.
+
+        @param transaction [pipeline] Pipeline to queue the commands on.
+        @param keys [list] Redis keys of the intersected sets.
+        @param aggregate [String] Aggregate used if the intersection is stored, see _queue_intersection.
+        @return the number of commands queued.
+        '''
+        if self._zintercard_supported:
+            transaction.zintercard(len(keys), keys)
+            return 1
+        self._queue_intersection(transaction, keys, None, None, aggregate)
+        return 2
+
+    def _reciprocated_keys(self, id, scope):
+        '''
+        Build the keys of the sets whose intersection is an individual's reciprocated
+        relationships when the lazy_reciprocated option is set.
+
+        @param id [String] ID of the individual.
+        @param scope [String] Scope for the call.
+        @return the keys of the following and followers sets.
+        '''
+        return [self._key('following', scope, id), self._key('followers', scope, id)]
+
+    def _suggestion_exclusion_keys(self, id, scope):
+        '''
+        Build the keys of the relationship sets whose IDs are never suggested to an individual.
+
+        @param id [String] ID of the individual.
+        @param scope [String] Scope for the call.
+        @return the keys of the following, blocked, blocked_by, pending and pending_with sets.
+        '''
+        return [
+            self._key(type, scope, id)
+            for type in ['following', 'blocked', 'blocked_by', 'pending', 'pending_with']]
+
+    def _rank_suggestions(self, id, samples):
+        '''
+        Score the IDs found in samples of relationship sets by the number of samples they
+        appear in.
+
+        @param id [String] ID of the individual the suggestions are for, which is skipped.
+        @param samples [list] Lists of IDs sampled from relationship sets.
+        @return a list of (ID, score) pairs, best first and then by ID.
+        '''
+        paths = {}
+        for sample in samples:
+            for candidate in sample:
+                candidate = self._decode(candidate)
+                if candidate != str(id):
+                    paths[candidate] = paths.get(candidate, 0) + 1
+        return sorted(paths.items(), key=lambda item: (-item[1], item[0]))
+
+    def _relationship_keys(self, from_id, to_ids, scope):
+        '''
+        Build the keys of every relationship set for one ID and one or more other IDs,
+        in the order expected by the Lua scripts: each type in VALID_RELATIONSHIPS for
+        from_id, followed by each type for every to_id.
+
+        @param from_id [String] The ID of the individual initiating the change.
+        @param to_ids [list] IDs of the other individuals.
+        @param scope [String] Scope for the call.
+        @return a list of Redis keys.
+        '''
+        keys = []
+        for id in [from_id] + list(to_ids):
+            for type in self.VALID_RELATIONSHIPS:
+                keys.append(self._key(type, scope, id))
+        return keys
+
+    def _decode(self, value):
+        '''
+        Decode a value read from Redis into a string.
+
+        @param value [bytes] Value returned by Redis.
+        @return the value as a string.
+        '''
+        if isinstance(value, bytes):
+            return value.decode('utf-8')
+        return value
+
+    def _exclude_self(self, from_id, to_ids, outcomes):
+        '''
+        Remove from_id from a list of IDs, recording a 'self' outcome for it.
+
+        @param from_id [String] The ID of the individual initiating the change.
+        @param to_ids [list] IDs of the other individuals.
+        @param outcomes [dictionary] Outcomes to record the 'self' outcome in.
+        @return the IDs other than from_id.
+        '''
+        remaining_ids = []
+        for to_id in to_ids:
+            if to_id == from_id:
+                outcomes[to_id] = 'self'
+            else:
+                remaining_ids.append(to_id)
+        return remaining_ids
+
+    def _validate_relationship_type(self, type):
+        '''
+        Ensure that a relationship type is valid.
+
+        @param type [String] One of 'following', 'followers', 'reciprocated', 'blocked', 'blocked_by', 'pending', 'pending_with'.
+        @raise [StandardError] if the type is not included in VALID_RELATIONSHIPS
+        '''
+        if type not in self.VALID_RELATIONSHIPS:
+            raise Exception('Invalid relationship type given %s' % type)
+
+    def _queue_follow_checks(self, transaction, from_id, to_ids, scope):
+        '''
+        Queue the block and pending checks made before following without scripts.
+
+        @param transaction [pipeline] Pipeline to queue the commands on.
+        @param from_id [String] The ID of the individual establishing the follow relationships.
+        @param to_ids [list] IDs of the individuals to be followed.
+        @param scope [String] Scope for the call.
+        '''
+        for to_id in to_ids:
+            self._queue_is_member(
+                transaction, self._key('blocked', scope, to_id), from_id, scope)
+            self._queue_is_member(
+                transaction, self._key('pending', scope, to_id), from_id, scope)
+
+    def _allowed_follow_ids(self, to_ids, checks, outcomes, scope):
+        '''
+        Determine which IDs may be followed from the results of the follow checks,
+        recording a 'blocked' or 'pending' outcome for the others.
+
+        @param to_ids [list] IDs of the individuals to be followed.
+        @param checks [list] Results of the commands queued by _queue_follow_checks.
+        @param outcomes [dictionary] Outcomes to record in.
+        @param scope [String] Scope for the call.
+        @return the IDs that may be followed.
+        '''
+        allowed_ids = []
+        for index, to_id in enumerate(to_ids):
+            if self._found(checks[2 * index], scope):
+                outcomes[to_id] = 'blocked'
+            elif self.options['pending_follow'] and self._found(checks[2 * index + 1], scope):
+                outcomes[to_id] = 'pending'
+            else:
+                allowed_ids.append(to_id)
+        return allowed_ids
+
+    def _queue_pending(self, transaction, from_id, to_ids, scope, outcomes):
+        '''
+        Queue the commands adding pending follow relationships.
+
+        @param transaction [pipeline] Pipeline to queue the commands on.
+        @param from_id [String] The ID of the individual establishing the follow relationships.
+        @param to_ids [list] IDs of the individuals to be followed.
+        @param scope [String] Scope for the call.
+        @param outcomes [dictionary] Outcomes to record in.
+        '''
+        for to_id in to_ids:
+            self._queue_add(
+                transaction, self._key('pending', scope, to_id), from_id, scope)
+            self._queue_add(
+                transaction, self._key('pending_with', scope, from_id), to_id, scope)
+            outcomes[to_id] = 'pending'
+
+    def _queue_following_followers(self, transaction, from_id, to_ids, scope):
+        '''
+        Queue the commands adding following and followers relationships, followed by
+        one reciprocation check per ID unless the lazy_reciprocated option is set.
+
+        @param transaction [pipeline] Pipeline to queue the commands on.
+        @param from_id [String] The ID of the individual establishing the follow relationships.
+        @param to_ids [list] IDs of the individuals to be followed.
+        @param scope [String] Scope for the call.
+        '''
+        for to_id in to_ids:
+            self._queue_add(
+                transaction, self._key('following', scope, from_id), to_id, scope)
+            self._queue_add(
+                transaction, self._key('followers', scope, to_id), from_id, scope)
+            self._queue_remove(
+                transaction, self._key('pending', scope, to_id), [from_id], scope)
+            self._queue_remove(
+                transaction, self._key('pending_with', scope, from_id), [to_id], scope)
+        if self.options['lazy_reciprocated']:
+            return
+        for to_id in to_ids:
+            self._queue_is_member(
+                transaction, self._key('following', scope, to_id), from_id, scope)
+
+    def _queue_reciprocated(self, transaction, from_id, to_ids, results, scope):
+        '''
+        Queue the commands adding reciprocated relationships.
+
+        @param transaction [pipeline] Pipeline to queue the commands on.
+        @param from_id [String] The ID of the individual establishing the follow relationships.
+        @param to_ids [list] IDs of the individuals followed.
+        @param results [list] Results of the commands queued by _queue_following_followers.
+        @param scope [String] Scope for the call.
+        '''
+        if self.options['lazy_reciprocated']:
+            return
+        for to_id, result in zip(to_ids, results[-len(to_ids):]):
+            if self._found(result, scope):
+                self._queue_add(
+                    transaction, self._key('reciprocated', scope, from_id), to_id, scope)
+                self._queue_add(
+                    transaction, self._key('reciprocated', scope, to_id), from_id, scope)
+
+    def _queue_unfollow(self, transaction, from_id, to_ids, scope, outcomes):
+        '''
+        Queue the commands removing follow relationships.
+
+        @param transaction [pipeline] Pipeline to queue the commands on.
+        @param from_id [String] The ID of the individual removing the follow relationships.
+        @param to_ids [list] IDs of the individuals to be unfollowed.
+        @param scope [String] Scope for the call.
+        @param outcomes [dictionary] Outcomes to record in.
+        '''
+        for to_id in to_ids:
+            self._queue_remove(
+                transaction, self._key('following', scope, from_id), [to_id], scope)
+            self._queue_remove(
+                transaction, self._key('followers', scope, to_id), [from_id], scope)
+            if not self.options['lazy_reciprocated']:
+                self._queue_remove(
+                    transaction, self._key('reciprocated', scope, from_id), [to_id], scope)
+                self._queue_remove(
+                    transaction, self._key('reciprocated', scope, to_id), [from_id], scope)
+            self._queue_remove(
+                transaction, self._key('pending', scope, to_id), [from_id], scope)
+            self._queue_remove(
+                transaction, self._key('pending_with', scope, from_id), [to_id], scope)
+            outcomes[to_id] = 'unfollowed'
+
+    def _queue_block(self, transaction, from_id, to_id, scope):
+        '''
+        Queue the commands blocking a relationship.
+
+        @param transaction [pipeline] Pipeline to queue the commands on.
+        @param from_id [String] The ID of the individual blocking the relationship.
+        @param to_id [String] The ID of the individual being blocked.
+        @param scope [String] Scope for the call.
+        '''
+        self._queue_remove(
+            transaction, self._key('following', scope, from_id), [to_id], scope)
+        self._queue_remove(
+            transaction, self._key('following', scope, to_id), [from_id], scope)
+        self._queue_remove(
+            transaction, self._key('followers', scope, to_id), [from_id], scope)
+        self._queue_remove(
+            transaction, self._key('followers', scope, from_id), [to_id], scope)
+        if not self.options['lazy_reciprocated']:
+            self._queue_remove(
+                transaction, self._key('reciprocated', scope, from_id), [to_id], scope)
+            self._queue_remove(
+                transaction, self._key('reciprocated', scope, to_id), [from_id], scope)
+        self._queue_remove(
+            transaction, self._key('pending', scope, from_id), [to_id], scope)
+        self._queue_remove(
+            transaction, self._key('pending_with', scope, to_id), [from_id], scope)
+        self._queue_add(
+            transaction, self._key('blocked', scope, from_id), to_id, scope)
+        self._queue_add(
+            transaction, self._key('blocked_by', scope, to_id), from_id, scope)
+
+    def _queue_unblock(self, transaction, from_id, to_id, scope):
+        '''
+        Queue the commands unblocking a relationship.
+
+        @param transaction [pipeline] Pipeline to queue the commands on.
+        @param from_id [String] The ID of the individual unblocking the relationship.
+        @param to_id [String] The ID of the blocked individual.
+        @param scope [String] Scope for the call.
+        '''
+        self._queue_remove(
+            transaction, self._key('blocked', scope, from_id), [to_id], scope)
+        self._queue_remove(
+            transaction, self._key('blocked_by', scope, to_id), [from_id], scope)
+
+    def _queue_deny(self, transaction, from_id, to_id, scope):
+        '''
+        Queue the commands denying a pending relationship.
+
+        @param transaction [pipeline] Pipeline to queue the commands on.
+        @param from_id [String] The ID of the individual denying the relationship.
+        @param to_id [String] The ID of the individual to be denied.
+        @param scope [String] Scope for the call.
+        '''
+        self._queue_remove(
+            transaction, self._key('pending', scope, to_id), [from_id], scope)
+        self._queue_remove(
+            transaction, self._key('pending_with', scope, from_id), [to_id], scope)
+
+    def _queue_clear_chunk(
+            self,
+            transaction,
+            id,
+            source_key,
+            related_type,
+            related_ids,
+            scope):
+        '''
+        Queue the commands removing a chunk of an individual's relationships: the
+        individual is removed from the related set of every ID in the chunk, and the
+        chunk is removed from the source set.
+
+        @param transaction [pipeline] Pipeline to queue the commands on.
+        @param id [String] The ID of the individual to clear info for.
+        @param source_key [String] Key of the source set.
+        @param related_type [String] The relationship type of the sets that the individual needs to be removed from.
+        @param related_ids [list] IDs read from the source set.
+        @param scope [String] Scope for the call.
+        '''
+        for related_id in related_ids:
+            self._queue_remove(
+                transaction,
+                self._key(related_type, scope, self._decode(related_id)),
+                [id],
+                scope)
+        self._queue_remove(transaction, source_key, related_ids, scope)
+
+    def _queue_scores(self, transaction, key, member_ids, scope):
+        '''
+        Queue the commands retrieving the scores of a list of IDs in a Redis sorted set:
+        a single ZMSCORE, or one ZSCORE per ID if the server does not support ZMSCORE.
+        Scopes stored in Redis sets use SMISMEMBER and SISMEMBER instead.
+
+        @param transaction [pipeline] Pipeline to queue the commands on.
+        @param key [String] Redis key.
+        @param member_ids [list] IDs to retrieve the scores for.
+        @param scope [String] Scope for the call.
+        '''
+        if self._zmscore_supported:
+            if self._uses_sets(scope):
+                transaction.smismember(key, member_ids)
+            else:
+                transaction.zmscore(key, member_ids)
+        else:
+            for member_id in member_ids:
+                self._queue_is_member(transaction, key, member_id, scope)
+
+    def _scores_from_results(self, results, member_count, scope):
+        '''
+        Group the results of the commands queued by _queue_scores into one list of scores per key.
+        Sets have no scores, so IDs found in scopes stored in Redis sets are given a score of 1.
+
+        @param results [list] Results of the pipeline.
+        @param member_count [int] Number of IDs the scores were retrieved for.
+        @param scope [String] Scope for the call.
+        @return a list of lists of scores (None for missing IDs).
+        '''
+        if self._zmscore_supported:
+            scores = results
+        else:
+            scores = [results[index:index + member_count]
+                      for index in range(0, len(results), member_count)]
+        if self._uses_sets(scope):
+            scores = [[1 if found else None for found in key_scores]
+                      for key_scores in scores]
+        return scores
+
+    def _status_keys(self, from_id, scope):
+        '''
+        Build the keys of from_id's sets read for a relationship status, in the order
+        expected by _relationship_statuses.
+
+        @param from_id [String] ID of the viewing individual.
+        @param scope [String] Scope for the call.
+        @return a list of Redis keys.
+        '''
+        return [self._key(type, scope, from_id) for type in [
+            'following', 'followers', 'blocked', 'blocked_by', 'pending_with', 'pending']]
+
+    def _relationship_statuses(self, scores):
+        '''
+        Build relationship statuses from the scores of the other individuals in the sets
+        returned by _status_keys.
+
+        @param scores [list] Lists of scores, one list per key.
+        @return a list of RelationshipStatus, one per individual.
+        '''
+        statuses = []
+        for following, followers, blocked, blocked_by, pending_with, pending in zip(*scores):
+            statuses.append(RelationshipStatus(
+                following=following is not None,
+                followed_by=followers is not None,
+                reciprocated=following is not None and followers is not None,
+                blocked=blocked is not None,
+                blocked_by=blocked_by is not None,
+                pending=pending_with is not None,
+                pending_with=pending is not None))
+        return statuses
+
+    def _is_unknown_command(self, error):
+        '''
+        Check to see if an error from Redis was caused by a command the server does not support.
+
+        The Redis Cluster client rejects such commands itself, before sending them.
+
+        @param error [RedisError] Error raised by the Redis client.
+        @return true if the command is unknown to the server.
+        '''
+        message = str(error).lower()
+        return 'unknown command' in message or "doesn't exist in redis commands" in message
+
+    def _default_paging_options(self):
+        '''
+        Default paging options.
+
+        @return a hash of the default paging options.
+        '''
+        default_options = {
+            'page_size': self.DEFAULTS['page_size'],
+            'page': 1
+        }
+
+        return default_options
+
+    def _encode_cursor(self, score, member):
+        '''
+        Build an opaque cursor from the score and member of the last item on a page.
+
+        @param score [float] Score of the last item.
+        @param member [String] Member of the last item.
+        @return the cursor.
+        '''
+        cursor = '%.17g:%s' % (score, self._decode(member))
+        return base64.urlsafe_b64encode(cursor.encode('utf-8')).decode('ascii')
+
+    def _decode_cursor(self, cursor):
+        '''
+        Read the score and member from a cursor built by _encode_cursor.
+
+        @param cursor [String] Cursor, or None for the first page.
+        @return a tuple of the score and member, or (None, None) for the first page.
+        '''
+        if cursor is None:
+            return None, None
+        score, member = base64.urlsafe_b64decode(
+            cursor.encode('ascii')).decode('utf-8').split(':', 1)
+        return float(score), member
+
+    def _members_after_result(self, items, options):
+        '''
+        Store the cursor for the page after a list of (member, score) items in the
+        paging options, and return the members.
+
+        @param items [list] Members and scores of the page.
+        @param options [Hash] Options for paging; the cursor is updated in place, and
+          set to None if there are no more items.
+        @return the members of the page.
+        '''
+        if len(items) < options.get('page_size', self.DEFAULTS['page_size']):
+            options['cursor'] = None
+        else:
+            options['cursor'] = self._encode_cursor(items[-1][1], items[-1][0])
+        return [member for member, score in items]
+
+    def _total_pages_for(self, count, page_size):
+        '''
+        Count the total number of pages for a number of items.
+
+        @param count [int] Number of items.
+        @param page_size [int] Page size from which to calculate total pages.
+        @return total number of pages.
+        '''
+        return int(math.ceil(count / float(page_size)))
+
+    def _requested_offsets(self, options):
+        '''
+        Compute the offsets for the requested page before it is known how many pages
+        there are, so the page can be retrieved in the same round trip as the count.
+
+        @param options [Hash] Options for paging; a page below 1 is clamped in place.
+        @return a tuple of the starting and ending offsets for Redis.
+        '''
+        if options['page'] < 1:
+            options['page'] = 1
+
+        starting_offset = (options['page'] - 1) * options['page_size']
+        return starting_offset, (starting_offset + options['page_size']) - 1
+
+    def _page_result(self, members, count, options):
+        '''
+        Build the result of retrieving a page with its totals.
+
+        @param members [list] Members of the page.
+        @param count [int] Number of items in the Redis sorted set.
+        @param options [Hash] Options for paging, after the page has been clamped.
+        @return a hash of the members, page, page size, total count and total pages.
+        '''
+        return {
+            'members': members,
+            'page': options['page'],
+            'page_size': options['page_size'],
+            'total_count': count,
+            'total_pages': self._total_pages_for(count, options['page_size'])
+        }
+
+    def _page_offsets(self, count, options):
+        '''
+        Clamp the requested page to the pages available for a number of items and
+        compute the offsets to retrieve it with.
+
+        @param count [int] Number of items in the Redis sorted set.
+        @param options [Hash] Options for paging; the page is clamped in place.
+        @return a tuple of the starting and ending offsets for Redis.
+        '''
+        if options['page'] < 1:
+            options['page'] = 1
+
+        total_pages = self._total_pages_for(count, options['page_size'])
+        if options['page'] > total_pages:
+            options['page'] = total_pages
+
+        index_for_redis = options['page'] - 1
+        starting_offset = (index_for_redis * options['page_size'])
+
+        if starting_offset < 0:
+            starting_offset = 0
+
+        ending_offset = (starting_offset + options['page_size']) - 1
+        return starting_offset, ending_offset
@@ -0,0 +1,111 @@
+import threading
+from collections import OrderedDict
+
+
+class RelationshipCache(object):
+    '''
+    Bounded, thread-safe LRU cache of values read from relationship sets, such as
+    membership checks and counts. Entries are grouped by Redis key so that every value
+    read from a key can be invalidated at once.
+
+    A value read from Redis may already be stale by the time it is stored, if the key
+    was invalidated while the read was in flight. To prevent this, take a token before
+    reading and pass it to #set: the value is only stored if the key has not been
+    invalidated since the token was taken.
+    '''
+
+    def __init__(self, size):
+        '''
+        Initialize a new cache.
+
+        @param size [int] Maximum number of values to keep.
+        '''
+        self.size = size
+        self.__entries = OrderedDict()
+        self.__fields = {}
+        self.__invalidations = OrderedDict()
+        self.__counter = 0
+        self.__floor = 0
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get(self, key, field):
+        '''
+        Retrieve a cached value.
+
+        @param key [String] Redis key the value was read from.
+        @param field [String] What was read from the key (e.g. a member ID).
+        @return a tuple of whether the value was found and the value.
+        '''
+        with self.__lock:
+            entry = (key, field)
+            if entry not in self.__entries:
+                return False, None
+            self.__entries.move_to_end(entry)
+            return True, self.__entries[entry]
+
+    def token(self):
+        '''
+        Take a token before reading a value from Redis.
+
+        @return the token to pass to #set.
+        '''
+        with self.__lock:
+            return self.__counter
+
+    def set(self, key, field, value, token):
+        '''
+        Store a value read from Redis, unless the key was invalidated since the token was taken.
+        The least recently used value is evicted if the cache is full.
+
+        @param key [String] Redis key the value was read from.
+        @param field [String] What was read from the key (e.g. a member ID).
+        @param value Value read.
+        @param token [int] Token taken with #token before reading the value.
+        '''
+        with self.__lock:
+            if token < self.__floor or self.__invalidations.get(key, -1) > token:
+                return
+            entry = (key, field)
+            self.__entries[entry] = value
+            self.__entries.move_to_end(entry)
+            self.__fields.setdefault(key, set()).add(field)
+            while len(self.__entries) > self.size:
+                evicted_key, evicted_field = self.__entries.popitem(last=False)[0]
+                self.__remove_field(evicted_key, evicted_field)
+
+    def invalidate(self, keys):
+        '''
+        Remove every value read from a list of keys.
+
+        @param keys [list] Redis keys.
+        '''
+        with self.__lock:
+            self.__counter += 1
+            for key in keys:
+                for field in self.__fields.pop(key, ()):
+                    del self.__entries[(key, field)]
+                self.__invalidations[key] = self.__counter
+                self.__invalidations.move_to_end(key)
+            while len(self.__invalidations) > self.size:
+                key, counter = self.__invalidations.popitem(last=False)
+                self.__floor = max(self.__floor, counter)
+
+    def clear(self):
+        '''
+        Remove every value.
+        '''
+        with self.__lock:
+            self.__counter += 1
+            self.__floor = self.__counter
+            self.__entries.clear()
+            self.__fields.clear()
+            self.__invalidations.clear()
+
+    def __remove_field(self, key, field):
+        fields = self.__fields[key]
+        fields.discard(field)
+        if not fields:
+            del self.__fields[key]
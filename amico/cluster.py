@@ -0,0 +1,161 @@
+from redis.crc import key_slot
+from redis.exceptions import RedisClusterException
+
+
+def hash_tag(key):
+    '''
+    Retrieve the part of a key that Redis Cluster hashes: the content of the first
+    non-empty {...} hash tag, or the whole key if there is none.
+
+    @param key [String] Redis key.
+    @return the hashed part of the key.
+    '''
+    start = key.find('{')
+    if start != -1:
+        end = key.find('}', start + 1)
+        if end > start + 1:
+            return key[start + 1:end]
+    return key
+
+
+def hash_slot(key):
+    '''
+    Compute the Redis Cluster hash slot of a key, honoring hash tags.
+
+    @param key [String] Redis key.
+    @return the hash slot of the key.
+    '''
+    if not isinstance(key, bytes):
+        key = str(key).encode('utf-8')
+    return key_slot(key)
+
+
+def supports_transactions(redis_connection):
+    '''
+    Check whether a Redis Cluster client can run pipelines in MULTI transactions. redis-py
+    only supports them from 6.1.0; earlier releases raise RedisClusterException.
+
+    @param redis_connection [redis] Redis connection (a RedisCluster client).
+    @return True if pipelines can run in transactions.
+    '''
+    try:
+        redis_connection.pipeline(transaction=True)
+    except RedisClusterException:
+        return False
+    return True
+
+
+# Position of the first key in the arguments of the commands whose first
+# argument is not a key.
+KEY_ARGUMENTS = {
+    'zintercard': 1
+}
+
+
+def command_key(name, args):
+    '''
+    Retrieve the first key of a command.
+
+    @param name [String] Name of the redis-py command method.
+    @param args [list] Positional arguments of the command.
+    @return the first key.
+    '''
+    key = args[KEY_ARGUMENTS.get(name, 0)]
+    if isinstance(key, (list, tuple)):
+        key = key[0]
+    return key
+
+
+class SlotPipeline(object):
+    '''
+    Pipeline for Redis Cluster. Commands are queued like on a redis-py pipeline, then
+    split by the hash slot of their key into one pipeline per slot. The pipelines run in
+    parallel, each one in a MULTI transaction if requested, and their results are
+    returned in the order the commands were queued.
+
+    Commands touching different slots are therefore not applied atomically with respect
+    to each other, but the commands for one slot (e.g. one individual's relationship sets
+    with hash-tagged keys) are, unless the client does not support transactions (see
+    supports_transactions).
+    '''
+
+    def __init__(self, redis_connection, executor, transaction=True):
+        '''
+        Initialize a new slot pipeline.
+
+        @param redis_connection [redis] Redis connection (a RedisCluster client).
+        @param executor [Executor] Executor the per-slot pipelines are run on.
+        @param transaction [boolean] Whether to run each per-slot pipeline in a transaction.
+        '''
+        self.redis_connection = redis_connection
+        self.executor = executor
+        self.transaction = transaction
+        self.commands = []
+
+    def __len__(self):
+        return len(self.commands)
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        '''
+        Run the queued commands, one pipeline per hash slot (or group, see _group).
+
+        @return the results of the commands, in the order they were queued.
+        '''
+        commands, self.commands = self.commands, []
+        groups = {}
+        for index, command in enumerate(commands):
+            name, args, kwargs = command
+            groups.setdefault(self._group(command_key(name, args)), []).append(index)
+
+        pipelines = []
+        for group, indexes in groups.items():
+            pipeline = self._pipeline(group)
+            for index in indexes:
+                self.__queue(pipeline, commands[index])
+            pipelines.append(pipeline)
+
+        if len(pipelines) == 1:
+            replies = [pipelines[0].execute()]
+        else:
+            replies = list(self.executor.map(
+                lambda pipeline: pipeline.execute(), pipelines))
+
+        results = [None] * len(commands)
+        for indexes, group_results in zip(groups.values(), replies):
+            for index, result in zip(indexes, group_results):
+                results[index] = result
+        return results
+
+    def _group(self, key):
+        '''
+        Compute the group of a key; one pipeline is run per group.
+
+        @param key [String] Redis key.
+        @return the hash slot of the key.
+        '''
+        return hash_slot(key)
+
+    def _pipeline(self, group):
+        '''
+        Create the pipeline for a group of commands.
+
+        @param group Group of the commands, as returned by _group.
+        @return the pipeline.
+        '''
+        return self.redis_connection.pipeline(transaction=self.transaction)
+
+    def __queue(self, pipeline, command):
+        name, args, kwargs = command
+        if name == 'sort':
+            # redis-py refuses to pipeline SORT on a cluster, since its BY and GET
+            # options can read other keys. Amico only sorts one set by its members.
+            pipeline.execute_command(
+                'SORT', args[0], 'LIMIT', kwargs['start'], kwargs['num'])
+        else:
+            getattr(pipeline, name)(*args, **kwargs)
@@ -0,0 +1,289 @@
+import bisect
+import json
+import os
+import sys
+import time
+from array import array
+
+from .memory import MemoryRedis
+
+
+class InternTable(object):
+    '''
+    Maps member strings to integer IDs and back, so that each individual's ID is stored once
+    however many relationships it appears in.
+    '''
+
+    def __init__(self, names=None):
+        '''
+        Initialize a new intern table.
+
+        @param names [list] Interned strings, by ID.
+        '''
+        self.names = list(names or [])
+        self.ids = dict((name, id) for id, name in enumerate(self.names))
+
+    def intern(self, name):
+        '''
+        Retrieve the ID of a string, interning it if needed.
+
+        @param name [String] String to intern.
+        @return the ID.
+        '''
+        id = self.ids.get(name)
+        if id is None:
+            id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return id
+
+    def find(self, name):
+        '''
+        Retrieve the ID of a string without interning it.
+
+        @param name [String] String to look up.
+        @return the ID, or None if the string was never interned.
+        '''
+        return self.ids.get(name)
+
+
+class ArraySortedSet(object):
+    '''
+    Sorted set of interned members kept in four arrays: the member IDs sorted by ID with a
+    parallel array of their scores, for lookups by member, and the member IDs sorted like
+    Redis sorts them (by score, then by member) with a parallel array of their scores, for
+    ranges. Each member takes 32 bytes, instead of the dictionary entry, tuple, string and
+    float objects of SortedSet. Lookups, ranks and ranges are O(log(n)); updates also move
+    the end of the arrays.
+    '''
+
+    def __init__(self, table):
+        '''
+        Initialize a new array sorted set.
+
+        @param table [InternTable] Intern table of the members.
+        '''
+        self.table = table
+        self.ids = array('q')
+        self.scores = array('d')
+        self.ranked = array('q')
+        self.ranked_scores = array('d')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, member):
+        return self.__index(member) is not None
+
+    def __iter__(self):
+        names = self.table.names
+        return (names[id] for id in self.ranked)
+
+    def score(self, member):
+        index = self.__index(member)
+        if index is None:
+            return None
+        return self.scores[index]
+
+    def pairs(self):
+        names = self.table.names
+        return ((names[id], score) for id, score in zip(self.ids, self.scores))
+
+    def slice(self, start, stop):
+        names = self.table.names
+        return [(self.ranked_scores[index], names[self.ranked[index]])
+                for index in range(max(start, 0), min(stop, len(self.ranked)))]
+
+    def add(self, member, score):
+        id = self.table.intern(member)
+        index = bisect.bisect_left(self.ids, id)
+        added = index == len(self.ids) or self.ids[index] != id
+        if added:
+            self.ids.insert(index, id)
+            self.scores.insert(index, score)
+        else:
+            if self.scores[index] == score:
+                return False
+            rank = self.__rank(self.scores[index], member)
+            del self.ranked[rank]
+            del self.ranked_scores[rank]
+            self.scores[index] = score
+        rank = self.__rank(score, member)
+        self.ranked.insert(rank, id)
+        self.ranked_scores.insert(rank, score)
+        return added
+
+    def remove(self, member):
+        index = self.__index(member)
+        if index is None:
+            return False
+        rank = self.__rank(self.scores[index], member)
+        del self.ids[index]
+        del self.scores[index]
+        del self.ranked[rank]
+        del self.ranked_scores[rank]
+        return True
+
+    def rank(self, member):
+        index = self.__index(member)
+        if index is None:
+            return None
+        return self.__rank(self.scores[index], member)
+
+    def score_range(self, minimum, maximum):
+        score, exclusive = minimum
+        if exclusive:
+            start = bisect.bisect_right(self.ranked_scores, score)
+        else:
+            start = bisect.bisect_left(self.ranked_scores, score)
+        score, exclusive = maximum
+        if exclusive:
+            end = bisect.bisect_left(self.ranked_scores, score)
+        else:
+            end = bisect.bisect_right(self.ranked_scores, score)
+        return start, max(start, end)
+
+    def __index(self, member):
+        '''
+        Find the position of a member in ids.
+        '''
+        id = self.table.find(member)
+        if id is None:
+            return None
+        index = bisect.bisect_left(self.ids, id)
+        if index == len(self.ids) or self.ids[index] != id:
+            return None
+        return index
+
+    def __rank(self, score, member):
+        '''
+        Find the position of a member with a score in ranked, or where it would be inserted:
+        among the members with the same score, members are ordered by name.
+        '''
+        names = self.table.names
+        low = bisect.bisect_left(self.ranked_scores, score)
+        high = bisect.bisect_right(self.ranked_scores, score, low)
+        while low < high:
+            middle = (low + high) // 2
+            if names[self.ranked[middle]] < member:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+
+class EmbeddedRedis(MemoryRedis):
+    '''
+    In-process relationship store for single-process deployments, accepted by Amico as its
+    redis_connection like MemoryRedis. Members are interned, and sorted sets (every scope not
+    listed in the set_scopes option) are kept in arrays of 64-bit IDs and scores instead of
+    Python objects. Interned members are kept until the store is loaded from a snapshot. The
+    store can be saved to and loaded from a snapshot file.
+    '''
+
+    SNAPSHOT_VERSION = 1
+
+    def __init__(self, decode_responses=False):
+        '''
+        Initialize a new embedded store.
+
+        @param decode_responses [boolean] Whether to return strings instead of bytes, like redis-py.
+        '''
+        super(EmbeddedRedis, self).__init__(decode_responses)
+        self.table = InternTable()
+
+    def _new_sorted_set(self):
+        return ArraySortedSet(self.table)
+
+    def save(self, path):
+        '''
+        Write a snapshot of the store, leaving out expired keys and members no longer in any
+        sorted set. The snapshot is a line of JSON describing the keys, followed by the arrays of
+        each sorted set, so loading it never runs code. It is written to a temporary file first
+        and then renamed, so an existing snapshot is only replaced by a complete one. Writes
+        wait until the snapshot is written.
+
+        @param path [String] Path of the snapshot file.
+        '''
+        with self.lock:
+            now = time.time()
+            values = {}
+            for key, value in self._data.items():
+                expires = self._expires.get(key)
+                if expires is None or expires > now:
+                    values[key] = value
+
+            # Only keep the members still in a sorted set, numbered in the same order so
+            # that the ID arrays stay sorted.
+            used = set()
+            for value in values.values():
+                if not isinstance(value, set):
+                    used.update(value.ids)
+            used = sorted(used)
+            ids = dict((id, index) for index, id in enumerate(used))
+
+            keys = []
+            arrays = []
+            for key, value in values.items():
+                if isinstance(value, set):
+                    keys.append([key, 'set', sorted(value), self._expires.get(key)])
+                else:
+                    keys.append([key, 'zset', len(value), self._expires.get(key)])
+                    arrays.extend([
+                        array('q', [ids[id] for id in value.ids]), value.scores,
+                        array('q', [ids[id] for id in value.ranked]), value.ranked_scores])
+            header = {
+                'version': self.SNAPSHOT_VERSION,
+                'byteorder': sys.byteorder,
+                'names': [self.table.names[id] for id in used],
+                'keys': keys}
+
+            temporary_path = '%s.tmp' % path
+            with open(temporary_path, 'wb') as snapshot_file:
+                snapshot_file.write(json.dumps(header).encode('utf-8'))
+                snapshot_file.write(b'\n')
+                for data in arrays:
+                    data.tofile(snapshot_file)
+            os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path, decode_responses=False):
+        '''
+        Create a store from a snapshot written by #save, on a machine of either byte order.
+
+        @param path [String] Path of the snapshot file.
+        @param decode_responses [boolean] Whether to return strings instead of bytes, like redis-py.
+        @return the store.
+        '''
+        with open(path, 'rb') as snapshot_file:
+            try:
+                header = json.loads(snapshot_file.readline().decode('utf-8'))
+            except ValueError:
+                header = None
+            if not isinstance(header, dict):
+                raise Exception('Invalid snapshot %s' % path)
+            if header.get('version') != cls.SNAPSHOT_VERSION:
+                raise Exception('Unsupported snapshot version %r' % header.get('version'))
+
+            store = cls(decode_responses)
+            store.table = InternTable(header['names'])
+            for key, value_type, contents, expires in header['keys']:
+                if value_type == 'set':
+                    value = set(contents)
+                else:
+                    value = ArraySortedSet(store.table)
+                    for values in [value.ids, value.scores, value.ranked, value.ranked_scores]:
+                        try:
+                            values.fromfile(snapshot_file, contents)
+                        except EOFError:
+                            raise Exception('Truncated snapshot %s' % path)
+                        if header['byteorder'] != sys.byteorder:
+                            values.byteswap()
+                    # The ranked IDs must be the same IDs, in the intern table.
+                    if value.ids and (
+                            value.ids[0] < 0 or value.ids[-1] >= len(store.table.names)
+                            or array('q', sorted(value.ranked)) != value.ids):
+                        raise Exception('Invalid snapshot %s' % path)
+                store._data[key] = value
+                if expires is not None:
+                    store._expires[key] = expires
+        return store
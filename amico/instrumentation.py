@@ -0,0 +1,423 @@
+import bisect
+import logging
+import socket
+import threading
+import time
+import types
+
+
+class Call(object):
+    '''
+    Measurements of one call to a public Amico method, passed to the instrumentation hooks.
+    Calls made from within another public method (e.g. clear_chunk from clear) are counted
+    as part of the outer call.
+
+    method: name of the method.
+    duration: time spent in the method, in seconds (None before the call).
+    commands: number of Redis commands sent, including the ones queued in pipelines.
+    pipelines: number of pipelines executed.
+    round_trips: number of requests sent to Redis (commands outside pipelines, and pipelines).
+    reply_bytes: approximate size of the replies, from the length of their strings and numbers.
+    error: exception raised by the method, if any.
+    '''
+
+    __slots__ = (
+        'method', 'duration', 'commands', 'pipelines', 'round_trips', 'reply_bytes',
+        'error')
+
+    def __init__(self, method):
+        self.method = method
+        self.duration = None
+        self.commands = 0
+        self.pipelines = 0
+        self.round_trips = 0
+        self.reply_bytes = 0
+        self.error = None
+
+
+class Instrumentation(object):
+    '''
+    Hooks called around every public Amico method when given as the instrumentation option.
+    Subclass and override before and/or after. Hooks run in the thread making the call, and
+    must not raise.
+    '''
+
+    def before(self, call):
+        '''
+        Called before a public method runs.
+
+        @param call [Call] Call about to run; only method is set.
+        '''
+        pass
+
+    def after(self, call):
+        '''
+        Called after a public method returned or raised. For methods returning a generator
+        (iter_all, map), this is when the generator is exhausted or closed, and the duration
+        only covers the time spent producing items.
+
+        @param call [Call] Measurements of the call.
+        '''
+        pass
+
+
+class LoggingInstrumentation(Instrumentation):
+    '''
+    Logs every call with its measurements using the logging module.
+    '''
+
+    def __init__(self, logger=None, level=logging.DEBUG):
+        '''
+        Initialize a new logging instrumentation.
+
+        @param logger [Logger] Logger to log to (default: the amico logger).
+        @param level [int] Level to log calls at. Failed calls are logged at WARNING or above.
+        '''
+        self.logger = logger or logging.getLogger('amico')
+        self.level = level
+
+    def after(self, call):
+        if call.error is not None:
+            self.logger.log(
+                max(self.level, logging.WARNING),
+                'amico %s failed in %.3fms (%d commands, %d pipelines, %d round trips): %r',
+                call.method, call.duration * 1000, call.commands, call.pipelines,
+                call.round_trips, call.error)
+        elif self.logger.isEnabledFor(self.level):
+            self.logger.log(
+                self.level,
+                'amico %s took %.3fms (%d commands, %d pipelines, %d round trips, %d reply bytes)',
+                call.method, call.duration * 1000, call.commands, call.pipelines,
+                call.round_trips, call.reply_bytes)
+
+
+class HistogramInstrumentation(Instrumentation):
+    '''
+    Keeps, in memory, a latency histogram and totals of the measurements per method.
+    '''
+
+    # Upper bounds of the latency buckets, in milliseconds.
+    BUCKETS = [
+        0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+    def __init__(self, buckets=None):
+        '''
+        Initialize a new histogram instrumentation.
+
+        @param buckets [list] Sorted upper bounds of the latency buckets in milliseconds (default: BUCKETS).
+        '''
+        self.buckets = list(buckets or self.BUCKETS)
+        self.__lock = threading.Lock()
+        self.__methods = {}
+
+    def after(self, call):
+        bucket = bisect.bisect_left(self.buckets, call.duration * 1000)
+        with self.__lock:
+            stats = self.__methods.get(call.method)
+            if stats is None:
+                stats = self.__methods[call.method] = {
+                    'calls': 0, 'errors': 0, 'duration': 0.0, 'commands': 0,
+                    'pipelines': 0, 'round_trips': 0, 'reply_bytes': 0,
+                    'histogram': [0] * (len(self.buckets) + 1)}
+            stats['calls'] += 1
+            if call.error is not None:
+                stats['errors'] += 1
+            stats['duration'] += call.duration
+            stats['commands'] += call.commands
+            stats['pipelines'] += call.pipelines
+            stats['round_trips'] += call.round_trips
+            stats['reply_bytes'] += call.reply_bytes
+            stats['histogram'][bucket] += 1
+
+    def methods(self):
+        '''
+        Retrieve the names of the methods called so far.
+
+        @return a sorted list of method names.
+        '''
+        with self.__lock:
+            return sorted(self.__methods)
+
+    def stats(self, method):
+        '''
+        Retrieve the measurements of a method: the number of calls and errors, the total
+        duration in seconds, commands, pipelines, round trips and reply bytes, and the
+        histogram, the number of calls per bucket (the last one counts the calls slower than
+        every bucket).
+
+        @param method [String] Name of the method.
+        @return a dictionary of measurements, or None if the method was not called.
+        '''
+        with self.__lock:
+            stats = self.__methods.get(method)
+            if stats is None:
+                return None
+            stats = dict(stats)
+            stats['histogram'] = list(stats['histogram'])
+            return stats
+
+    def percentile(self, method, fraction):
+        '''
+        Estimate a latency percentile of a method from its histogram.
+
+        @param method [String] Name of the method.
+        @param fraction [float] Percentile as a fraction, e.g. 0.99.
+        @return the upper bound in milliseconds of the bucket holding the percentile (infinity past the last bucket), or None if the method was not called.
+        '''
+        stats = self.stats(method)
+        if stats is None:
+            return None
+        rank = fraction * stats['calls']
+        seen = 0
+        for index, count in enumerate(stats['histogram']):
+            seen += count
+            if count and seen >= rank:
+                break
+        if index < len(self.buckets):
+            return self.buckets[index]
+        return float('inf')
+
+    def reset(self):
+        '''
+        Forget all measurements.
+        '''
+        with self.__lock:
+            self.__methods = {}
+
+
+class StatsdInstrumentation(Instrumentation):
+    '''
+    Sends the measurements of every call as statsd metrics over UDP, in one datagram per
+    call: <prefix>.<method>.duration as a timer in milliseconds, and calls, errors,
+    commands, pipelines, round_trips and reply_bytes as counters. Sending never raises.
+    '''
+
+    def __init__(self, host='localhost', port=8125, prefix='amico'):
+        '''
+        Initialize a new statsd instrumentation.
+
+        @param host [String] Host of the statsd server.
+        @param port [int] Port of the statsd server.
+        @param prefix [String] Prefix of the metric names.
+        '''
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def after(self, call):
+        name = '%s.%s' % (self.prefix, call.method)
+        lines = [
+            '%s.duration:%.3f|ms' % (name, call.duration * 1000),
+            '%s.calls:1|c' % name,
+            '%s.commands:%d|c' % (name, call.commands),
+            '%s.pipelines:%d|c' % (name, call.pipelines),
+            '%s.round_trips:%d|c' % (name, call.round_trips),
+            '%s.reply_bytes:%d|c' % (name, call.reply_bytes)]
+        if call.error is not None:
+            lines.append('%s.errors:1|c' % name)
+        try:
+            self.socket.sendto('\n'.join(lines).encode('utf-8'), self.address)
+        except (socket.error, OSError):
+            pass
+
+    def close(self):
+        '''
+        Close the UDP socket.
+        '''
+        self.socket.close()
+
+
+def reply_size(reply):
+    '''
+    Approximate the size of a Redis reply: the length of its strings, and of its numbers
+    written out, summed over nested replies.
+
+    @param reply Reply of a Redis command.
+    @return the approximate size in bytes.
+    '''
+    if isinstance(reply, (bytes, str)):
+        return len(reply)
+    if isinstance(reply, (list, tuple, set)):
+        return sum(reply_size(item) for item in reply)
+    if isinstance(reply, dict):
+        return sum(
+            reply_size(key) + reply_size(value) for key, value in reply.items())
+    if reply is None:
+        return 0
+    return len(str(reply))
+
+
+class InstrumentedRedis(object):
+    '''
+    Redis connection proxy counting the commands, pipelines and reply sizes of the call
+    running in the current thread.
+    '''
+
+    def __init__(self, redis_connection, calls):
+        '''
+        Initialize a new instrumented connection.
+
+        @param redis_connection [redis] Redis connection to proxy.
+        @param calls [threading.local] Holds the call running in each thread, as call.
+        '''
+        self.redis_connection = redis_connection
+        self.calls = calls
+
+    def __getattr__(self, name):
+        attribute = getattr(self.redis_connection, name)
+        if not callable(attribute):
+            return attribute
+
+        def command(*args, **kwargs):
+            reply = attribute(*args, **kwargs)
+            call = getattr(self.calls, 'call', None)
+            if call is not None:
+                call.commands += 1
+                call.round_trips += 1
+                call.reply_bytes += reply_size(reply)
+            return reply
+        return command
+
+    def pipeline(self, *args, **kwargs):
+        return InstrumentedPipeline(
+            self.redis_connection.pipeline(*args, **kwargs), self.calls)
+
+    def register_script(self, script):
+        return InstrumentedScript(
+            self.redis_connection.register_script(script), self)
+
+    def sscan_iter(self, name, match=None, count=None):
+        cursor = '0'
+        while cursor != 0:
+            cursor, members = self.sscan(
+                name, cursor=cursor, match=match, count=count)
+            for member in members:
+                yield member
+
+
+class InstrumentedPipeline(object):
+    '''
+    Redis pipeline proxy counting its commands when queued, and the pipeline and the reply
+    sizes when executed, for the call running in the thread that created it. Pipelines of
+    one call may be executed in parallel from other threads (see SlotPipeline).
+    '''
+
+    lock = threading.Lock()
+
+    def __init__(self, pipeline, calls):
+        self.pipeline = pipeline
+        self.calls = calls
+        self.call = getattr(calls, 'call', None)
+
+    def __len__(self):
+        return len(self.pipeline)
+
+    def __getattr__(self, name):
+        attribute = getattr(self.pipeline, name)
+
+        def queue(*args, **kwargs):
+            attribute(*args, **kwargs)
+            if self.call is not None:
+                self.call.commands += 1
+            return self
+        return queue
+
+    def execute(self, *args, **kwargs):
+        replies = self.pipeline.execute(*args, **kwargs)
+        if self.call is not None:
+            size = reply_size(replies)
+            with self.lock:
+                self.call.pipelines += 1
+                self.call.round_trips += 1
+                self.call.reply_bytes += size
+        return replies
+
+
+class InstrumentedScript(object):
+    '''
+    Lua script proxy counting its calls, run on the proxied connection or pipeline so that
+    redis-py still loads the script when needed.
+    '''
+
+    def __init__(self, script, redis_connection):
+        self.script = script
+        self.redis_connection = redis_connection
+
+    def __call__(self, keys=[], args=[], client=None):
+        if isinstance(client, InstrumentedPipeline):
+            self.script(keys=keys, args=args, client=client.pipeline)
+            if client.call is not None:
+                client.call.commands += 1
+            return client
+        reply = self.script(
+            keys=keys, args=args,
+            client=self.redis_connection.redis_connection if client is None else client)
+        call = getattr(self.redis_connection.calls, 'call', None)
+        if call is not None:
+            call.commands += 1
+            call.round_trips += 1
+            call.reply_bytes += reply_size(reply)
+        return reply
+
+
+def instrument(method, name, instrumentation, calls):
+    '''
+    Wrap a method so that calls to it are measured and passed to the instrumentation hooks,
+    unless made from within another instrumented call in the same thread.
+
+    @param method [callable] Bound method to wrap.
+    @param name [String] Name of the method, as reported in Call.method.
+    @param instrumentation [Instrumentation] Hooks to call.
+    @param calls [threading.local] Holds the call running in each thread, as call.
+    @return the wrapped method.
+    '''
+    def instrumented(*args, **kwargs):
+        if getattr(calls, 'call', None) is not None:
+            return method(*args, **kwargs)
+
+        call = Call(name)
+        instrumentation.before(call)
+        calls.call = call
+        start = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            call.duration = time.perf_counter() - start
+            calls.call = None
+            if call.error is not None:
+                instrumentation.after(call)
+
+        if isinstance(result, types.GeneratorType):
+            return instrument_generator(result, call, instrumentation, calls)
+        instrumentation.after(call)
+        return result
+
+    instrumented.__name__ = name
+    instrumented.__doc__ = method.__doc__
+    return instrumented
+
+
+def instrument_generator(generator, call, instrumentation, calls):
+    '''
+    Continue measuring a call while its generator produces items.
+    '''
+    try:
+        while True:
+            calls.call = call
+            start = time.perf_counter()
+            try:
+                item = next(generator)
+            except StopIteration:
+                return
+            finally:
+                call.duration += time.perf_counter() - start
+                calls.call = None
+            yield item
+    except Exception as error:
+        call.error = error
+        raise
+    finally:
+        instrumentation.after(call)
@@ -0,0 +1,108 @@
+class KeySchema(object):
+    '''
+    Builds the Redis keys for relationship sets. Key prefixes are computed once per
+    relationship type and scope and cached, so building a key is a dictionary lookup
+    and a string concatenation.
+
+    Keys have the form namespace:type:scope:id. In compact mode, the relationship
+    types are replaced by the short codes in COMPACT_TYPE_CODES, and scopes by
+    their aliases in the scope_aliases option, to save memory across large numbers
+    of keys. With hash tags, the ID is wrapped in braces (namespace:type:scope:{id}), so
+    that all of an individual's sets are stored in the same Redis Cluster hash slot, or on
+    the same node of a sharded connection.
+    '''
+
+    COMPACT_TYPE_CODES = {
+        'following': 'fg',
+        'followers': 'fr',
+        'blocked': 'b',
+        'blocked_by': 'bb',
+        'reciprocated': 'r',
+        'pending': 'p',
+        'pending_with': 'pw'
+    }
+
+    def __init__(self, options, hash_tags=False):
+        '''
+        Initialize a new key schema.
+
+        @param options [dictionary] Amico options: namespace, the *_key type names,
+          compact_keys and scope_aliases.
+        @param hash_tags [boolean] Whether to wrap IDs in hash tags.
+        '''
+        self.namespace = options['namespace']
+        self.hash_tags = hash_tags
+        self.type_names = {}
+        for type in self.COMPACT_TYPE_CODES:
+            if options['compact_keys']:
+                self.type_names[type] = self.COMPACT_TYPE_CODES[type]
+            else:
+                self.type_names[type] = options['%s_key' % type]
+        if options['compact_keys']:
+            self.scope_aliases = dict(options['scope_aliases'])
+        else:
+            self.scope_aliases = {}
+        self.__types = dict(
+            (name, type) for type, name in self.type_names.items())
+        self.__scopes = dict(
+            (alias, scope) for scope, alias in self.scope_aliases.items())
+        self.__prefixes = {}
+
+    def key(self, type, scope, id):
+        '''
+        Build the Redis key for a relationship type, scope and ID.
+
+        @param type [String] One of 'following', 'followers', 'reciprocated', 'blocked', 'blocked_by', 'pending', 'pending_with'.
+        @param scope [String] Scope for the call.
+        @param id [String] ID of the individual.
+        @return the Redis key for the relationship set.
+        '''
+        if self.hash_tags:
+            return '%s{%s}' % (self.prefix(type, scope), id)
+        return self.prefix(type, scope) + str(id)
+
+    def prefix(self, type, scope):
+        '''
+        Retrieve the prefix shared by the keys of a relationship type and scope.
+
+        @param type [String] Relationship type.
+        @param scope [String] Scope for the call.
+        @return the key prefix, ending in the separator before the ID.
+        '''
+        prefix = self.__prefixes.get((type, scope))
+        if prefix is None:
+            prefix = '%s:%s:%s:' % (
+                self.namespace,
+                self.type_names[type],
+                self.scope_aliases.get(scope, scope))
+            self.__prefixes[(type, scope)] = prefix
+        return prefix
+
+    def pattern(self):
+        '''
+        Retrieve a SCAN pattern matching every key in the schema's namespace.
+
+        @return the pattern.
+        '''
+        return '%s:*' % self.namespace
+
+    def parse(self, key):
+        '''
+        Split a key built by this schema into its relationship type, scope and ID.
+        Scopes are assumed not to contain the separator; IDs may.
+
+        @param key [String] Redis key.
+        @return a tuple of the type, scope and ID, or None if the key does not belong to the schema.
+        '''
+        parts = key.split(':', 3)
+        if len(parts) != 4 or parts[0] != self.namespace:
+            return None
+        type = self.__types.get(parts[1])
+        if type is None:
+            return None
+        id = parts[3]
+        if self.hash_tags:
+            if not (id.startswith('{') and id.endswith('}')):
+                return None
+            id = id[1:-1]
+        return type, self.__scopes.get(parts[2], parts[2]), id
@@ -0,0 +1,706 @@
+import bisect
+import fnmatch
+import json
+import math
+import random
+import threading
+import time
+import zlib
+
+from redis.exceptions import ResponseError
+
+# Implementations of the MemoryRedis commands by name, run by pipelines.
+COMMANDS = {}
+
+
+class SortedSet(object):
+    '''
+    Sorted set kept as a dictionary of scores and a list of (score, member) pairs sorted like
+    Redis sorts them: by score, then by member. Lookups are O(1), ranges by rank or score
+    O(log(n)) plus the size of the range, and updates O(log(n)) plus a list insertion.
+    '''
+
+    def __init__(self):
+        self.scores = {}
+        self.items = []
+
+    def __len__(self):
+        return len(self.scores)
+
+    def __contains__(self, member):
+        return member in self.scores
+
+    def __iter__(self):
+        return iter(self.scores)
+
+    def score(self, member):
+        '''
+        Retrieve the score of a member.
+
+        @param member [String] Member.
+        @return the score, or None if the member is not in the set.
+        '''
+        return self.scores.get(member)
+
+    def pairs(self):
+        '''
+        Iterate over the members and their scores, in no particular order.
+
+        @return an iterator of (member, score) tuples.
+        '''
+        return iter(self.scores.items())
+
+    def slice(self, start, stop):
+        '''
+        Retrieve the members between two ranks, from the lowest score.
+
+        @param start [int] Rank of the first member.
+        @param stop [int] Rank after the last member.
+        @return a list of (score, member) tuples.
+        '''
+        return self.items[start:stop]
+
+    def add(self, member, score):
+        '''
+        Add a member or update its score.
+
+        @param member [String] Member.
+        @param score [float] Score.
+        @return True if the member was added, False if it was already in the set.
+        '''
+        current = self.scores.get(member)
+        if current is not None:
+            if current == score:
+                return False
+            del self.items[bisect.bisect_left(self.items, (current, member))]
+        self.scores[member] = score
+        bisect.insort(self.items, (score, member))
+        return current is None
+
+    def remove(self, member):
+        '''
+        Remove a member.
+
+        @param member [String] Member.
+        @return True if the member was in the set.
+        '''
+        score = self.scores.pop(member, None)
+        if score is None:
+            return False
+        del self.items[bisect.bisect_left(self.items, (score, member))]
+        return True
+
+    def rank(self, member):
+        '''
+        Retrieve the rank of a member, from the lowest score.
+
+        @param member [String] Member.
+        @return the rank, or None if the member is not in the set.
+        '''
+        score = self.scores.get(member)
+        if score is None:
+            return None
+        return bisect.bisect_left(self.items, (score, member))
+
+    def score_range(self, minimum, maximum):
+        '''
+        Retrieve the ranks of the members scored within bounds.
+
+        @param minimum [tuple] Lower bound as (score, exclusive).
+        @param maximum [tuple] Upper bound as (score, exclusive).
+        @return the rank of the first member and the rank after the last one.
+        '''
+        score, exclusive = minimum
+        if exclusive:
+            score = math.nextafter(score, math.inf)
+        start = bisect.bisect_left(self.items, (score,))
+        score, exclusive = maximum
+        if not exclusive:
+            score = math.nextafter(score, math.inf)
+        end = bisect.bisect_left(self.items, (score,))
+        return start, max(start, end)
+
+
+def command(method):
+    '''
+    Declare a method of MemoryRedis as a Redis command: it runs under the connection's lock
+    and counts as one command and one round trip, or is queued when called on a pipeline.
+    '''
+    def run(self, *args, **kwargs):
+        with self.lock:
+            self.commands += 1
+            self.round_trips += 1
+            return method(self, *args, **kwargs)
+    run.__name__ = method.__name__
+    run.__doc__ = method.__doc__
+    COMMANDS[method.__name__] = method
+    return run
+
+
+class MemoryPipeline(object):
+    '''
+    Pipeline for a MemoryRedis connection. Queued commands are applied together under the
+    connection's lock, so every pipeline is atomic, like a MULTI transaction. As with Redis,
+    a failing command does not stop the others; the first error is raised after all ran.
+    '''
+
+    def __init__(self, redis_connection, transaction=True):
+        self.redis_connection = redis_connection
+        self.transaction = transaction
+        self.command_stack = []
+
+    def __len__(self):
+        return len(self.command_stack)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.reset()
+
+    def __getattr__(self, name):
+        if name not in COMMANDS:
+            raise AttributeError(name)
+
+        def queue(*args, **kwargs):
+            self.command_stack.append((COMMANDS[name], args, kwargs))
+            return self
+        return queue
+
+    def reset(self):
+        self.command_stack = []
+
+    def execute(self, raise_on_error=True):
+        '''
+        Apply the queued commands.
+
+        @param raise_on_error [boolean] Whether to raise the first error instead of returning it.
+        @return the results of the commands, in the order they were queued.
+        '''
+        commands, self.command_stack = self.command_stack, []
+        results = []
+        with self.redis_connection.lock:
+            self.redis_connection.commands += len(commands)
+            self.redis_connection.round_trips += 1
+            for method, args, kwargs in commands:
+                try:
+                    results.append(method(self.redis_connection, *args, **kwargs))
+                except ResponseError as error:
+                    results.append(error)
+        if raise_on_error:
+            for result in results:
+                if isinstance(result, ResponseError):
+                    raise result
+        return results
+
+
+class MemoryRedis(object):
+    '''
+    In-process stand-in for a Redis connection, implementing the sorted set, set and key
+    commands Amico uses with redis-py's signatures and replies. Amico accepts it as its
+    redis_connection and runs without Lua scripts on it. Data lives in this object only,
+    and is shared by the threads using it.
+
+    The commands and round_trips attributes count the commands run and the requests a Redis
+    server would have received (one per command, or one per pipeline); reset them to 0 to
+    measure an operation.
+    '''
+
+    def __init__(self, decode_responses=False):
+        '''
+        Initialize a new in-memory connection.
+
+        @param decode_responses [boolean] Whether to return strings instead of bytes, like redis-py.
+        '''
+        self.decode_responses = decode_responses
+        self.lock = threading.RLock()
+        self.commands = 0
+        self.round_trips = 0
+        self._data = {}
+        self._expires = {}
+
+    def pipeline(self, transaction=True):
+        '''
+        Create a pipeline.
+
+        @param transaction [boolean] Accepted for compatibility; pipelines are always atomic.
+        @return the pipeline.
+        '''
+        return MemoryPipeline(self, transaction)
+
+    def close(self):
+        pass
+
+    def _new_sorted_set(self):
+        '''
+        Create an empty sorted set. Subclasses may store sorted sets differently, as long as
+        they implement the methods of SortedSet.
+
+        @return the sorted set.
+        '''
+        return SortedSet()
+
+    # keys
+
+    @command
+    def ping(self):
+        return True
+
+    @command
+    def flushdb(self):
+        self._data.clear()
+        self._expires.clear()
+        return True
+
+    @command
+    def delete(self, *names):
+        deleted = 0
+        for name in names:
+            if self.__value(name) is not None:
+                self.__remove(self.__key(name))
+                deleted += 1
+        return deleted
+
+    @command
+    def exists(self, *names):
+        return sum(1 for name in names if self.__value(name) is not None)
+
+    @command
+    def expire(self, name, time_to_live):
+        if self.__value(name) is None:
+            return False
+        self._expires[self.__key(name)] = time.time() + time_to_live
+        return True
+
+    @command
+    def ttl(self, name):
+        if self.__value(name) is None:
+            return -2
+        expires = self._expires.get(self.__key(name))
+        if expires is None:
+            return -1
+        return int(math.ceil(expires - time.time()))
+
+    @command
+    def type(self, name):
+        value = self.__value(name)
+        return self.__reply('none' if value is None else self.__type(value))
+
+    @command
+    def rename(self, src, dst):
+        value = self.__value(src)
+        if value is None:
+            raise ResponseError('no such key')
+        expires = self._expires.get(self.__key(src))
+        self.__remove(self.__key(src))
+        self.__store(dst, value)
+        if expires is not None:
+            self._expires[self.__key(dst)] = expires
+        return True
+
+    @command
+    def keys(self, pattern='*'):
+        return [self.__reply(key) for key in self.__keys(pattern)]
+
+    @command
+    def scan(self, cursor=0, match=None, count=None, _type=None):
+        keys = self.__keys('*')
+        if _type is not None:
+            keys = [key for key in keys if self.__type(self._data[key]) == _type]
+        return self.__scan(keys, cursor, match, count)
+
+    def scan_iter(self, match=None, count=None, _type=None):
+        cursor = '0'
+        while cursor != 0:
+            cursor, keys = self.scan(cursor, match=match, count=count, _type=_type)
+            for key in keys:
+                yield key
+
+    @command
+    def dump(self, name):
+        value = self.__value(name)
+        if value is None:
+            return None
+        if isinstance(value, set):
+            return json.dumps(['set', sorted(value)]).encode('utf-8')
+        return json.dumps(['zset', list(value.pairs())]).encode('utf-8')
+
+    @command
+    def restore(self, name, ttl, value, replace=False, absttl=False, idletime=None,
+                frequency=None):
+        if not replace and self.__value(name) is not None:
+            raise ResponseError('BUSYKEY Target key name already exists.')
+        try:
+            value_type, contents = json.loads(value)
+        except (TypeError, ValueError):
+            raise ResponseError('ERR DUMP payload version or checksum are wrong')
+        if value_type == 'set':
+            value = set(contents)
+        else:
+            value = self._new_sorted_set()
+            for member, score in contents:
+                value.add(member, score)
+        self.__remove(self.__key(name))
+        self.__store(name, value)
+        if ttl:
+            self._expires[self.__key(name)] = (
+                ttl / 1000.0 if absttl else time.time() + ttl / 1000.0)
+        return True
+
+    # sets
+
+    @command
+    def sadd(self, name, *values):
+        members = self.__set(name, create=True)
+        size = len(members)
+        members.update(self.__encode(value) for value in values)
+        return len(members) - size
+
+    @command
+    def srem(self, name, *values):
+        members = self.__set(name)
+        removed = 0
+        for value in values:
+            value = self.__encode(value)
+            if value in members:
+                members.remove(value)
+                removed += 1
+        self.__prune(name, members)
+        return removed
+
+    @command
+    def sismember(self, name, value):
+        return self.__encode(value) in self.__set(name)
+
+    @command
+    def smismember(self, name, values, *args):
+        members = self.__set(name)
+        return [self.__encode(value) in members for value in list(values) + list(args)]
+
+    @command
+    def scard(self, name):
+        return len(self.__set(name))
+
+    @command
+    def smembers(self, name):
+        return set(self.__reply(member) for member in self.__set(name))
+
+    @command
+    def srandmember(self, name, number=None):
+        members = list(self.__set(name))
+        if number is None:
+            return self.__reply(random.choice(members)) if members else None
+        if number < 0:
+            return [self.__reply(random.choice(members))
+                    for index in range(-number)] if members else []
+        return [self.__reply(member)
+                for member in random.sample(members, min(number, len(members)))]
+
+    @command
+    def sscan(self, name, cursor=0, match=None, count=None):
+        return self.__scan(self.__set(name), cursor, match, count)
+
+    def sscan_iter(self, name, match=None, count=None):
+        cursor = '0'
+        while cursor != 0:
+            cursor, members = self.sscan(name, cursor=cursor, match=match, count=count)
+            for member in members:
+                yield member
+
+    @command
+    def sunionstore(self, dest, keys, *args):
+        members = set()
+        for key in self.__list(keys, args):
+            members.update(self.__members(key))
+        self.__remove(self.__key(dest))
+        if members:
+            self.__store(dest, members)
+        return len(members)
+
+    @command
+    def sort(self, name, start=None, num=None, by=None, get=None, desc=False, alpha=False,
+             store=None, groups=False):
+        if by is not None or get is not None or store is not None:
+            raise ResponseError('BY, GET and STORE are not supported by MemoryRedis')
+        members = list(self.__members(name))
+        if alpha:
+            members.sort(reverse=desc)
+        else:
+            try:
+                members.sort(key=float, reverse=desc)
+            except ValueError:
+                raise ResponseError(
+                    "One or more scores can't be converted into double")
+        if start is not None and num is not None:
+            members = members[start:start + num] if num >= 0 else members[start:]
+        return [self.__reply(member) for member in members]
+
+    # sorted sets
+
+    @command
+    def zadd(self, name, mapping, nx=False, xx=False, ch=False, incr=False, gt=False,
+             lt=False):
+        members = self.__sorted_set(name, create=True)
+        changed = 0
+        for member, score in mapping.items():
+            member = self.__encode(member)
+            score = float(score)
+            current = members.score(member)
+            if (nx and current is not None) or (xx and current is None):
+                continue
+            if incr:
+                score += current or 0
+            if current is not None and \
+                    ((gt and score <= current) or (lt and score >= current)):
+                continue
+            if members.add(member, score) or (ch and current != score):
+                changed += 1
+        self.__prune(name, members)
+        if incr:
+            return members.score(self.__encode(list(mapping)[0]))
+        return changed
+
+    @command
+    def zrem(self, name, *values):
+        members = self.__sorted_set(name)
+        removed = sum(1 for value in values if members.remove(self.__encode(value)))
+        self.__prune(name, members)
+        return removed
+
+    @command
+    def zscore(self, name, value):
+        return self.__sorted_set(name).score(self.__encode(value))
+
+    @command
+    def zmscore(self, key, members):
+        scores = self.__sorted_set(key)
+        return [scores.score(self.__encode(member)) for member in members]
+
+    @command
+    def zcard(self, name):
+        return len(self.__sorted_set(name))
+
+    @command
+    def zrank(self, name, value):
+        return self.__sorted_set(name).rank(self.__encode(value))
+
+    @command
+    def zrevrank(self, name, value):
+        members = self.__sorted_set(name)
+        rank = members.rank(self.__encode(value))
+        if rank is None:
+            return None
+        return len(members) - 1 - rank
+
+    @command
+    def zrange(self, name, start, end, desc=False, withscores=False,
+               score_cast_func=float, byscore=False, bylex=False, offset=None, num=None):
+        if byscore or bylex:
+            raise ResponseError('BYSCORE and BYLEX are not supported by MemoryRedis')
+        return self.__rank_range(name, start, end, desc, withscores, score_cast_func)
+
+    @command
+    def zrevrange(self, name, start, end, withscores=False, score_cast_func=float):
+        return self.__rank_range(name, start, end, True, withscores, score_cast_func)
+
+    @command
+    def zrangebyscore(self, name, min, max, start=None, num=None, withscores=False,
+                      score_cast_func=float):
+        return self.__score_range(
+            name, min, max, False, start, num, withscores, score_cast_func)
+
+    @command
+    def zrevrangebyscore(self, name, max, min, start=None, num=None, withscores=False,
+                         score_cast_func=float):
+        return self.__score_range(
+            name, min, max, True, start, num, withscores, score_cast_func)
+
+    @command
+    def zunionstore(self, dest, keys, aggregate=None):
+        return self.__store_combination(dest, keys, aggregate, union=True)
+
+    @command
+    def zinterstore(self, dest, keys, aggregate=None):
+        return self.__store_combination(dest, keys, aggregate, union=False)
+
+    @command
+    def zintercard(self, numkeys, keys, limit=0):
+        sets = sorted((self.__members(key) for key in keys), key=len)
+        count = sum(1 for member in sets[0] if all(member in other for other in sets[1:]))
+        return min(count, limit) if limit else count
+
+    # private methods
+
+    def __key(self, name):
+        return self.__encode(name)
+
+    def __encode(self, value):
+        if type(value) is str:
+            return value
+        if isinstance(value, bytes):
+            return value.decode('utf-8')
+        if isinstance(value, float):
+            return repr(value)
+        return str(value)
+
+    def __reply(self, value):
+        if self.decode_responses:
+            return value
+        return value.encode('utf-8')
+
+    def __type(self, value):
+        return 'set' if isinstance(value, set) else 'zset'
+
+    def __value(self, name):
+        key = self.__encode(name)
+        if self._expires:
+            expires = self._expires.get(key)
+            if expires is not None and expires <= time.time():
+                self.__remove(key)
+        return self._data.get(key)
+
+    def __store(self, name, value):
+        self._data[self.__key(name)] = value
+
+    def __remove(self, key):
+        self._data.pop(key, None)
+        self._expires.pop(key, None)
+
+    def __prune(self, name, value):
+        if len(value) == 0 and self._data.get(self.__key(name)) is value:
+            self.__remove(self.__key(name))
+
+    def __keys(self, pattern):
+        return [
+            key for key in sorted(self._data)
+            if fnmatch.fnmatchcase(key, pattern) and self.__value(key) is not None]
+
+    def __set(self, name, create=False):
+        value = self.__value(name)
+        if value is None:
+            value = set()
+            if create:
+                self.__store(name, value)
+        elif not isinstance(value, set):
+            raise ResponseError(
+                'WRONGTYPE Operation against a key holding the wrong kind of value')
+        return value
+
+    def __sorted_set(self, name, create=False):
+        value = self.__value(name)
+        if value is None:
+            value = self._new_sorted_set()
+            if create:
+                self.__store(name, value)
+        elif isinstance(value, set):
+            raise ResponseError(
+                'WRONGTYPE Operation against a key holding the wrong kind of value')
+        return value
+
+    def __members(self, name):
+        value = self.__value(name)
+        if value is None:
+            return set()
+        return value
+
+    def __scores(self, name):
+        value = self.__value(name)
+        if value is None:
+            return {}
+        if isinstance(value, set):
+            return dict.fromkeys(value, 1.0)
+        return dict(value.pairs())
+
+    def __list(self, keys, args):
+        if isinstance(keys, (bytes, str)):
+            keys = [keys]
+        return list(keys) + list(args)
+
+    def __scan(self, values, cursor, match, count):
+        '''
+        Retrieve a chunk of values for SCAN and SSCAN. Like Redis, values are visited in the
+        order of their hash, and the cursor is the hash to resume from, so that every value
+        present during the whole scan is returned even if others are added or removed.
+        '''
+        hashed = sorted(
+            (zlib.crc32(value.encode('utf-8')), value) for value in values
+            if match is None or fnmatch.fnmatchcase(value, self.__encode(match)))
+        cursor = int(cursor)
+        start = bisect.bisect_left(hashed, (cursor - 1,)) if cursor else 0
+        end = min(start + (count or 10), len(hashed))
+        while 0 < end < len(hashed) and hashed[end][0] == hashed[end - 1][0]:
+            end += 1
+        return (hashed[end][0] + 1 if end < len(hashed) else 0,
+                [self.__reply(value) for hash, value in hashed[start:end]])
+
+    def __rank_range(self, name, start, end, desc, withscores, score_cast_func):
+        members = self.__sorted_set(name)
+        size = len(members)
+        if start < 0:
+            start = max(size + start, 0)
+        if end < 0:
+            end = size + end
+        end = min(end, size - 1)
+        if start > end:
+            return []
+        if desc:
+            selected = members.slice(size - 1 - end, size - start)[::-1]
+        else:
+            selected = members.slice(start, end + 1)
+        return self.__items_reply(selected, withscores, score_cast_func)
+
+    def __score_range(self, name, min, max, desc, start, num, withscores, score_cast_func):
+        members = self.__sorted_set(name)
+        first, last = members.score_range(self.__bound(min), self.__bound(max))
+        selected = members.slice(first, last)
+        if desc:
+            selected = selected[::-1]
+        if start is not None and num is not None:
+            selected = selected[start:start + num] if num >= 0 else selected[start:]
+        return self.__items_reply(selected, withscores, score_cast_func)
+
+    def __bound(self, bound):
+        bound = self.__encode(bound)
+        exclusive = bound.startswith('(')
+        if exclusive:
+            bound = bound[1:]
+        return float(bound), exclusive
+
+    def __items_reply(self, items, withscores, score_cast_func):
+        if withscores:
+            return [(self.__reply(member), score_cast_func(score))
+                    for score, member in items]
+        return [self.__reply(member) for score, member in items]
+
+    def __store_combination(self, dest, keys, aggregate, union):
+        if isinstance(keys, dict):
+            weighted = list(keys.items())
+        else:
+            weighted = [(key, 1) for key in keys]
+        combine = {'MIN': min, 'MAX': max}.get(
+            (aggregate or 'SUM').upper(), lambda first, second: first + second)
+
+        scores = None
+        for key, weight in weighted:
+            source = self.__scores(key)
+            if scores is None:
+                scores = dict(
+                    (member, score * weight) for member, score in source.items())
+            elif union:
+                for member, score in source.items():
+                    score *= weight
+                    scores[member] = combine(scores[member], score) \
+                        if member in scores else score
+            else:
+                scores = dict(
+                    (member, combine(score, source[member] * weight))
+                    for member, score in scores.items() if member in source)
+
+        result = self._new_sorted_set()
+        for member, score in (scores or {}).items():
+            result.add(member, score)
+        self.__remove(self.__key(dest))
+        if len(result):
+            self.__store(dest, result)
+        return len(result)
+
@@ -0,0 +1,121 @@
+import bisect
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from .cluster import SlotPipeline, command_key, hash_tag
+
+
+class HashRing(object):
+    '''
+    Consistent hash ring. Every node is placed at a number of points on the ring, and a
+    value belongs to the first node found clockwise from the value's own hash. Adding or
+    removing a node only moves the values between that node and its neighbours.
+    '''
+
+    def __init__(self, nodes, replicas=160):
+        '''
+        Initialize a new hash ring.
+
+        @param nodes [list] Names of the nodes. Names, not positions, decide the placement.
+        @param replicas [int] Number of points per node.
+        '''
+        points = sorted(
+            (self.__hash('%s-%d' % (node, replica)), index)
+            for index, node in enumerate(nodes)
+            for replica in range(replicas))
+        self.__hashes = [point for point, index in points]
+        self.__nodes = [index for point, index in points]
+
+    def node_index(self, value):
+        '''
+        Find the node a value belongs to.
+
+        @param value [String] Value to place on the ring.
+        @return the index of the node in the list of nodes.
+        '''
+        position = bisect.bisect(self.__hashes, self.__hash(value))
+        return self.__nodes[position % len(self.__nodes)]
+
+    def __hash(self, value):
+        return int(hashlib.md5(value.encode('utf-8')).hexdigest()[:8], 16)
+
+
+class ShardPipeline(SlotPipeline):
+    '''
+    Pipeline for a ShardedRedis connection, split into one pipeline per node. The
+    pipelines run in parallel, each one in a MULTI transaction if requested.
+    '''
+
+    def _group(self, key):
+        return self.redis_connection.node_index(key)
+
+    def _pipeline(self, group):
+        return self.redis_connection.connections[group].pipeline(
+            transaction=self.transaction)
+
+
+class ShardedRedis(object):
+    '''
+    Spreads keys over several standalone Redis connections by consistent hashing on their
+    hash tag (namespace:type:scope:{id}), so that every set of an individual is stored on
+    the same node. Commands are routed to the node owning their first key, and pipelines
+    are split per node.
+    '''
+
+    def __init__(self, connections, replicas=160):
+        '''
+        Initialize a new sharded connection.
+
+        @param connections [list] Redis connections, one per node.
+        @param replicas [int] Number of points per node on the hash ring.
+        '''
+        self.connections = list(connections)
+        self.ring = HashRing(
+            [self.node_name(connection) for connection in self.connections],
+            replicas)
+        self.executor = ThreadPoolExecutor(len(self.connections))
+
+    def __getattr__(self, name):
+        def route(*args, **kwargs):
+            connection = self.connections[
+                self.node_index(command_key(name, args))]
+            return getattr(connection, name)(*args, **kwargs)
+        return route
+
+    def node_name(self, connection):
+        '''
+        Build the name a connection is placed on the hash ring with, from its address and
+        database, so that the placement does not depend on the order of the connections.
+
+        @param connection [redis] Redis connection.
+        @return the name of the node.
+        '''
+        kwargs = connection.connection_pool.connection_kwargs
+        if 'path' in kwargs:
+            return '%s/%s' % (kwargs['path'], kwargs.get('db', 0))
+        return '%s:%s/%s' % (
+            kwargs.get('host', 'localhost'), kwargs.get('port', 6379), kwargs.get('db', 0))
+
+    def node_index(self, key):
+        '''
+        Find the node owning a key.
+
+        @param key [String] Redis key.
+        @return the index of the node's connection in connections.
+        '''
+        return self.ring.node_index(hash_tag(key))
+
+    def pipeline(self, transaction=True):
+        '''
+        Create a pipeline, split into one pipeline per node when executed.
+
+        @param transaction [boolean] Whether to run each per-node pipeline in a transaction.
+        @return the pipeline.
+        '''
+        return ShardPipeline(self, self.executor, transaction)
+
+    def close(self):
+        '''
+        Stop the threads running the per-node pipelines.
+        '''
+        self.executor.shutdown()
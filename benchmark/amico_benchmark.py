@@ -0,0 +1,291 @@
+'''
+Benchmarks for the public Amico operations. A throwaway redis-server is started on a
+free port (unless --url is given), a relationship graph of configurable size is seeded,
+and each operation is timed over a number of iterations. Results are printed as a
+table and can be written as JSON to compare releases.
+'''
+
+import argparse
+import json
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import redis
+
+from amico import Amico
+
+
+class CountingConnection(redis.Connection):
+    '''
+    Redis connection counting the requests it sends: one per command, or one per
+    pipeline, which is what a round trip costs.
+    '''
+
+    requests = 0
+
+    def send_packed_command(self, command, check_health=True):
+        CountingConnection.requests += 1
+        return super(CountingConnection, self).send_packed_command(
+            command, check_health)
+
+
+class RedisServer(object):
+    '''
+    Throwaway redis-server listening on a free local port, without persistence.
+    '''
+
+    def __init__(self, executable='redis-server'):
+        self.executable = executable
+        self.directory = tempfile.mkdtemp(prefix='amico-benchmark-')
+        self.port = self.__free_port()
+        self.process = None
+
+    def start(self):
+        self.process = subprocess.Popen(
+            [self.executable, '--port', str(self.port), '--save', '',
+             '--appendonly', 'no', '--dir', self.directory],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        connection = redis.StrictRedis(port=self.port)
+        for attempt in range(100):
+            try:
+                connection.ping()
+                return
+            except redis.exceptions.ConnectionError:
+                time.sleep(0.05)
+        self.stop()
+        raise Exception('redis-server did not start on port %d' % self.port)
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __free_port(self):
+        sock = socket.socket()
+        sock.bind(('localhost', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        return port
+
+
+class Graph(object):
+    '''
+    Synthetic relationship graph. Every user follows a number of others drawn from a
+    Pareto distribution around the average degree. Targets are picked with a Zipf-like
+    popularity (low ids are the most followed), and the celebrities are followed by a
+    fixed share of all users.
+    '''
+
+    def __init__(self, users, degree, celebrities, celebrity_share, seed):
+        self.users = users
+        self.degree = degree
+        self.celebrities = list(range(1, celebrities + 1))
+        self.celebrity_share = celebrity_share
+        self.random = random.Random(seed)
+
+    def following(self, id):
+        count = min(
+            int(self.random.paretovariate(2.0) * self.degree / 2.0), self.users - 1)
+        ids = set(self.__popular_user() for index in range(count))
+        for celebrity in self.celebrities:
+            if self.random.random() < self.celebrity_share:
+                ids.add(celebrity)
+        ids.discard(id)
+        return list(ids)
+
+    def seed(self, amico):
+        for id in range(1, self.users + 1):
+            following = self.following(id)
+            for index in range(0, len(following), 1000):
+                amico.follow_many(id, following[index:index + 1000])
+
+    def user(self):
+        return self.random.randint(len(self.celebrities) + 1, self.users)
+
+    def celebrity(self):
+        return self.random.choice(self.celebrities)
+
+    def __popular_user(self):
+        return int(self.users ** self.random.random())
+
+
+def benchmarks(amico, graph):
+    '''
+    Build the benchmarked operations. Each one is a tuple of a name and a function
+    returning a call to time; mutations are paired with their inverse so that the graph
+    keeps its shape.
+    '''
+    fresh_ids = iter(range(graph.users + 1, sys.maxsize))
+
+    def follow():
+        from_id, to_id = graph.user(), graph.user()
+        amico.unfollow(from_id, to_id)
+        return lambda: amico.follow(from_id, to_id)
+
+    def unfollow():
+        from_id, to_id = graph.user(), graph.user()
+        amico.follow(from_id, to_id)
+        return lambda: amico.unfollow(from_id, to_id)
+
+    def block():
+        from_id, to_id = graph.user(), graph.user()
+        amico.unblock(from_id, to_id)
+        return lambda: amico.block(from_id, to_id)
+
+    def unblock():
+        from_id, to_id = graph.user(), graph.user()
+        amico.block(from_id, to_id)
+        return lambda: amico.unblock(from_id, to_id)
+
+    def clear():
+        id = next(fresh_ids)
+        amico.follow_many(id, graph.following(id))
+        amico.follow_many(graph.celebrity(), [id])
+        return lambda: amico.clear(id)
+
+    def call(method, *args, **kwargs):
+        return lambda: method(*args, **kwargs)
+
+    return [
+        ('follow', follow),
+        ('unfollow', unfollow),
+        ('block', block),
+        ('unblock', unblock),
+        ('clear', clear),
+        ('follow_many(100)', lambda: call(
+            amico.follow_many, next(fresh_ids), list(range(1, 101)))),
+        ('is_following', lambda: call(
+            amico.is_following, graph.user(), graph.user())),
+        ('is_follower_many(100)', lambda: call(
+            amico.is_follower_many, graph.celebrity(),
+            [graph.user() for index in range(100)])),
+        ('relationship_status', lambda: call(
+            amico.relationship_status, graph.user(), graph.user())),
+        ('followers_count', lambda: call(amico.followers_count, graph.user())),
+        ('counts(100)', lambda: call(
+            amico.counts, [graph.user() for index in range(100)])),
+        ('followers page 1', lambda: call(amico.followers, graph.user())),
+        ('followers page 1 (celebrity)', lambda: call(
+            amico.followers, graph.celebrity())),
+        ('followers last page (celebrity)', lambda: call(
+            amico.followers, graph.celebrity(), {'page_size': 25, 'page': 1000000})),
+        ('followers cursor page (celebrity)', lambda: call(
+            amico.followers, graph.celebrity(), {'page_size': 25, 'cursor': None})),
+        ('page (celebrity)', lambda: call(
+            amico.page, graph.celebrity(), 'followers')),
+        ('all following', lambda: call(amico.all, graph.user(), 'following')),
+        ('all followers (celebrity)', lambda: call(
+            amico.all, graph.celebrity(), 'followers')),
+        ('iter_all followers (celebrity)', lambda: call(
+            lambda id: list(amico.iter_all(id, 'followers')), graph.celebrity())),
+        ('common_followers', lambda: call(
+            amico.common_followers, graph.user(), graph.user())),
+        ('suggestions', lambda: call(amico.suggestions, graph.user())),
+    ]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run(amico, graph, iterations, only=None):
+    results = []
+    for name, prepare in benchmarks(amico, graph):
+        if only and not any(pattern in name for pattern in only):
+            continue
+        latencies = []
+        requests = 0
+        for iteration in range(iterations):
+            operation = prepare()
+            CountingConnection.requests = 0
+            start = time.perf_counter()
+            operation()
+            latencies.append(time.perf_counter() - start)
+            requests += CountingConnection.requests
+        results.append({
+            'operation': name,
+            'iterations': iterations,
+            'ops_per_second': iterations / sum(latencies),
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'round_trips': float(requests) / iterations})
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the public Amico operations.')
+    parser.add_argument('--url', help='Redis URL to use instead of starting redis-server; the database is flushed')
+    parser.add_argument('--redis-server', default='redis-server', help='redis-server executable')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--degree', type=int, default=50, help='average number of individuals followed')
+    parser.add_argument('--celebrities', type=int, default=10)
+    parser.add_argument('--celebrity-share', type=float, default=0.5, help='share of users following each celebrity')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--options', default='{}', help='Amico options as JSON')
+    parser.add_argument('--only', action='append', help='only run operations whose name contains this (repeatable)')
+    parser.add_argument('--output', help='file to write the results to as JSON')
+    arguments = parser.parse_args(argv)
+
+    server = None
+    if arguments.url:
+        pool = redis.ConnectionPool.from_url(
+            arguments.url, connection_class=CountingConnection)
+    else:
+        server = RedisServer(arguments.redis_server)
+        server.start()
+        pool = redis.ConnectionPool(
+            port=server.port, connection_class=CountingConnection)
+
+    try:
+        connection = redis.StrictRedis(connection_pool=pool)
+        connection.flushdb()
+        amico = Amico(json.loads(arguments.options), redis_connection=connection)
+        graph = Graph(
+            arguments.users, arguments.degree, arguments.celebrities,
+            arguments.celebrity_share, arguments.seed)
+
+        start = time.perf_counter()
+        graph.seed(amico)
+        seconds = time.perf_counter() - start
+        sys.stdout.write('Seeded %d users (%d keys) in %.1fs\n' % (
+            arguments.users, connection.dbsize(), seconds))
+
+        results = run(amico, graph, arguments.iterations, arguments.only)
+        amico.close()
+        report = {
+            'amico_version': Amico.VERSION,
+            'redis_version': connection.info()['redis_version'],
+            'python_version': platform.python_version(),
+            'timestamp': int(time.time()),
+            'parameters': vars(arguments),
+            'results': results}
+    finally:
+        if server is not None:
+            server.stop()
+
+    sys.stdout.write('%-36s %12s %10s %10s %12s\n' % (
+        'operation', 'ops/sec', 'p50 ms', 'p99 ms', 'round trips'))
+    for result in results:
+        sys.stdout.write('%-36s %12.1f %10.3f %10.3f %12.1f\n' % (
+            result['operation'], result['ops_per_second'], result['p50_ms'],
+            result['p99_ms'], result['round_trips']))
+
+    if arguments.output:
+        with open(arguments.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,23 @@
 import unittest
-from amico_test import AmicoTest
+from .amico_test import AmicoTest
+from .async_amico_test import AsyncAmicoTest
+from .cache_test import RelationshipCacheTest
+from .cluster_test import SlotPipelineTest
+from .sharding_test import ShardingTest
+from .instrumentation_test import InstrumentationTest
+from .memory_test import MemoryAmicoTest, MemoryRedisTest
+from .embedded_test import EmbeddedAmicoTest, EmbeddedRedisTest
 
 def all_tests():
   suite = unittest.TestSuite()
   suite.addTest(unittest.makeSuite(AmicoTest))
+  suite.addTest(unittest.makeSuite(AsyncAmicoTest))
+  suite.addTest(unittest.makeSuite(RelationshipCacheTest))
+  suite.addTest(unittest.makeSuite(SlotPipelineTest))
+  suite.addTest(unittest.makeSuite(ShardingTest))
+  suite.addTest(unittest.makeSuite(InstrumentationTest))
+  suite.addTest(unittest.makeSuite(MemoryAmicoTest))
+  suite.addTest(unittest.makeSuite(MemoryRedisTest))
+  suite.addTest(unittest.makeSuite(EmbeddedAmicoTest))
+  suite.addTest(unittest.makeSuite(EmbeddedRedisTest))
   return suite
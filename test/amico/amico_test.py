@@ -3,7 +3,7 @@ import time
 import sure
 
 import redis
-from amico import Amico
+from amico import Amico, RelationshipStatus
 
 
 class AmicoTest(unittest.TestCase):
@@ -12,7 +12,8 @@ class AmicoTest(unittest.TestCase):
         self.redis_connection = redis.StrictRedis(
             host='localhost',
             port=6379,
-            db=15)
+            db=15,
+            decode_responses=True)
 
     def tearDown(self):
         self.redis_connection.flushdb()
@@ -32,6 +33,8 @@ class AmicoTest(unittest.TestCase):
         Amico.DEFAULTS['pending_follow'].should.be.false
         Amico.DEFAULTS['default_scope_key'].should.equal('default')
         Amico.DEFAULTS['page_size'].should.equal(25)
+        Amico.DEFAULTS['use_scripts'].should.be.true
+        Amico.DEFAULTS['chunk_size'].should.equal(1000)
 
     # follow tests
     def test_it_should_allow_you_to_follow(self):
@@ -174,6 +177,66 @@ class AmicoTest(unittest.TestCase):
         amico.is_follower(1, 11).should.be.true
         amico.is_reciprocated(1, 11).should.be.true
 
+    # bulk follow tests
+    def test_it_should_allow_you_to_follow_many_individuals(self):
+        amico = Amico(redis_connection=self.redis_connection)
+        amico.follow(12, 1)
+        amico.block(13, 1)
+
+        outcomes = amico.follow_many(1, [1, 11, 12, 13])
+
+        outcomes.should.equal(
+            {1: 'self', 11: 'followed', 12: 'followed', 13: 'blocked'})
+        amico.following_count(1).should.equal(2)
+        amico.is_reciprocated(1, 12).should.be.true
+        amico.is_reciprocated(1, 11).should.be.false
+        amico.is_following(1, 13).should.be.false
+
+    def test_it_should_report_pending_outcomes_when_following_many_individuals(
+            self):
+        for use_scripts in [True, False]:
+            self.redis_connection.flushdb()
+            amico = Amico(
+                options={
+                    'pending_follow': True,
+                    'use_scripts': use_scripts},
+                redis_connection=self.redis_connection)
+            amico.follow(1, 11)
+
+            amico.follow_many(1, [11, 12]).should.equal(
+                {11: 'pending', 12: 'pending'})
+            amico.pending_with_count(1).should.equal(2)
+            amico.following_count(1).should.equal(0)
+
+    def test_it_should_follow_many_individuals_without_scripts(self):
+        amico = Amico(
+            options={
+                'use_scripts': False},
+            redis_connection=self.redis_connection)
+        amico.follow(12, 1)
+        amico.block(13, 1)
+
+        amico.follow_many(1, [1, 11, 12, 13]).should.equal(
+            {1: 'self', 11: 'followed', 12: 'followed', 13: 'blocked'})
+        amico.is_reciprocated(1, 12).should.be.true
+        amico.reciprocated_count(12).should.equal(1)
+
+    def test_it_should_allow_you_to_unfollow_many_individuals(self):
+        for use_scripts in [True, False]:
+            self.redis_connection.flushdb()
+            amico = Amico(
+                options={
+                    'use_scripts': use_scripts},
+                redis_connection=self.redis_connection)
+            amico.follow_many(1, [11, 12, 13])
+            amico.follow(11, 1)
+
+            amico.unfollow_many(1, [1, 11, 12]).should.equal(
+                {1: 'self', 11: 'unfollowed', 12: 'unfollowed'})
+            amico.following(1).should.equal(['13'])
+            amico.reciprocated_count(11).should.equal(0)
+            amico.followers_count(12).should.equal(0)
+
     # unfollow tests
     def test_it_should_allow_you_to_unfollow(self):
         amico = Amico(redis_connection=self.redis_connection)
@@ -329,6 +392,80 @@ class AmicoTest(unittest.TestCase):
         amico.block(1, 11)
         amico.is_blocked_by(11, 1).should.be.true
 
+    # batch predicate tests
+    def test_it_should_check_many_relationships_at_once(self):
+        for zmscore_supported in [True, False]:
+            self.redis_connection.flushdb()
+            amico = Amico(redis_connection=self.redis_connection)
+            amico._zmscore_supported = zmscore_supported
+            amico.follow_many(1, [11, 12])
+            amico.follow_many(13, [1])
+            amico.follow(12, 1)
+            amico.block(1, 14)
+
+            amico.is_following_many(1, [11, 12, 13]).should.equal(
+                [True, True, False])
+            amico.is_follower_many(1, [11, 12, 13]).should.equal(
+                [False, True, True])
+            amico.is_reciprocated_many(1, [11, 12, 13]).should.equal(
+                [False, True, False])
+            amico.is_blocked_many(1, [13, 14]).should.equal([False, True])
+            amico.is_blocked_by_many(14, [1, 13]).should.equal([True, False])
+            amico.is_following_many(1, []).should.equal([])
+
+    def test_it_should_check_many_pending_relationships_at_once(self):
+        amico = Amico(
+            options={
+                'pending_follow': True},
+            redis_connection=self.redis_connection)
+        amico.follow(1, 11)
+        amico.follow(12, 1)
+
+        amico.is_pending_many(1, [11, 12]).should.equal(
+            [amico.is_pending(1, 11), amico.is_pending(1, 12)])
+        amico.is_pending_many(1, [11, 12]).should.equal([True, False])
+        amico.is_pending_with_many(1, [11, 12]).should.equal(
+            [amico.is_pending_with(1, 11), amico.is_pending_with(1, 12)])
+        amico.is_pending_with_many(1, [11, 12]).should.equal([False, True])
+
+    # relationship status tests
+    def test_it_should_return_every_relationship_flag_between_two_individuals(
+            self):
+        amico = Amico(redis_connection=self.redis_connection)
+        amico.follow(1, 11)
+        amico.follow(11, 1)
+
+        status = amico.relationship_status(1, 11)
+        status.should.equal(RelationshipStatus(
+            following=True, followed_by=True, reciprocated=True,
+            blocked=False, blocked_by=False, pending=False, pending_with=False))
+
+        amico.block(11, 1)
+        status = amico.relationship_status(1, 11)
+        status.following.should.be.false
+        status.reciprocated.should.be.false
+        status.blocked_by.should.be.true
+        amico.relationship_status(11, 1).blocked.should.be.true
+
+    def test_it_should_return_relationship_flags_for_many_individuals(self):
+        amico = Amico(
+            options={
+                'pending_follow': True},
+            redis_connection=self.redis_connection)
+        amico.follow(1, 11)
+        amico.follow(12, 1)
+
+        statuses = amico.relationship_statuses(1, [11, 12, 13])
+        statuses.should.have.length_of(3)
+        for to_id, status in zip([11, 12, 13], statuses):
+            status.pending.should.equal(amico.is_pending(1, to_id))
+            status.pending_with.should.equal(amico.is_pending_with(1, to_id))
+            status.following.should.be.false
+        statuses[0].pending.should.be.true
+        statuses[1].pending_with.should.be.true
+        statuses[2].should.equal(RelationshipStatus(
+            False, False, False, False, False, False, False))
+
     # unblock tests
     def test_it_should_allow_you_to_block_someone_you_have_blocked(self):
         amico = Amico(redis_connection=self.redis_connection)
@@ -381,6 +518,47 @@ class AmicoTest(unittest.TestCase):
         amico.is_pending_with(1, 11).should.be.false
         amico.is_blocked(1, 11).should.be.true
 
+    # script tests
+    def test_it_should_reload_scripts_if_they_are_flushed_from_redis(self):
+        amico = Amico(redis_connection=self.redis_connection)
+        amico.follow(1, 11)
+        self.redis_connection.script_flush()
+        amico.follow(11, 1)
+        amico.is_reciprocated(1, 11).should.be.true
+
+    def test_it_should_manage_relationships_without_scripts(self):
+        amico = Amico(
+            options={
+                'use_scripts': False},
+            redis_connection=self.redis_connection)
+        amico.follow(1, 11)
+        amico.follow(11, 1)
+        amico.is_reciprocated(1, 11).should.be.true
+        amico.unfollow(11, 1)
+        amico.is_reciprocated(1, 11).should.be.false
+        amico.block(1, 11)
+        amico.is_following(11, 1).should.be.false
+        amico.is_blocked(1, 11).should.be.true
+        amico.follow(11, 1)
+        amico.is_following(11, 1).should.be.false
+        amico.unblock(1, 11)
+        amico.is_blocked_by(11, 1).should.be.false
+
+        amico = Amico(
+            options={
+                'pending_follow': True,
+                'use_scripts': False},
+            redis_connection=self.redis_connection)
+        amico.follow(2, 12)
+        amico.follow(3, 12)
+        amico.is_pending(2, 12).should.be.true
+        amico.accept(2, 12)
+        amico.is_pending(2, 12).should.be.false
+        amico.is_following(2, 12).should.be.true
+        amico.deny(3, 12)
+        amico.is_pending(3, 12).should.be.false
+        amico.is_following(3, 12).should.be.false
+
     # clear tests
     def test_it_should_remove_follower_and_following_relationships(self):
         amico = Amico(redis_connection=self.redis_connection)
@@ -426,6 +604,43 @@ class AmicoTest(unittest.TestCase):
         amico.blocked_count(1).should.equal(0)
         amico.blocked_by_count(11).should.equal(0)
 
+    def test_it_should_clear_relationships_in_chunks(self):
+        amico = Amico(redis_connection=self.redis_connection)
+        amico.follow_many(1, range(10, 25))
+        for follower_id in range(10, 17):
+            amico.follow(follower_id, 1)
+
+        amico.clear(1, chunk_size=4)
+
+        amico.following_count(1).should.equal(0)
+        amico.followers_count(1).should.equal(0)
+        amico.reciprocated_count(1).should.equal(0)
+        for id in range(10, 25):
+            amico.followers_count(id).should.equal(0)
+            amico.following_count(id).should.equal(0)
+            amico.reciprocated_count(id).should.equal(0)
+
+    def test_it_should_allow_clear_to_be_resumed_from_a_cursor(self):
+        amico = Amico(redis_connection=self.redis_connection)
+        amico.follow_many(1, range(10, 15))
+        amico.block(1, 20)
+
+        cursor = amico.clear_chunk(1, chunk_size=2)
+        cursor.should.equal(1)
+        amico.following_count(1).should.equal(3)
+        amico.followers_count(10).should.equal(0)
+        amico.followers_count(14).should.equal(1)
+
+        cursor = amico.clear_chunk(1, cursor, chunk_size=2)
+        cursor = amico.clear_chunk(1, cursor, chunk_size=2)
+        amico.following_count(1).should.equal(0)
+        amico.blocked_by_count(20).should.equal(1)
+
+        while cursor != 0:
+            cursor = amico.clear_chunk(1, cursor, chunk_size=2)
+        amico.blocked_count(1).should.equal(0)
+        amico.blocked_by_count(20).should.equal(0)
+
     # list and paging tests
     def test_it_should_return_the_correct_following_list(self):
         amico = Amico(redis_connection=self.redis_connection)
@@ -452,6 +667,69 @@ class AmicoTest(unittest.TestCase):
                 'page': 1,
                 'page_size': 26}).should.have.length_of(25)
 
+    def test_following_should_page_with_a_cursor(self):
+        for use_scripts in [True, False]:
+            self.redis_connection.flushdb()
+            amico = Amico(
+                options={
+                    'use_scripts': use_scripts},
+                redis_connection=self.redis_connection)
+            amico.follow_many(1, range(10, 23))
+            everyone = amico.all(1, 'following')
+
+            page_options = {'page_size': 5, 'cursor': None}
+            pages = []
+            while True:
+                pages.append(amico.following(1, page_options))
+                if page_options['cursor'] is None:
+                    break
+
+            [len(page) for page in pages].should.equal([5, 5, 3])
+            sum(pages, []).should.equal(everyone)
+
+    def test_cursor_paging_should_be_stable_while_relationships_change(self):
+        for use_scripts in [True, False]:
+            self.redis_connection.flushdb()
+            amico = Amico(
+                options={
+                    'use_scripts': use_scripts},
+                redis_connection=self.redis_connection)
+            amico.follow_many(1, range(10, 20))
+            everyone = amico.all(1, 'following')
+
+            page_options = {'page_size': 4, 'cursor': None}
+            first_page = amico.following(1, page_options)
+            amico.follow(1, 30)
+            amico.unfollow(1, int(first_page[-1]))
+            second_page = amico.following(1, page_options)
+            third_page = amico.following(1, page_options)
+
+            (first_page + second_page + third_page).should.equal(everyone)
+            page_options['cursor'].should.be.none
+
+    def test_it_should_return_a_page_with_its_totals(self):
+        amico = Amico(redis_connection=self.redis_connection)
+        amico.follow_many(1, range(10, 22))
+
+        result = amico.page(1, 'following', {'page': 2, 'page_size': 5})
+        result['members'].should.equal(
+            amico.following(1, {'page': 2, 'page_size': 5}))
+        result['page'].should.equal(2)
+        result['page_size'].should.equal(5)
+        result['total_count'].should.equal(12)
+        result['total_pages'].should.equal(3)
+
+        result = amico.page(1, 'following', {'page': 7, 'page_size': 5})
+        result['page'].should.equal(3)
+        result['members'].should.have.length_of(2)
+
+        result = amico.page(1, 'blocked')
+        result['members'].should.equal([])
+        result['total_count'].should.equal(0)
+        result['total_pages'].should.equal(0)
+
+        amico.page.when.called_with(1, 'unknown').should.throw(Exception)
+
     def test_it_should_return_the_correct_followers_list(self):
         amico = Amico(redis_connection=self.redis_connection)
         amico.follow(1, 11)
@@ -587,6 +865,26 @@ class AmicoTest(unittest.TestCase):
 
         amico.count(1, 'pending').should.equal(4)
 
+    def test_it_should_return_counts_for_many_individuals_and_types(self):
+        amico = Amico(redis_connection=self.redis_connection)
+        amico.follow_many(1, [11, 12])
+        amico.follow(11, 1)
+        amico.block(12, 13)
+
+        counts = amico.counts([1, 11, 12], ['following', 'followers', 'reciprocated'])
+        counts.should.equal({
+            1: {'following': 2, 'followers': 1, 'reciprocated': 1},
+            11: {'following': 1, 'followers': 1, 'reciprocated': 1},
+            12: {'following': 0, 'followers': 1, 'reciprocated': 0}})
+
+        counts = amico.counts([12])
+        sorted(counts[12].keys()).should.equal(sorted(Amico.VALID_RELATIONSHIPS))
+        counts[12]['blocked'].should.equal(1)
+        amico.counts([]).should.equal({})
+
+        amico.counts.when.called_with(
+            [1], ['following', 'unknown']).should.throw(Exception)
+
     def test_it_should_return_the_correct_page_count_for_various_types_of_relationships(
             self):
         amico = Amico(redis_connection=self.redis_connection)
@@ -653,6 +951,401 @@ class AmicoTest(unittest.TestCase):
         amico.all(1, 'blocked').should.have.length_of(4)
         amico.all(1, 'blocked_by').should.have.length_of(4)
 
+    def test_it_should_iterate_over_all_relationships_in_chunks(self):
+        amico = Amico(redis_connection=self.redis_connection)
+        amico.follow_many(1, range(10, 27))
+        amico.block(1, 30)
+
+        list(amico.iter_all(1, 'following', chunk_size=5)).should.equal(
+            amico.all(1, 'following'))
+        list(amico.iter_all(1, 'following')).should.have.length_of(17)
+        list(amico.iter_all(1, 'blocked', chunk_size=1)).should.equal(['30'])
+        list(amico.iter_all(1, 'pending', chunk_size=5)).should.equal([])
+        list.when.called_with(
+            amico.iter_all(1, 'unknown')).should.throw(Exception)
+
+    def test_it_should_use_compact_keys(self):
+        amico = Amico(
+            {'compact_keys': True, 'scope_aliases': {'default': 'd'}},
+            redis_connection=self.redis_connection)
+        amico.follow(1, 11)
+        amico.follow(11, 1)
+
+        self.redis_connection.exists('amico:fg:d:1').should.equal(1)
+        self.redis_connection.exists('amico:fr:d:11').should.equal(1)
+        self.redis_connection.exists('amico:r:d:1').should.equal(1)
+        self.redis_connection.exists('amico:following:default:1').should.equal(0)
+        amico.is_following(1, 11).should.be.true
+        amico.is_reciprocated(1, 11).should.be.true
+        amico.following_count(1).should.equal(1)
+        amico.following(1).should.equal(['11'])
+        amico.key_schema.parse('amico:fg:d:user:1').should.equal(
+            ('following', 'default', 'user:1'))
+        amico.key_schema.parse('other:fg:d:1').should.be.none
+
+    def test_it_should_read_legacy_keys_while_migrating(self):
+        legacy = Amico(redis_connection=self.redis_connection)
+        legacy.follow_many(1, [11, 12, 13])
+        legacy.follow(11, 1)
+        legacy.block(2, 1)
+
+        amico = Amico(
+            {'compact_keys': True, 'legacy_keys': {}},
+            redis_connection=self.redis_connection)
+        amico.is_following(1, 11).should.be.true
+        amico.is_blocked_by(1, 2).should.be.true
+        amico.following_count(1).should.equal(3)
+        amico.following_page_count(1, 2).should.equal(2)
+        amico.following(1).should.equal(['13', '12', '11'])
+        amico.following(1, {'page_size': 2, 'cursor': None}).should.equal(
+            ['13', '12'])
+        list(amico.iter_all(1, 'following', chunk_size=2)).should.equal(
+            ['13', '12', '11'])
+        amico.counts([1, 11], ['following', 'followers'])[11].should.equal(
+            {'following': 1, 'followers': 1})
+        amico.is_following_many(1, [11, 14]).should.equal([True, False])
+        amico.relationship_status(1, 11).reciprocated.should.be.true
+
+        amico.unfollow(1, 12)
+        self.redis_connection.exists('amico:following:default:1').should.equal(0)
+        self.redis_connection.exists('amico:followers:default:12').should.equal(0)
+        amico.following(1).should.equal(['13', '11'])
+        amico.followers_count(12).should.equal(0)
+
+        amico.migrate_keys(chunk_size=2).should.be.greater_than(0)
+        self.redis_connection.keys('amico:following:*').should.equal([])
+        self.redis_connection.keys('amico:blocked*').should.equal([])
+        amico.followers(11).should.equal(['1'])
+        amico.blocked(2).should.equal(['1'])
+        amico.migrate_keys().should.equal(0)
+
+    def test_it_should_merge_legacy_writes_while_migrating(self):
+        legacy = Amico(redis_connection=self.redis_connection)
+        amico = Amico(
+            {'compact_keys': True, 'legacy_keys': {}, 'use_scripts': False},
+            redis_connection=self.redis_connection)
+        amico.follow(1, 11)
+        legacy.follow(1, 12)
+
+        amico.following(1).should.equal(['11'])
+        amico.migrate_keys().should.equal(2)
+        amico.following_count(1).should.equal(2)
+        amico.followers(12).should.equal(['1'])
+        amico = Amico(redis_connection=self.redis_connection)
+        amico.migrate_keys.when.called_with().should.throw(Exception)
+
+    def test_it_should_store_set_scopes_in_redis_sets(self):
+        for use_scripts in [True, False]:
+            self.redis_connection.flushdb()
+            amico = Amico(
+                {'set_scopes': ['friends'], 'use_scripts': use_scripts},
+                redis_connection=self.redis_connection)
+            amico.follow_many(1, [13, 11, 12, 2], scope='friends')
+            amico.follow(11, 1, scope='friends')
+            amico.follow(1, 11)
+
+            self.redis_connection.type(
+                'amico:following:friends:1').should.equal('set')
+            self.redis_connection.object(
+                'encoding', 'amico:following:friends:1').should.equal('intset')
+            self.redis_connection.type(
+                'amico:following:default:1').should.equal('zset')
+            amico.is_following(1, 11, 'friends').should.be.true
+            amico.is_following(1, 14, 'friends').should.be.false
+            amico.is_reciprocated(1, 11, 'friends').should.be.true
+            amico.is_following_many(1, [11, 14], 'friends').should.equal(
+                [True, False])
+            amico.relationship_status(1, 11, 'friends').reciprocated.should.be.true
+            amico.following_count(1, 'friends').should.equal(4)
+            amico.counts([1], ['following', 'reciprocated'], 'friends').should.equal(
+                {1: {'following': 4, 'reciprocated': 1}})
+            amico.following(1, scope='friends').should.equal(
+                ['2', '11', '12', '13'])
+            amico.following(1, {'page_size': 3, 'page': 2}, 'friends').should.equal(
+                ['13'])
+            amico.following_page_count(1, 3, 'friends').should.equal(2)
+            amico.page(1, 'following', {'page_size': 3, 'page': 5}, 'friends')[
+                'members'].should.equal(['13'])
+            page_options = {'page_size': 3, 'cursor': None}
+            amico.following(1, page_options, 'friends').should.equal(
+                ['2', '11', '12'])
+            amico.following(1, page_options, 'friends').should.equal(['13'])
+            page_options['cursor'].should.be.none
+            sorted(amico.iter_all(1, 'following', 'friends', 2)).should.equal(
+                ['11', '12', '13', '2'])
+            amico.all(1, 'following', 'friends').should.have.length_of(4)
+
+            amico.block(1, 11, 'friends')
+            amico.is_following(1, 11, 'friends').should.be.false
+            amico.is_reciprocated(1, 11, 'friends').should.be.false
+            amico.is_blocked(1, 11, 'friends').should.be.true
+            amico.follow_many(11, [1], 'friends').should.equal({1: 'blocked'})
+
+            amico.clear(1, 'friends', chunk_size=2)
+            amico.following_count(1, 'friends').should.equal(0)
+            amico.blocked_by_count(11, 'friends').should.equal(0)
+            amico.followers_count(12, 'friends').should.equal(0)
+            amico.is_following(1, 11).should.be.true
+
+    def test_it_should_cache_predicates_and_counts(self):
+        amico = Amico({'cache_size': 100}, redis_connection=self.redis_connection)
+        writer = Amico(redis_connection=self.redis_connection)
+        try:
+            amico.is_following(1, 11).should.be.false
+            amico.followers_count(11).should.equal(0)
+            len(amico.cache).should.equal(2)
+            amico.is_following(1, 11).should.be.false
+
+            amico.follow(1, 11)
+            amico.is_following(1, 11).should.be.true
+            amico.followers_count(11).should.equal(1)
+
+            writer.block(11, 1)
+            deadline = time.time() + 1
+            while amico.is_following(1, 11) and time.time() < deadline:
+                time.sleep(0.01)
+            amico.is_following(1, 11).should.be.false
+            amico.is_blocked_by(1, 11).should.be.true
+        finally:
+            amico.close()
+
+        amico.is_blocked_by(1, 11).should.be.true
+        len(amico.cache).should.equal(0)
+
+    def test_it_should_retrieve_common_relationships(self):
+        amico = Amico(redis_connection=self.redis_connection)
+        amico.follow_many(1, [10, 11, 12, 13])
+        amico.follow_many(2, [13, 11, 14])
+        amico.follow_many(10, [1, 2])
+        amico.follow_many(11, [1, 2, 3])
+
+        amico.common_following(1, 2).should.equal(['13', '11'])
+        amico.common_following(1, 2, {'page_size': 1, 'page': 2}).should.equal(
+            ['11'])
+        amico.common_following(1, 2, {'page_size': 1, 'page': 5}).should.equal(
+            ['11'])
+        amico.common_following(1, 3).should.equal([])
+        amico.common_followers(1, 2).should.equal(['11', '10'])
+        amico.followers_you_know(1, 3).should.equal(['11'])
+        amico.followers_you_know(3, 1).should.equal([])
+        self.redis_connection.keys('amico:intersection:*').should.equal([])
+
+    def test_it_should_keep_intersections_for_the_intersection_ttl(self):
+        amico = Amico(
+            {'intersection_ttl': 60, 'set_scopes': ['friends']},
+            redis_connection=self.redis_connection)
+        amico.follow_many(1, [10, 11, 12], 'friends')
+        amico.follow_many(2, [12, 11, 13], 'friends')
+
+        amico.common_following(1, 2, scope='friends').should.equal(['11', '12'])
+        key = 'amico:intersection:amico:following:friends:1|amico:following:friends:2'
+        self.redis_connection.ttl(key).should.be.greater_than(0)
+
+        amico.unfollow(1, 11, 'friends')
+        amico.common_following(1, 2, {'page_size': 1, 'page': 1}, 'friends').should.equal(
+            ['11'])
+        self.redis_connection.delete(key)
+        amico.common_following(1, 2, scope='friends').should.equal(['12'])
+
+    def test_it_should_suggest_second_degree_connections(self):
+        for use_scripts in [True, False]:
+            for scope in ['default', 'friends']:
+                self.redis_connection.flushdb()
+                amico = Amico(
+                    {'use_scripts': use_scripts, 'set_scopes': ['friends']},
+                    redis_connection=self.redis_connection)
+                amico.follow_many(1, [10, 11, 12], scope)
+                amico.follow_many(10, [1, 20, 21, 22, 12], scope)
+                amico.follow_many(11, [20, 21, 23], scope)
+                amico.follow_many(12, [20, 24], scope)
+                amico.block(1, 23, scope)
+                amico.block(24, 1, scope)
+
+                amico.suggestions(1, scope).should.equal(
+                    [('20', 3), ('21', 2), ('22', 1)])
+                amico.suggestions(1, scope, limit=1).should.equal([('20', 3)])
+                amico.suggestions(2, scope).should.equal([])
+
+                amico.follow(1, 20, scope)
+                amico.suggestions(1, scope, limit=1).should.equal([('21', 2)])
+
+    def test_it_should_bound_the_sample_read_from_each_connection(self):
+        amico = Amico(
+            {'suggestion_sample_size': 1}, redis_connection=self.redis_connection)
+        amico.follow(1, 10)
+        amico.follow(1, 11)
+        amico.follow(11, 20)
+        amico.follow(11, 21)
+
+        amico.suggestions(1).should.have.length_of(1)
+        amico.follow(21, 1)
+        amico.follow(1, 21)
+        amico.suggestions(1, type='reciprocated').should.equal([])
+        amico.suggestions.when.called_with(1, type='followers').should.throw(
+            Exception)
+
+    def test_it_should_derive_reciprocated_relationships_with_lazy_reciprocated(self):
+        for use_scripts in [True, False]:
+            for intersection_ttl in [0, 60]:
+                self.redis_connection.flushdb()
+                amico = Amico(
+                    {'use_scripts': use_scripts,
+                     'lazy_reciprocated': True,
+                     'intersection_ttl': intersection_ttl},
+                    redis_connection=self.redis_connection)
+                amico.follow_many(1, [10, 11, 12])
+                amico.follow(11, 1)
+                amico.follow(12, 1)
+                amico.follow(13, 1)
+                self.redis_connection.keys('amico:reciprocated:*').should.equal([])
+
+                amico.is_reciprocated(1, 11).should.be.true
+                amico.reciprocated_count(1).should.equal(2)
+                amico.reciprocated_page_count(1, 1).should.equal(2)
+                amico.reciprocated(1).should.equal(['12', '11'])
+                amico.all(1, 'reciprocated').should.equal(['12', '11'])
+                list(amico.iter_all(1, 'reciprocated', chunk_size=1)).should.equal(
+                    ['12', '11'])
+                page = amico.page(1, 'reciprocated', {'page_size': 1, 'page': 3})
+                page['members'].should.equal(['11'])
+                page['total_count'].should.equal(2)
+                amico.counts([1, 13], ['following', 'reciprocated']).should.equal(
+                    {1: {'following': 3, 'reciprocated': 2},
+                     13: {'following': 1, 'reciprocated': 0}})
+                amico.reciprocated.when.called_with(
+                    1, {'page_size': 1, 'cursor': None}).should.throw(Exception)
+
+                amico.block(1, 12)
+                amico.unfollow(11, 1)
+                self.redis_connection.delete(
+                    'amico:intersection:amico:following:default:1|amico:followers:default:1')
+                amico.reciprocated_count(1).should.equal(0)
+                amico.clear(1)
+                amico.following_count(1).should.equal(0)
+
+    def test_it_should_suggest_reciprocated_connections_with_lazy_reciprocated(self):
+        for use_scripts in [True, False]:
+            for intersection_ttl in [0, 60]:
+                for scope in ['default', 'friends']:
+                    self.redis_connection.flushdb()
+                    amico = Amico(
+                        {'use_scripts': use_scripts,
+                         'lazy_reciprocated': True,
+                         'intersection_ttl': intersection_ttl,
+                         'set_scopes': ['friends']},
+                        redis_connection=self.redis_connection)
+                    for from_id, to_id in [(1, 2), (2, 3), (2, 4), (2, 5), (3, 4)]:
+                        amico.follow(from_id, to_id, scope)
+                        if to_id != 5:
+                            amico.follow(to_id, from_id, scope)
+
+                    amico.suggestions(1, scope, type='reciprocated').should.equal(
+                        [('3', 1), ('4', 1)])
+                    amico.suggestions(3, scope, type='reciprocated').should.equal([('1', 1)])
+                    amico.suggestions(5, scope, type='reciprocated').should.equal([])
+
+    def test_it_should_map_read_methods_over_ids_on_a_thread_pool(self):
+        amico = Amico(redis_connection=redis.StrictRedis(
+            connection_pool=redis.BlockingConnectionPool(
+                host='localhost', port=6379, db=15, decode_responses=True,
+                max_connections=2)))
+        for id in range(1, 21):
+            amico.follow_many(id, list(range(100, 100 + id)))
+
+        list(amico.map('following_count', range(1, 21), workers=4)).should.equal(
+            list(range(1, 21)))
+        list(amico.map(amico.following, [3, 1], workers=2,
+                       page_options={'page_size': 1, 'page': 1})).should.equal(
+            [['102'], ['100']])
+        list(amico.map('following_count', iter([]))).should.equal([])
+        amico.map.when.called_with('unknown_method', [1]).should.throw(AttributeError)
+
+    def test_it_should_buffer_and_coalesce_follows_and_unfollows(self):
+        for use_scripts in [True, False]:
+            self.redis_connection.flushdb()
+            amico = Amico(
+                {'use_scripts': use_scripts,
+                 'write_buffer_size': 3,
+                 'write_buffer_interval': 60000},
+                redis_connection=self.redis_connection)
+            amico.follow(1, 11)
+            amico.follow(1, 12)
+            amico.unfollow(1, 12)
+            amico.follow(1, 1)
+            amico.is_following(1, 11).should.be.false
+
+            amico.flush()
+            amico.following(1).should.equal(['11'])
+            amico.follow(11, 1)
+            amico.follow(1, 13)
+            amico.follow(1, 14)
+            amico.follow(1, 15)
+            amico.following_count(1).should.equal(3)
+            amico.is_reciprocated(1, 11).should.be.true
+
+            amico.follow(1, 16)
+            amico.block(1, 16)
+            amico.is_following(1, 16).should.be.false
+
+            amico.unfollow(1, 11)
+            amico.close()
+            amico.following_count(1).should.equal(3)
+            amico.reciprocated_count(1).should.equal(0)
+
+    def test_it_should_keep_writes_buffered_during_a_flush_for_the_next_one(self):
+        amico = Amico(
+            {'use_scripts': False,
+             'write_buffer_size': 100,
+             'write_buffer_interval': 60000},
+            redis_connection=self.redis_connection)
+        amico.follow(2, 12)
+        amico.follow(1, 11)
+
+        # Buffer the opposite operation once the flush has taken the buffered writes.
+        pipeline = self.redis_connection.pipeline
+        unfollowed = []
+
+        def unfollow_then_pipeline(*args, **kwargs):
+            if not unfollowed:
+                unfollowed.append(True)
+                amico.unfollow(1, 11)
+            return pipeline(*args, **kwargs)
+        self.redis_connection.pipeline = unfollow_then_pipeline
+
+        amico.flush()
+        amico.is_following(2, 12).should.be.true
+        amico.flush()
+        amico.is_following(1, 11).should.be.false
+        amico.close()
+
+    def test_it_should_flush_buffered_writes_periodically(self):
+        amico = Amico(
+            {'write_buffer_size': 100, 'write_buffer_interval': 10},
+            redis_connection=self.redis_connection)
+        amico.follow(1, 11)
+        for attempt in range(100):
+            if amico.is_following(1, 11):
+                break
+            time.sleep(0.01)
+        amico.is_following(1, 11).should.be.true
+        amico.close()
+
+    def test_it_should_use_plain_pipelines_without_the_transactions_option(self):
+        amico = Amico(
+            {'use_scripts': False, 'transactions': False},
+            redis_connection=self.redis_connection)
+        amico.follow_many(1, [11, 12])
+        amico.follow(11, 1)
+        amico.is_reciprocated(1, 11).should.be.true
+        amico.reciprocated(1).should.equal(['11'])
+        amico.following(1, {'page_size': 1, 'page': 3}).should.equal(['11'])
+        amico.block(1, 12)
+        amico.following(1).should.equal(['11'])
+        amico.unblock(1, 12)
+        amico.unfollow(1, 11)
+        amico.counts([1], ['following', 'blocked', 'reciprocated'])[1].should.equal(
+            {'following': 0, 'blocked': 0, 'reciprocated': 0})
+
     # helper methods
     def __add_reciprocal_followers(
             self,
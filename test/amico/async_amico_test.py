@@ -0,0 +1,137 @@
+import unittest
+import asyncio
+import sure
+
+import redis.asyncio
+from amico import AsyncAmico
+
+
+class AsyncAmicoTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.redis_connection = redis.asyncio.StrictRedis(
+            host='localhost',
+            port=6379,
+            db=15,
+            decode_responses=True)
+
+    async def asyncTearDown(self):
+        await self.redis_connection.flushdb()
+        await self.redis_connection.aclose()
+
+    async def test_it_should_allow_you_to_follow(self):
+        amico = AsyncAmico(redis_connection=self.redis_connection)
+        await amico.follow(1, 11)
+
+        (await amico.is_following(1, 11)).should.be.true
+        (await amico.is_follower(11, 1)).should.be.true
+        (await amico.following_count(1)).should.equal(1)
+        (await amico.followers_count(11)).should.equal(1)
+
+    async def test_it_should_add_reciprocated_relationships(self):
+        for use_scripts in [True, False]:
+            await self.redis_connection.flushdb()
+            amico = AsyncAmico(
+                options={
+                    'use_scripts': use_scripts},
+                redis_connection=self.redis_connection)
+            await amico.follow(1, 11)
+            await amico.follow(11, 1)
+
+            (await amico.is_reciprocated(1, 11)).should.be.true
+            (await amico.reciprocated(1)).should.equal(['11'])
+
+            await amico.unfollow(11, 1)
+            (await amico.is_reciprocated(1, 11)).should.be.false
+            (await amico.reciprocated_count(1)).should.equal(0)
+
+    async def test_it_should_allow_you_to_block_and_unblock(self):
+        amico = AsyncAmico(redis_connection=self.redis_connection)
+        await amico.follow(11, 1)
+        await amico.block(1, 11)
+
+        (await amico.is_following(11, 1)).should.be.false
+        (await amico.is_blocked(1, 11)).should.be.true
+        (await amico.is_blocked_by(11, 1)).should.be.true
+        (await amico.blocked(1)).should.equal(['11'])
+        (await amico.follow_many(11, [1, 11])).should.equal(
+            {1: 'blocked', 11: 'self'})
+
+        await amico.unblock(1, 11)
+        (await amico.is_blocked(1, 11)).should.be.false
+
+    async def test_it_should_accept_and_deny_pending_relationships(self):
+        amico = AsyncAmico(
+            options={
+                'pending_follow': True},
+            redis_connection=self.redis_connection)
+        await amico.follow(1, 11)
+        await amico.follow(2, 11)
+        (await amico.is_pending(1, 11)).should.be.true
+        (await amico.is_pending_with(11, 1)).should.be.true
+        (await amico.pending_count(11)).should.equal(2)
+
+        await amico.accept(1, 11)
+        await amico.deny(2, 11)
+
+        (await amico.is_following(1, 11)).should.be.true
+        (await amico.is_following(2, 11)).should.be.false
+        (await amico.pending_with_count(2)).should.equal(0)
+
+    async def test_it_should_page_and_count_relationships(self):
+        amico = AsyncAmico(redis_connection=self.redis_connection)
+        await amico.follow_many(1, range(10, 37))
+
+        (await amico.following(1)).should.have.length_of(25)
+        (await amico.following(1, page_options={'page': 2, 'page_size': 25})).should.have.length_of(2)
+        (await amico.following_page_count(1)).should.equal(2)
+        (await amico.page_count(1, 'following', page_size=10)).should.equal(3)
+        (await amico.count(1, 'following')).should.equal(27)
+        (await amico.all(1, 'following')).should.have.length_of(27)
+        (await amico.all(1, 'blocked')).should.equal([])
+
+    async def test_it_should_allow_concurrent_lookups(self):
+        amico = AsyncAmico(redis_connection=self.redis_connection)
+        await amico.follow_many(1, [11, 12])
+
+        results = await asyncio.gather(
+            *[amico.is_following(1, id) for id in [11, 12, 13]])
+        results.should.equal([True, True, False])
+
+    async def test_it_should_clear_relationships(self):
+        amico = AsyncAmico(redis_connection=self.redis_connection)
+        await amico.follow_many(1, range(10, 20))
+        await amico.block(1, 20)
+
+        await amico.clear(1, chunk_size=3)
+
+        (await amico.following_count(1)).should.equal(0)
+        (await amico.followers_count(10)).should.equal(0)
+        (await amico.blocked_by_count(20)).should.equal(0)
+
+    async def test_it_should_store_set_scopes_in_redis_sets(self):
+        amico = AsyncAmico(
+            {'set_scopes': ['friends']}, redis_connection=self.redis_connection)
+        await amico.follow_many(1, [12, 11], 'friends')
+        await amico.follow(11, 1, 'friends')
+
+        (await self.redis_connection.type(
+            'amico:following:friends:1')).should.equal('set')
+        (await amico.is_reciprocated(1, 11, 'friends')).should.be.true
+        (await amico.following_count(1, 'friends')).should.equal(2)
+        (await amico.following(1, scope='friends')).should.equal(['11', '12'])
+
+        await amico.clear(1, 'friends')
+        (await amico.followers_count(11, 'friends')).should.equal(0)
+
+    async def test_it_should_raise_an_exception_for_an_invalid_relationship_type(
+            self):
+        amico = AsyncAmico(redis_connection=self.redis_connection)
+        with self.assertRaises(Exception):
+            await amico.count(1, 'unknown')
+
+    async def test_it_should_not_support_cursor_paging(self):
+        amico = AsyncAmico(redis_connection=self.redis_connection)
+        await amico.follow(1, 11)
+        with self.assertRaisesRegex(Exception, 'cursor paging'):
+            await amico.following(1, {'page_size': 25, 'cursor': None})
@@ -0,0 +1,53 @@
+import unittest
+import sure
+
+from amico.cache import RelationshipCache
+
+
+class RelationshipCacheTest(unittest.TestCase):
+
+    def test_it_should_evict_the_least_recently_used_values(self):
+        cache = RelationshipCache(2)
+        cache.set('a', '1', True, cache.token())
+        cache.set('a', '2', False, cache.token())
+        cache.get('a', '1').should.equal((True, True))
+        cache.set('b', None, 3, cache.token())
+
+        len(cache).should.equal(2)
+        cache.get('a', '1').should.equal((True, True))
+        cache.get('a', '2').should.equal((False, None))
+        cache.get('b', None).should.equal((True, 3))
+
+    def test_it_should_invalidate_every_value_read_from_a_key(self):
+        cache = RelationshipCache(10)
+        cache.set('a', '1', True, cache.token())
+        cache.set('a', None, 1, cache.token())
+        cache.set('b', '1', True, cache.token())
+
+        cache.invalidate(['a'])
+        cache.get('a', '1').should.equal((False, None))
+        cache.get('a', None).should.equal((False, None))
+        cache.get('b', '1').should.equal((True, True))
+
+        cache.clear()
+        len(cache).should.equal(0)
+
+    def test_it_should_not_store_values_read_before_an_invalidation(self):
+        cache = RelationshipCache(2)
+        token = cache.token()
+        cache.invalidate(['a'])
+        cache.set('a', '1', True, token)
+        cache.get('a', '1').should.equal((False, None))
+
+        cache.set('b', '1', True, token)
+        cache.get('b', '1').should.equal((True, True))
+
+        token = cache.token()
+        cache.invalidate(['c', 'd', 'e'])
+        cache.set('b', '2', True, token)
+        cache.get('b', '2').should.equal((False, None))
+
+        token = cache.token()
+        cache.clear()
+        cache.set('b', '1', True, token)
+        cache.get('b', '1').should.equal((False, None))
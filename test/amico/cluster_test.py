@@ -0,0 +1,93 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import sure
+
+import redis
+from redis.exceptions import RedisClusterException
+from amico import Amico
+from amico.cluster import SlotPipeline, hash_slot, supports_transactions
+
+
+class NonTransactionalClient(redis.StrictRedis):
+    '''
+    Client refusing transactional pipelines like RedisCluster before redis-py 6.1.0.
+    '''
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        if transaction:
+            raise RedisClusterException('transaction is deprecated in cluster mode')
+        return super(NonTransactionalClient, self).pipeline(False, shard_hint)
+
+
+class SlotPipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.redis_connection = redis.StrictRedis(
+            host='localhost',
+            port=6379,
+            db=15,
+            decode_responses=True)
+        self.executor = ThreadPoolExecutor(2)
+
+    def tearDown(self):
+        self.executor.shutdown()
+        self.redis_connection.flushdb()
+
+    def test_it_should_compute_hash_slots_from_hash_tags(self):
+        hash_slot('amico:following:default:{1}').should.equal(
+            hash_slot('amico:followers:default:{1}'))
+        hash_slot('amico:following:default:{1}').should_not.equal(
+            hash_slot('amico:following:default:{2}'))
+
+    def test_it_should_return_the_results_in_the_order_the_commands_were_queued(self):
+        pipeline = SlotPipeline(self.redis_connection, self.executor)
+        pipeline.sadd('{1}a', 3, 1, 2)
+        pipeline.sadd('{2}a', 4)
+        pipeline.scard('{1}a')
+        pipeline.sort('{1}a', start=0, num=2)
+        pipeline.scard('{2}a')
+        len(pipeline).should.equal(5)
+
+        pipeline.execute().should.equal([3, 1, 3, ['1', '2'], 1])
+        len(pipeline).should.equal(0)
+
+    def test_amico_should_tag_keys_and_split_pipelines_in_cluster_mode(self):
+        amico = Amico({'cluster': True}, redis_connection=self.redis_connection)
+        amico.options['use_scripts'].should.be.false
+        amico.follow_many(1, [11, 12])
+        amico.follow(11, 1)
+        amico.block(1, 12)
+
+        sorted(self.redis_connection.keys('amico:*')).should.equal([
+            'amico:blocked:default:{1}',
+            'amico:blocked_by:default:{12}',
+            'amico:followers:default:{11}',
+            'amico:followers:default:{1}',
+            'amico:following:default:{11}',
+            'amico:following:default:{1}',
+            'amico:reciprocated:default:{11}',
+            'amico:reciprocated:default:{1}'])
+        amico.following(1).should.equal(['11'])
+        amico.reciprocated_count(1).should.equal(1)
+        amico.key_schema.parse('amico:following:default:{1}').should.equal(
+            ('following', 'default', '1'))
+        amico.common_following.when.called_with(1, 11).should.throw(Exception)
+        amico.close()
+
+        Amico.when.called_with(
+            {'cluster': True, 'legacy_keys': {}},
+            redis_connection=self.redis_connection).should.throw(Exception)
+
+    def test_amico_should_not_use_transactions_if_the_cluster_client_rejects_them(self):
+        supports_transactions(self.redis_connection).should.be.true
+        redis_connection = NonTransactionalClient(
+            host='localhost', port=6379, db=15, decode_responses=True)
+        supports_transactions(redis_connection).should.be.false
+
+        amico = Amico({'cluster': True}, redis_connection=redis_connection)
+        amico.follow(1, 11)
+        amico.follow(11, 1)
+        amico.block(1, 12)
+        amico.is_reciprocated(1, 11).should.be.true
+        amico.is_blocked(1, 12).should.be.true
+        amico.close()
@@ -0,0 +1,133 @@
+import os
+import pickle
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+from array import array
+import sure
+
+from amico import Amico
+from amico.embedded import EmbeddedRedis
+from amico.memory import MemoryRedis
+from test.amico import memory_test
+
+
+class EmbeddedAmicoTest(memory_test.MemoryAmicoTest):
+    '''
+    Runs the Amico tests against the embedded array-backed store.
+    '''
+
+    def setUp(self):
+        self.redis_connection = EmbeddedRedis(decode_responses=True)
+
+
+class OpenFile(object):
+
+    def __init__(self, path):
+        self.path = path
+
+    def __reduce__(self):
+        return (open, (self.path, 'w'))
+
+
+class EmbeddedRedisTest(unittest.TestCase):
+
+    def setUp(self):
+        self.redis_connection = EmbeddedRedis(decode_responses=True)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_it_should_order_members_like_redis(self):
+        self.redis_connection.zadd('z', {'b': 2, 'a': 2, 'c': 1, 'd': 3})
+        self.redis_connection.zrange('z', 0, -1).should.equal(['c', 'a', 'b', 'd'])
+        self.redis_connection.zrevrank('z', 'c').should.equal(3)
+        self.redis_connection.zrevrangebyscore('z', '(3', '-inf', start=1, num=5).should.equal(
+            ['a', 'c'])
+
+        self.redis_connection.zadd('z', {'c': 4, 'e': 2})
+        self.redis_connection.zrevrange('z', 0, -1, withscores=True).should.equal(
+            [('c', 4.0), ('d', 3.0), ('e', 2.0), ('b', 2.0), ('a', 2.0)])
+        self.redis_connection.zrem('z', 'b', 'x').should.equal(1)
+        self.redis_connection.zscore('z', 'b').should.be.none
+        self.redis_connection.zcard('z').should.equal(4)
+
+    def test_it_should_save_and_load_snapshots(self):
+        amico = Amico(
+            {'pending_follow': True, 'set_scopes': ['friends']},
+            redis_connection=self.redis_connection)
+        amico.follow(1, 11)
+        amico.follow(11, 1)
+        amico.accept(1, 11)
+        amico.accept(11, 1)
+        amico.follow(1, 12)
+        amico.block(13, 1)
+        amico.follow(1, 14, scope='friends')
+        amico.accept(1, 14, scope='friends')
+        amico.follow(1, 99)
+        amico.unfollow(1, 99)
+        path = os.path.join(self.directory, 'amico.snapshot')
+        self.redis_connection.save(path)
+
+        redis_connection = EmbeddedRedis.load(path, decode_responses=True)
+        amico = Amico(
+            {'pending_follow': True, 'set_scopes': ['friends']},
+            redis_connection=redis_connection)
+        amico.following(1).should.equal(['11'])
+        amico.is_reciprocated(1, 11).should.be.true
+        amico.pending_with(1).should.equal(['12'])
+        amico.is_blocked_by(1, 13).should.be.true
+        amico.is_following(1, 14, 'friends').should.be.true
+        redis_connection.keys().should.equal(self.redis_connection.keys())
+        redis_connection.table.find('99').should.be.none
+
+        amico.follow(1, 15)
+        amico.accept(1, 15)
+        amico.following(1).should.equal(['15', '11'])
+
+    def test_it_should_not_load_other_snapshot_versions(self):
+        path = os.path.join(self.directory, 'amico.snapshot')
+        self.redis_connection.save(path)
+        EmbeddedRedis.SNAPSHOT_VERSION = 2
+        try:
+            EmbeddedRedis.load.when.called_with(path).should.throw(Exception)
+        finally:
+            EmbeddedRedis.SNAPSHOT_VERSION = 1
+
+    def test_it_should_not_run_code_from_snapshots(self):
+        path = os.path.join(self.directory, 'amico.snapshot')
+        marker = os.path.join(self.directory, 'marker')
+        with open(path, 'wb') as snapshot_file:
+            pickle.dump(OpenFile(marker), snapshot_file)
+        EmbeddedRedis.load.when.called_with(path).should.throw(Exception, 'Invalid snapshot')
+        os.path.exists(marker).should.be.false
+
+        self.redis_connection.zadd('z', {'a': 1, 'b': 2})
+        self.redis_connection.save(path)
+        with open(path, 'rb') as snapshot_file:
+            data = snapshot_file.read()
+        with open(path, 'wb') as snapshot_file:
+            snapshot_file.write(data[:-8])
+        EmbeddedRedis.load.when.called_with(path).should.throw(Exception, 'Truncated snapshot')
+
+        # Replace the first ranked ID (the third array) with IDs out of the intern table.
+        header, arrays = data.split(b'\n', 1)
+        for id in [2, -1]:
+            ranked = array('q', [id]).tobytes()
+            with open(path, 'wb') as snapshot_file:
+                snapshot_file.write(header + b'\n' + arrays[:32] + ranked + arrays[40:])
+            EmbeddedRedis.load.when.called_with(path).should.throw(
+                Exception, 'Invalid snapshot')
+
+    def test_it_should_use_a_fraction_of_the_memory_of_the_in_memory_backend(self):
+        sizes = []
+        for redis_connection in [MemoryRedis(), EmbeddedRedis()]:
+            amico = Amico(redis_connection=redis_connection)
+            tracemalloc.start()
+            for id in range(1, 101):
+                amico.follow_many(id, list(range(1, 101)))
+            sizes.append(tracemalloc.get_traced_memory()[0])
+            tracemalloc.stop()
+        sizes[1].should.be.lower_than(sizes[0] / 3)
@@ -0,0 +1,169 @@
+import logging
+import socket
+import unittest
+import sure
+
+import redis
+from amico import Amico, AsyncAmico
+from amico.instrumentation import (
+    HistogramInstrumentation, Instrumentation, LoggingInstrumentation,
+    StatsdInstrumentation)
+
+
+class RecordingInstrumentation(Instrumentation):
+
+    def __init__(self):
+        self.events = []
+
+    def before(self, call):
+        self.events.append(('before', call.method))
+
+    def after(self, call):
+        self.events.append(('after', call.method, call.commands, call.pipelines,
+                            call.round_trips, call.error is not None))
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class InstrumentationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.redis_connection = redis.StrictRedis(
+            host='localhost',
+            port=6379,
+            db=15,
+            decode_responses=True)
+
+    def tearDown(self):
+        self.redis_connection.flushdb()
+
+    def test_it_should_not_wrap_methods_without_instrumentation(self):
+        amico = Amico(redis_connection=self.redis_connection)
+        amico.__dict__.should_not.contain('follow')
+        amico.redis_connection.should.equal(self.redis_connection)
+
+    def test_it_should_call_the_hooks_around_public_methods(self):
+        instrumentation = RecordingInstrumentation()
+        amico = Amico({'instrumentation': instrumentation}, self.redis_connection)
+        amico.follow(1, 11)
+        amico.is_following(1, 11).should.be.true
+
+        instrumentation.events.should.equal([
+            ('before', 'follow'), ('after', 'follow', 1, 0, 1, False),
+            ('before', 'is_following'), ('after', 'is_following', 1, 0, 1, False)])
+
+    def test_it_should_count_pipelined_commands(self):
+        instrumentation = RecordingInstrumentation()
+        amico = Amico(
+            {'instrumentation': instrumentation, 'use_scripts': False},
+            self.redis_connection)
+        amico.follow(1, 11)
+        amico.followers(11).should.equal(['1'])
+
+        after = [event for event in instrumentation.events if event[0] == 'after']
+        after[1].should.equal(('after', 'followers', 2, 1, 1, False))
+
+    def test_it_should_count_nested_calls_as_part_of_the_outer_call(self):
+        instrumentation = RecordingInstrumentation()
+        amico = Amico({'instrumentation': instrumentation}, self.redis_connection)
+        amico.follow(1, 11)
+        del instrumentation.events[:]
+        amico.clear(1)
+
+        [event[:2] for event in instrumentation.events].should.equal(
+            [('before', 'clear'), ('after', 'clear')])
+        instrumentation.events[1][2].should.be.greater_than(0)
+
+    def test_it_should_record_errors(self):
+        instrumentation = RecordingInstrumentation()
+        amico = Amico({'instrumentation': instrumentation}, self.redis_connection)
+        amico.redis_connection.redis_connection = redis.StrictRedis(port=1)
+        amico.follow.when.called_with(1, 11).should.throw(redis.exceptions.ConnectionError)
+
+        instrumentation.events[-1][5].should.be.true
+
+    def test_it_should_measure_generators_until_exhausted(self):
+        instrumentation = RecordingInstrumentation()
+        amico = Amico({'instrumentation': instrumentation}, self.redis_connection)
+        amico.follow_many(1, list(range(2, 7)))
+        del instrumentation.events[:]
+
+        iterator = amico.iter_all(1, 'following', chunk_size=2)
+        instrumentation.events.should.equal([('before', 'iter_all')])
+        len(list(iterator)).should.equal(5)
+        instrumentation.events[-1][:2].should.equal(('after', 'iter_all'))
+        instrumentation.events[-1][4].should.equal(3)
+
+    def test_it_should_keep_a_histogram_per_method(self):
+        histogram = HistogramInstrumentation()
+        amico = Amico({'instrumentation': histogram}, self.redis_connection)
+        for id in range(10):
+            amico.follow(1, id + 10)
+        amico.following_count(1).should.equal(10)
+
+        histogram.methods().should.equal(['follow', 'following_count'])
+        stats = histogram.stats('follow')
+        stats['calls'].should.equal(10)
+        stats['commands'].should.equal(10)
+        stats['round_trips'].should.equal(10)
+        sum(stats['histogram']).should.equal(10)
+        histogram.percentile('follow', 0.99).should.be.greater_than(0)
+        histogram.stats('following_count')['reply_bytes'].should.equal(2)
+
+        histogram.reset()
+        histogram.stats('follow').should.be.none
+
+    def test_it_should_log_calls(self):
+        handler = RecordingHandler()
+        logger = logging.getLogger('amico.test')
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        amico = Amico(
+            {'instrumentation': LoggingInstrumentation(logger)}, self.redis_connection)
+        amico.follow(1, 11)
+        logger.removeHandler(handler)
+
+        len(handler.records).should.equal(1)
+        handler.records[0].levelno.should.equal(logging.DEBUG)
+        handler.records[0].getMessage().should.contain('amico follow took')
+
+    def test_it_should_send_statsd_metrics(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.settimeout(5)
+        statsd = StatsdInstrumentation('127.0.0.1', listener.getsockname()[1], 'app')
+        amico = Amico({'instrumentation': statsd}, self.redis_connection)
+        amico.follow(1, 11)
+
+        lines = listener.recv(65536).decode('utf-8').split('\n')
+        statsd.close()
+        listener.close()
+        lines[0].should.match(r'^app\.follow\.duration:[0-9.]+\|ms$')
+        lines[1:5].should.equal([
+            'app.follow.calls:1|c', 'app.follow.commands:1|c',
+            'app.follow.pipelines:0|c', 'app.follow.round_trips:1|c'])
+        lines[5].should.match(r'^app\.follow\.reply_bytes:[0-9]+\|c$')
+
+    def test_it_should_instrument_each_node_when_sharding(self):
+        histogram = HistogramInstrumentation()
+        amico = Amico(
+            {'instrumentation': histogram},
+            [redis.StrictRedis(port=6379, db=db, decode_responses=True) for db in [14, 15]])
+        amico.follow(1, 11)
+        amico.close()
+
+        histogram.stats('follow')['pipelines'].should.be.greater_than(0)
+        for db in [14, 15]:
+            redis.StrictRedis(port=6379, db=db).flushdb()
+
+    def test_async_amico_should_not_support_instrumentation(self):
+        AsyncAmico.when.called_with(
+            {'instrumentation': Instrumentation()}).should.throw(Exception)
@@ -0,0 +1,135 @@
+import time
+import unittest
+import sure
+
+import redis
+from amico import Amico, AsyncAmico
+from amico.memory import MemoryRedis
+from test.amico import amico_test
+
+
+class MemoryAmicoTest(amico_test.AmicoTest):
+    '''
+    Runs the Amico tests against the in-memory backend.
+    '''
+
+    def setUp(self):
+        self.redis_connection = MemoryRedis(decode_responses=True)
+
+    @unittest.skip('the in-memory backend does not run scripts')
+    def test_it_should_reload_scripts_if_they_are_flushed_from_redis(self):
+        pass
+
+    @unittest.skip('the in-memory backend has no object encodings')
+    def test_it_should_store_set_scopes_in_redis_sets(self):
+        pass
+
+    @unittest.skip('the in-memory backend does not support the cache_size option')
+    def test_it_should_cache_predicates_and_counts(self):
+        pass
+
+    @unittest.skip('the test uses its own Redis connection pool')
+    def test_it_should_map_read_methods_over_ids_on_a_thread_pool(self):
+        pass
+
+
+class MemoryRedisTest(unittest.TestCase):
+
+    def setUp(self):
+        self.redis_connection = MemoryRedis(decode_responses=True)
+
+    def test_it_should_count_commands_and_round_trips(self):
+        amico = Amico(redis_connection=self.redis_connection)
+        amico.follow(1, 11)
+        self.redis_connection.commands = 0
+        self.redis_connection.round_trips = 0
+
+        amico.following(1).should.equal(['11'])
+        self.redis_connection.commands.should.equal(2)
+        self.redis_connection.round_trips.should.equal(1)
+        amico.is_following(1, 11).should.be.true
+        self.redis_connection.round_trips.should.equal(2)
+
+    def test_it_should_order_members_like_redis(self):
+        self.redis_connection.zadd('z', {'b': 2, 'a': 2, 'c': 1, 'd': 3})
+        self.redis_connection.zrange('z', 0, -1).should.equal(['c', 'a', 'b', 'd'])
+        self.redis_connection.zrevrange('z', 1, 2, withscores=True).should.equal(
+            [('b', 2.0), ('a', 2.0)])
+        self.redis_connection.zrevrank('z', 'c').should.equal(3)
+        self.redis_connection.zrevrangebyscore('z', '(3', '-inf', start=1, num=5).should.equal(
+            ['a', 'c'])
+        self.redis_connection.zrangebyscore('z', 2, 2).should.equal(['a', 'b'])
+
+        self.redis_connection.zadd('z', {'c': 4})
+        self.redis_connection.zrevrange('z', 0, 0).should.equal(['c'])
+        self.redis_connection.zrem('z', 'a', 'b', 'c', 'd').should.equal(4)
+        self.redis_connection.exists('z').should.equal(0)
+
+    def test_it_should_combine_sorted_sets_and_sets(self):
+        self.redis_connection.zadd('a', {'1': 1, '2': 2, '3': 3})
+        self.redis_connection.zadd('b', {'2': 5, '3': 1})
+        self.redis_connection.sadd('s', 3, 4)
+
+        self.redis_connection.zinterstore('i', {'a': 1, 'b': 0}).should.equal(2)
+        self.redis_connection.zrange('i', 0, -1, withscores=True).should.equal(
+            [('2', 2.0), ('3', 3.0)])
+        self.redis_connection.zunionstore('u', ['a', 'b'], aggregate='MAX').should.equal(3)
+        self.redis_connection.zscore('u', '2').should.equal(5.0)
+        self.redis_connection.zintercard(3, ['a', 'b', 's']).should.equal(1)
+        self.redis_connection.sunionstore('su', ['s', 'missing']).should.equal(2)
+        self.redis_connection.sort('su', start=0, num=1).should.equal(['3'])
+        self.redis_connection.zinterstore('i', ['a', 'missing']).should.equal(0)
+        self.redis_connection.exists('i').should.equal(0)
+
+    def test_it_should_apply_pipelines_and_raise_the_first_error(self):
+        self.redis_connection.sadd('s', 1)
+        pipeline = self.redis_connection.pipeline()
+        pipeline.zadd('z', {'a': 1}).zcard('s').zcard('z')
+        pipeline.execute.when.called_with().should.throw(
+            redis.exceptions.ResponseError, 'WRONGTYPE')
+        self.redis_connection.zcard('z').should.equal(1)
+
+        pipeline.zcard('s').zcard('z')
+        results = pipeline.execute(raise_on_error=False)
+        results[0].should.be.a(redis.exceptions.ResponseError)
+        results[1].should.equal(1)
+
+    def test_it_should_scan_every_key_while_keys_change(self):
+        for id in range(100):
+            self.redis_connection.sadd('key:%d' % id, id)
+
+        seen = set()
+        cursor = 0
+        while True:
+            cursor, keys = self.redis_connection.scan(cursor, match='key:*', count=7)
+            for key in keys:
+                seen.add(key)
+                self.redis_connection.rename(key, 'moved:%s' % key)
+            if cursor == 0:
+                break
+        len(seen).should.equal(100)
+
+    def test_it_should_expire_and_restore_keys(self):
+        self.redis_connection.zadd('z', {'a': 1})
+        dump = self.redis_connection.dump('z')
+        self.redis_connection.expire('z', 0.01)
+        time.sleep(0.02)
+        self.redis_connection.exists('z').should.equal(0)
+
+        self.redis_connection.restore('z', 0, dump)
+        self.redis_connection.zscore('z', 'a').should.equal(1.0)
+        self.redis_connection.restore.when.called_with('z', 0, dump).should.throw(
+            redis.exceptions.ResponseError)
+        self.redis_connection.restore.when.called_with(
+            'x', 0, b'\x80\x04N.').should.throw(redis.exceptions.ResponseError)
+
+    def test_it_should_reply_with_bytes_unless_decoding(self):
+        redis_connection = MemoryRedis()
+        redis_connection.zadd('z', {'a': 1})
+        redis_connection.zrange('z', 0, -1).should.equal([b'a'])
+        redis_connection.keys().should.equal([b'z'])
+
+    def test_it_should_not_support_the_cache_or_async_amico(self):
+        Amico.when.called_with(
+            {'cache_size': 10}, self.redis_connection).should.throw(Exception)
+        AsyncAmico.when.called_with({}, self.redis_connection).should.throw(Exception)
@@ -0,0 +1,75 @@
+import unittest
+import sure
+
+import redis
+from amico import Amico
+from amico.sharding import HashRing
+
+
+class ShardingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.redis_connections = [
+            redis.StrictRedis(
+                host='localhost',
+                port=6379,
+                db=db,
+                decode_responses=True) for db in [13, 14, 15]]
+
+    def tearDown(self):
+        for redis_connection in self.redis_connections:
+            redis_connection.flushdb()
+
+    def test_it_should_only_move_values_to_an_added_node(self):
+        ring = HashRing(['a', 'b'])
+        grown_ring = HashRing(['b', 'a', 'c'])
+        nodes = ['a', 'b']
+        grown_nodes = ['b', 'a', 'c']
+
+        moved = 0
+        for value in map(str, range(1000)):
+            node = nodes[ring.node_index(value)]
+            grown_node = grown_nodes[grown_ring.node_index(value)]
+            if grown_node != node:
+                grown_node.should.equal('c')
+                moved += 1
+        moved.should.be.greater_than(200)
+        moved.should.be.lower_than(500)
+
+    def test_it_should_shard_relationships_by_individual(self):
+        amico = Amico(redis_connection=self.redis_connections[:2])
+        amico.follow_many(1, list(range(10, 30)))
+        amico.follow(11, 1)
+        amico.block(1, 12)
+
+        for redis_connection in self.redis_connections[:2]:
+            redis_connection.dbsize().should.be.greater_than(0)
+        self.redis_connections[0].exists('amico:following:default:{1}').should_not.equal(
+            self.redis_connections[1].exists('amico:following:default:{1}'))
+        amico.following_count(1).should.equal(19)
+        amico.is_reciprocated(1, 11).should.be.true
+        amico.reciprocated(1).should.equal(['11'])
+        amico.is_blocked_by(12, 1).should.be.true
+        amico.counts([1], ['following', 'blocked'])[1].should.equal(
+            {'following': 19, 'blocked': 1})
+        amico.close()
+
+    def test_it_should_move_relationships_when_resharding(self):
+        amico = Amico(redis_connection=self.redis_connections[:2])
+        amico.follow_many(1, list(range(10, 30)))
+        amico.close()
+
+        amico = Amico(redis_connection=self.redis_connections)
+        moved = amico.reshard()
+        moved.should.be.greater_than(0)
+        self.redis_connections[2].dbsize().should.equal(moved)
+        amico.reshard().should.equal(0)
+        amico.following_count(1).should.equal(20)
+        [amico.is_follower(id, 1) for id in range(10, 30)].should.equal([True] * 20)
+        amico.close()
+
+        amico = Amico(redis_connection=self.redis_connections[1:])
+        amico.reshard(self.redis_connections)
+        self.redis_connections[0].dbsize().should.equal(0)
+        amico.following_count(1).should.equal(20)
+        amico.close()